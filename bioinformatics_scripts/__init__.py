@@ -1,5 +1,75 @@
-from .script1 import function1
-from .script2 import function2
-from .script3 import function3
+"""
+Assorted bioinformatics scripts.
 
-__all__ = ['function1', 'function2', 'function3']
\ No newline at end of file
+Submodules are imported on first use, so importing the package (or running
+one subcommand of the bioinformatics-scripts command) does not import every
+script and its dependencies. Public functions are available from the package,
+e.g. bioinformatics_scripts.read_clusters. The unique_gene_pairs and
+lethal_gene_pairs functions share their module's name, so at package level
+those names are the modules.
+"""
+import importlib
+
+_SUBMODULES = (
+    'benchmarks',
+    'blast_results_parser',
+    'cli',
+    'cluster_pathway_analysis',
+    'hpcc_blast_job_submission',
+    'lethal_gene_pairs',
+    'unique_gene_pairs',
+)
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    'GeneTable': 'cluster_pathway_analysis',
+    'read_clusters': 'cluster_pathway_analysis',
+    'read_pathways': 'cluster_pathway_analysis',
+    'cached_read': 'cluster_pathway_analysis',
+    'pathway_cluster_counts': 'cluster_pathway_analysis',
+    'incremental_pathway_cluster_counts': 'cluster_pathway_analysis',
+    'hypergeometric_pvalues': 'cluster_pathway_analysis',
+    'benjamini_hochberg': 'cluster_pathway_analysis',
+    'permutation_pvalues': 'cluster_pathway_analysis',
+    'write_pathway_counts': 'cluster_pathway_analysis',
+    'cluster_pathway_comparisons': 'cluster_pathway_analysis',
+    'PairStore': 'unique_gene_pairs',
+    'write_pair_store': 'unique_gene_pairs',
+    'MalformedLineError': 'lethal_gene_pairs',
+    'lethal_gene_pair_bins': 'lethal_gene_pairs',
+    'SequenceIds': 'blast_results_parser',
+    'BlastHits': 'blast_results_parser',
+    'read_blast_tabular': 'blast_results_parser',
+    'qualifying_mask': 'blast_results_parser',
+    'fasta_lengths': 'blast_results_parser',
+    'filter_blast_results': 'blast_results_parser',
+    'qualifying_match_counter': 'blast_results_parser',
+    'best_hits': 'blast_results_parser',
+    'reciprocal_best_hits': 'blast_results_parser',
+    'merge_blast_shards': 'blast_results_parser',
+    'generate_slurm_script': 'hpcc_blast_job_submission',
+    'generate_slurm_array_script': 'hpcc_blast_job_submission',
+    'shard_fasta': 'hpcc_blast_job_submission',
+    'ShardManifest': 'hpcc_blast_job_submission',
+    'submit_blast_shards': 'hpcc_blast_job_submission',
+    'submit_slurm_job': 'hpcc_blast_job_submission',
+    'SlurmExecutor': 'hpcc_blast_job_submission',
+    'LocalExecutor': 'hpcc_blast_job_submission',
+    'Pipeline': 'hpcc_blast_job_submission',
+    'JobHistory': 'hpcc_blast_job_submission',
+    'parse_job_log': 'hpcc_blast_job_submission',
+}
+
+__all__ = sorted(_EXPORTS) + list(_SUBMODULES)
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,485 @@
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+TOTAL_GENES = 27680  # Total number of genes in Arabidopsis thaliana
+# Approximate gene counts per chromosome (1-5), chloroplast (C) and mitochondrion (M),
+# used to spread the generated AGI identifiers like the real genome.
+CHROMOSOME_GENES = (('1', 7070), ('2', 4218), ('3', 5437), ('4', 4124), ('5', 6532), ('C', 88), ('M', 117))
+AMINO_ACIDS = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+RESULTS_VERSION = 1
+
+# Input sizes of each benchmark tier. 'large' is genome scale: every Arabidopsis
+# gene clustered, searched and paired.
+TIERS = {
+    'small': {'genes': 2000, 'clusters': 40, 'pathways': 100, 'pairs': 20000,
+              'queries': 500, 'subjects': 500, 'hits_per_query': 10, 'shards': 3},
+    'medium': {'genes': TOTAL_GENES, 'clusters': 300, 'pathways': 600, 'pairs': 500000,
+               'queries': 5000, 'subjects': 5000, 'hits_per_query': 25, 'shards': 4},
+    'large': {'genes': TOTAL_GENES, 'clusters': 1500, 'pathways': 2500, 'pairs': 5000000,
+              'queries': TOTAL_GENES, 'subjects': TOTAL_GENES, 'hits_per_query': 50, 'shards': 8},
+}
+
+def _module(name):
+    """
+    Import a sibling module by name, inside the package or from a scripts checkout.
+    """
+    return importlib.import_module(f'{__package__}.{name}' if __package__ else name)
+
+def agi_gene_ids(n_genes=TOTAL_GENES):
+    """
+    Return n_genes AGI locus identifiers (AT1G01010, ..., ATCG00010, ATMG00010).
+
+    Identifiers are spread over the chromosomes and organelles in proportion
+    to their gene counts and numbered in steps of 10 like the real loci.
+
+    Args:
+        n_genes (int): Number of identifiers.
+
+    Returns:
+        list: The identifiers, in chromosome order.
+    """
+    total = sum(count for _, count in CHROMOSOME_GENES)
+    counts = [count * n_genes // total for _, count in CHROMOSOME_GENES]
+    counts[0] += n_genes - sum(counts)
+    genes = []
+    for (chromosome, _), count in zip(CHROMOSOME_GENES, counts):
+        start = 1010 if chromosome.isdigit() else 10
+        genes.extend(f"AT{chromosome}G{start + 10 * i:05d}" for i in range(count))
+    return genes
+
+def _popularity(rng, n, exponent):
+    """
+    Return Zipf-like sampling weights over n items in random order, so a few items are hubs.
+    """
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+def _skewed_sizes(rng, n, median, sigma, low, high):
+    """
+    Return n lognormal sizes: mostly near the median with a long tail of large sets.
+    """
+    return np.clip(np.rint(rng.lognormal(np.log(median), sigma, n)), low, high).astype(np.int64)
+
+def write_clusters(path, n_clusters, n_genes=TOTAL_GENES, seed=0):
+    """
+    Write a synthetic clusters file (cluster ID, comma-separated genes) for read_clusters.
+
+    Clusters partition a random subset of the genes, with lognormal sizes so
+    that most clusters are small and a few are very large, as in co-expression
+    clustering.
+
+    Args:
+        path (str): Output file.
+        n_clusters (int): Number of clusters.
+        n_genes (int): Size of the gene universe.
+        seed (int): Random seed.
+
+    Returns:
+        int: Number of clusters written.
+    """
+    rng = np.random.default_rng(seed)
+    genes = np.array(agi_gene_ids(n_genes))[rng.permutation(n_genes)]
+    sizes = _skewed_sizes(rng, n_clusters, max(n_genes // (2 * n_clusters), 2), 1.0, 2, n_genes)
+    # Scale down if the clusters would need more genes than there are
+    if sizes.sum() > n_genes:
+        sizes = np.maximum(sizes * n_genes // sizes.sum(), 1)
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+    with open(path, 'w') as f:
+        f.write("cluster\tgenes\n")
+        f.write(''.join(f"Cluster{i + 1}\t{','.join(genes[start:end])}\n"
+                        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))))
+    return n_clusters
+
+def write_pathways(path, n_pathways, n_genes=TOTAL_GENES, seed=0):
+    """
+    Write a synthetic pathways file (pathway name, pathway ID, gene name, gene ID) for read_pathways.
+
+    Pathway sizes are lognormal and genes are drawn with Zipf-like popularity,
+    so a few genes belong to many pathways. Gene IDs carry transcript version
+    suffixes, some genes are listed with two versions, and about 2% of the
+    rows name a non-Arabidopsis gene, which the reader skips.
+
+    Args:
+        path (str): Output file.
+        n_pathways (int): Number of pathways.
+        n_genes (int): Size of the gene universe.
+        seed (int): Random seed.
+
+    Returns:
+        int: Number of rows written.
+    """
+    rng = np.random.default_rng(seed)
+    genes = np.array(agi_gene_ids(n_genes))
+    weights = _popularity(rng, n_genes, 0.8)
+    sizes = _skewed_sizes(rng, n_pathways, 12, 1.0, 2, min(n_genes, 1000))
+    rows = []
+    for i, size in enumerate(sizes.tolist()):
+        members = rng.choice(n_genes, size, replace=False, p=weights)
+        versions = np.where(rng.random(size) < 0.1, 2, 1)
+        foreign = rng.random(size) < 0.02
+        for gene, version, is_foreign in zip(members.tolist(), versions.tolist(), foreign.tolist()):
+            gene_id = f"Os01g{gene:07d}" if is_foreign else genes[gene]
+            for v in range(1, version + 1):
+                rows.append(f"Pathway {i + 1}\tPWY-{i + 1:05d}\tGENE{gene}.{v}\t{gene_id}.{v}\n")
+    with open(path, 'w') as f:
+        f.write("pathway\tpathway_id\tgene_name\tgene_id\n")
+        f.write(''.join(rows))
+    return len(rows)
+
+def write_gene_pairs(path, n_pairs, n_genes=TOTAL_GENES, seed=0, hub_exponent=1.1, duplicate_fraction=0.2):
+    """
+    Write a synthetic gene1\tgene2\tlethality file for unique_gene_pairs and lethal_gene_pairs.
+
+    Both genes of a pair are drawn with Zipf-like popularity, so a few hub
+    genes take part in a large share of the pairs. A fraction of the lines
+    repeat an earlier pair, half of them in reverse orientation.
+
+    Args:
+        path (str): Output file.
+        n_pairs (int): Number of lines.
+        n_genes (int): Size of the gene universe.
+        seed (int): Random seed.
+        hub_exponent (float): Exponent of the gene popularity; larger values give heavier hubs.
+        duplicate_fraction (float): Fraction of lines that repeat an earlier pair.
+
+    Returns:
+        int: Number of lines written.
+    """
+    rng = np.random.default_rng(seed)
+    genes = np.array(agi_gene_ids(n_genes))
+    weights = _popularity(rng, n_genes, hub_exponent)
+    gene1 = rng.choice(n_genes, n_pairs, p=weights)
+    gene2 = rng.choice(n_genes, n_pairs, p=weights)
+
+    repeats = np.flatnonzero(rng.random(n_pairs) < duplicate_fraction)
+    repeats = repeats[repeats > 0]
+    sources = (rng.random(len(repeats)) * repeats).astype(np.int64)
+    gene1[repeats], gene2[repeats] = gene1[sources], gene2[sources]
+    reversed_ = repeats[rng.random(len(repeats)) < 0.5]
+    gene1[reversed_], gene2[reversed_] = gene2[reversed_], gene1[reversed_]
+
+    lethality = rng.beta(0.5, 2.0, n_pairs)
+    with open(path, 'w') as f:
+        for start in range(0, n_pairs, 1 << 16):
+            end = min(start + (1 << 16), n_pairs)
+            f.write(''.join(f"{a}\t{b}\t{value:.4f}\n" for a, b, value in
+                            zip(genes[gene1[start:end]], genes[gene2[start:end]], lethality[start:end].tolist())))
+    return n_pairs
+
+def write_fasta(path, ids, seed=0, median_length=350):
+    """
+    Write random protein sequences with lognormal lengths, 60 residues per line.
+
+    Returns:
+        dict: Sequence length keyed to ID.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = _skewed_sizes(rng, len(ids), median_length, 0.6, 30, 10000)
+    with open(path, 'w') as f:
+        for seq_id, length in zip(ids, lengths.tolist()):
+            sequence = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), length)].tobytes().decode()
+            f.write(f">{seq_id}\n" + ''.join(sequence[i:i + 60] + '\n' for i in range(0, length, 60)))
+    return dict(zip(ids, lengths.tolist()))
+
+def write_blast_table(path, queries, subjects, hits_per_query, seed=0):
+    """
+    Write a synthetic BLAST -outfmt 6 table with queries in order and hits sorted by bitscore.
+
+    The number of hits per query is geometric around hits_per_query, subjects
+    are drawn with Zipf-like popularity (large gene families hit many
+    queries), and each query's own ortholog (the subject at the same index,
+    when there is one) gets its top hit most of the time.
+
+    Args:
+        path (str): Output file.
+        queries (list): Query IDs.
+        subjects (list): Subject IDs.
+        hits_per_query (int): Mean number of hits per query.
+        seed (int): Random seed.
+
+    Returns:
+        int: Number of hits written.
+    """
+    rng = np.random.default_rng(seed)
+    weights = _popularity(rng, len(subjects), 0.7)
+    n_hits = np.minimum(rng.geometric(1.0 / hits_per_query, len(queries)), len(subjects))
+    written = 0
+    with open(path, 'w') as f:
+        for query_index, (query, n) in enumerate(zip(queries, n_hits.tolist())):
+            hits = rng.choice(len(subjects), n, replace=False, p=weights)
+            bitscores = np.sort(rng.lognormal(4.5, 0.8, n) + 20)[::-1]
+            if query_index < len(subjects) and rng.random() < 0.8:
+                hits = np.concatenate(([query_index], hits[hits != query_index]))[:n]
+            lengths = rng.integers(50, 600, len(hits))
+            pident = rng.uniform(25, 100, len(hits))
+            mismatches = np.rint(lengths * (100 - pident) / 100).astype(np.int64)
+            gaps = rng.poisson(1.0, len(hits))
+            qstart = rng.integers(1, 50, len(hits))
+            sstart = rng.integers(1, 50, len(hits))
+            evalues = np.minimum(1e6 * 2.0 ** -bitscores, 10)
+            f.write(''.join(
+                f"{query}\t{subjects[s]}\t{p:.3f}\t{length}\t{m}\t{g}\t{qs}\t{qs + length - 1}\t"
+                f"{ss}\t{ss + length - 1}\t{e:.2e}\t{b:.1f}\n"
+                for s, p, length, m, g, qs, ss, e, b in zip(
+                    hits.tolist(), pident.tolist(), lengths.tolist(), mismatches.tolist(), gaps.tolist(),
+                    qstart.tolist(), sstart.tolist(), evalues.tolist(), bitscores.tolist())))
+            written += len(hits)
+    return written
+
+def generate_tier(data_dir, tier, seed=0):
+    """
+    Generate the inputs of every benchmark for one tier into data_dir.
+
+    Args:
+        data_dir (str): Directory for the generated files.
+        tier (dict): Input sizes, as in TIERS.
+        seed (int): Random seed; the same seed always produces the same files.
+
+    Returns:
+        dict: Path of each input and its number of rows.
+    """
+    queries = [f"{gene}.1" for gene in agi_gene_ids(tier['genes'])][:tier['queries']]
+    subjects = [f"Glyma.{i:06d}" for i in range(tier['subjects'])]
+    data = {name: os.path.join(data_dir, file_name) for name, file_name in (
+        ('clusters', 'clusters.txt'), ('pathways', 'pathways.txt'), ('pairs', 'pairs.txt'),
+        ('query_fasta', 'query.fa'), ('blast', 'blast.tsv'), ('reverse_blast', 'reverse_blast.tsv'))}
+    data['rows'] = {}
+    rows = data['rows']
+    rows['clusters'] = write_clusters(data['clusters'], tier['clusters'], tier['genes'], seed)
+    rows['pathways'] = write_pathways(data['pathways'], tier['pathways'], tier['genes'], seed + 1)
+    rows['pairs'] = write_gene_pairs(data['pairs'], tier['pairs'], tier['genes'], seed + 2)
+    rows['query_fasta'] = len(write_fasta(data['query_fasta'], queries, seed + 3))
+    rows['blast'] = write_blast_table(data['blast'], queries, subjects, tier['hits_per_query'], seed + 4)
+    rows['reverse_blast'] = write_blast_table(data['reverse_blast'], subjects, queries,
+                                              tier['hits_per_query'], seed + 5)
+
+    # Query-split shards of the forward search, for the merge benchmark
+    shard_queries = np.array_split(np.arange(len(queries)), tier['shards'])
+    data['blast_shards'] = [os.path.join(data_dir, f'blast_{i}.tsv') for i in range(tier['shards'])]
+    for i, shard in enumerate(shard_queries):
+        write_blast_table(data['blast_shards'][i], [queries[q] for q in shard.tolist()], subjects,
+                          tier['hits_per_query'], seed + 6 + i)
+    rows['blast_shards'] = rows['blast']
+    return data
+
+def _bench_cluster_pathway_comparisons(data, output_dir):
+    analysis = _module('cluster_pathway_analysis')
+    genes = analysis.GeneTable()
+    clusters = analysis.read_clusters(data['clusters'], genes)
+    pathways = analysis.read_pathways(data['pathways'], genes)
+    analysis.cluster_pathway_comparisons(clusters, pathways, os.path.join(output_dir, 'pathway_counts.txt'),
+                                         enrichment=True)
+    return data['rows']['clusters'] + data['rows']['pathways']
+
+def _bench_unique_gene_pairs(data, output_dir):
+    _module('unique_gene_pairs').unique_gene_pairs(data['pairs'], output_dir)
+    return data['rows']['pairs']
+
+def _bench_lethal_gene_pairs(data, output_dir):
+    _module('lethal_gene_pairs').lethal_gene_pair_bins(data['pairs'], [0.1, 0.5, 0.9], output_dir)
+    return data['rows']['pairs']
+
+def _bench_filter_blast_results(data, output_dir):
+    parser = _module('blast_results_parser')
+    parser.filter_blast_results(data['blast'], os.path.join(output_dir, 'filtered.tsv'),
+                                max_evalue=1e-10, min_pident=40,
+                                min_coverage=50, query_lengths=parser.fasta_lengths(data['query_fasta']))
+    return data['rows']['blast']
+
+def _bench_reciprocal_best_hits(data, output_dir):
+    _module('blast_results_parser').reciprocal_best_hits(data['blast'], data['reverse_blast'],
+                                                         os.path.join(output_dir, 'orthologs.tsv'),
+                                                         max_evalue=1e-5)
+    return data['rows']['blast'] + data['rows']['reverse_blast']
+
+def _bench_merge_blast_shards(data, output_dir):
+    _module('blast_results_parser').merge_blast_shards(data['blast_shards'], os.path.join(output_dir, 'merged.tsv'),
+                                                       top_n=5)
+    return data['rows']['blast_shards']
+
+def _bench_shard_fasta(data, output_dir):
+    _module('hpcc_blast_job_submission').shard_fasta(data['query_fasta'], 16, output_dir)
+    return data['rows']['query_fasta']
+
+# Benchmarked entry points: each runs on the generated inputs, writes into
+# output_dir and returns the number of input rows it processed.
+BENCHMARKS = {
+    'cluster_pathway_comparisons': _bench_cluster_pathway_comparisons,
+    'unique_gene_pairs': _bench_unique_gene_pairs,
+    'lethal_gene_pairs': _bench_lethal_gene_pairs,
+    'filter_blast_results': _bench_filter_blast_results,
+    'reciprocal_best_hits': _bench_reciprocal_best_hits,
+    'merge_blast_shards': _bench_merge_blast_shards,
+    'shard_fasta': _bench_shard_fasta,
+}
+
+def _measure(benchmark, data, work_dir, repeat):
+    """
+    Time a benchmark repeat times, then run it once more under tracemalloc for its peak memory.
+    """
+    seconds = []
+    for i in range(repeat + 1):
+        output_dir = tempfile.mkdtemp(dir=work_dir)
+        if i == repeat:
+            tracemalloc.start()
+            rows = benchmark(data, output_dir)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = perf_counter()
+            rows = benchmark(data, output_dir)
+            seconds.append(perf_counter() - start)
+    return rows, seconds, peak_memory
+
+def run_benchmarks(tiers=('small',), names=None, repeat=3, seed=0, work_dir=None):
+    """
+    Run the benchmarks on generated inputs of each tier.
+
+    Each benchmark is timed repeat times and its best time is reported, as
+    the best time is the least affected by other load on the machine. Peak
+    Python heap memory (including numpy arrays) is measured with tracemalloc
+    in a separate run, since tracing slows the code down.
+
+    Args:
+        tiers (list): Names of the tiers in TIERS to run.
+        names (list): Benchmarks to run. Default is all of BENCHMARKS.
+        repeat (int): Timed runs per benchmark, at least 1.
+        seed (int): Seed of the generated inputs.
+        work_dir (str): Directory for inputs and outputs. Default is a temporary directory.
+
+    Returns:
+        dict: 'meta' describing the run and 'results' keyed to "<benchmark>[<tier>]", each with
+              rows, seconds (best), all_seconds, rows_per_second and peak_memory (bytes).
+
+    Raises:
+        ValueError: If a tier or benchmark name is unknown or repeat is below 1.
+    """
+    names = list(BENCHMARKS) if names is None else list(names)
+    unknown = [tier for tier in tiers if tier not in TIERS] + [name for name in names if name not in BENCHMARKS]
+    if unknown or repeat < 1:
+        logging.error("Unknown tiers or benchmarks %s or repeat %s", unknown, repeat)
+        raise ValueError(f"Unknown tiers or benchmarks {unknown} or repeat {repeat}")
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        for tier in tiers:
+            tier_dir = os.path.join(temp_dir, tier)
+            os.mkdir(tier_dir)
+            data = generate_tier(tier_dir, TIERS[tier], seed)
+            for name in names:
+                rows, seconds, peak_memory = _measure(BENCHMARKS[name], data, tier_dir, repeat)
+                results[f"{name}[{tier}]"] = {
+                    'benchmark': name,
+                    'tier': tier,
+                    'rows': rows,
+                    'seconds': min(seconds),
+                    'all_seconds': seconds,
+                    'rows_per_second': rows / min(seconds) if min(seconds) > 0 else None,
+                    'peak_memory': peak_memory,
+                }
+                logging.info("%s[%s]: %.3f s, %d rows, peak %.1f MiB", name, tier, min(seconds), rows,
+                             peak_memory / (1 << 20))
+
+    meta = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+    }
+    return {'meta': meta, 'results': results}
+
+def compare_results(results, baseline, tolerance=0.25, min_seconds=0.01, min_memory=1 << 20):
+    """
+    Compare benchmark results against a baseline and return the regressions.
+
+    A benchmark regresses when its best time or peak memory grows by more than
+    tolerance (a fraction) and by more than an absolute noise floor, so that
+    jitter on very fast benchmarks is not flagged. Benchmarks missing from
+    either side are ignored.
+
+    Args:
+        results (dict): Output of run_benchmarks.
+        baseline (dict): Earlier output of run_benchmarks.
+        tolerance (float): Allowed relative increase.
+        min_seconds (float): Smallest time increase, in seconds, counted as a regression.
+        min_memory (int): Smallest memory increase, in bytes, counted as a regression.
+
+    Returns:
+        list: One dict (benchmark, metric, baseline, current, ratio) per regression.
+    """
+    regressions = []
+    for key, current in results['results'].items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            continue
+        for metric, floor in (('seconds', min_seconds), ('peak_memory', min_memory)):
+            before, after = previous[metric], current[metric]
+            if after > before * (1 + tolerance) and after - before > floor:
+                regressions.append({'benchmark': key, 'metric': metric, 'baseline': before, 'current': after,
+                                    'ratio': after / before if before else float('inf')})
+    return regressions
+
+def write_results(path, results):
+    """
+    Write benchmark results as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def read_results(path):
+    """
+    Read benchmark results written by write_results.
+
+    Raises:
+        IOError: If the file cannot be read.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except IOError:
+        logging.error("Benchmark results not found: %s", path)
+        raise IOError(f"File not found: {path}")
+
+def main(argv=None):
+    """
+    Run the benchmarks from the command line; exit status 1 if any regressed against the baseline.
+    """
+    arg_parser = argparse.ArgumentParser(description="Benchmark the bioinformatics scripts on synthetic inputs.")
+    arg_parser.add_argument('--tier', action='append', choices=list(TIERS), help="Tier to run (repeatable). Default: small")
+    arg_parser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS),
+                            help="Benchmark to run (repeatable). Default: all")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark. Default: 3")
+    arg_parser.add_argument('--seed', type=int, default=0, help="Seed of the generated inputs. Default: 0")
+    arg_parser.add_argument('--output', default='benchmark_results.json', help="Results file.")
+    arg_parser.add_argument('--baseline', help="Earlier results file to compare against.")
+    arg_parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown. Default: 0.25")
+    args = arg_parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    results = run_benchmarks(args.tier or ['small'], args.benchmark, args.repeat, args.seed)
+    write_results(args.output, results)
+
+    if args.baseline:
+        regressions = compare_results(results, read_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            logging.error("Regression in %(benchmark)s %(metric)s: %(baseline).4g -> %(current).4g (x%(ratio).2f)",
+                          regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
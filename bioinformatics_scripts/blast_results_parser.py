@@ -1 +1,571 @@
-def qualifying_match_counter
\ No newline at end of file
+import heapq
+import itertools
+import logging
+
+import numpy as np
+
+CHUNK_BYTES = 1 << 22
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Columns of BLAST -outfmt 6 (the default tabular format) and their types.
+# qseqid and sseqid are stored as int32 codes into a SequenceIds table.
+BLAST_COLUMNS = (
+    ('qseqid', np.int32),
+    ('sseqid', np.int32),
+    ('pident', np.float64),
+    ('length', np.int64),
+    ('mismatch', np.int64),
+    ('gapopen', np.int64),
+    ('qstart', np.int64),
+    ('qend', np.int64),
+    ('sstart', np.int64),
+    ('send', np.int64),
+    ('evalue', np.float64),
+    ('bitscore', np.float64),
+)
+N_COLUMNS = len(BLAST_COLUMNS)
+COLUMN_INDEX = {name: i for i, (name, _) in enumerate(BLAST_COLUMNS)}
+
+class SequenceIds:
+    """
+    Interns sequence identifiers as dense int32 codes, in first-seen order.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.names = []
+        self._lookups = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, names):
+        """
+        Return the codes of a sequence of identifiers, adding new ones to the table.
+        """
+        index = self.index
+        codes = np.fromiter((index.setdefault(name, len(index)) for name in names), dtype=np.int32, count=len(names))
+        if len(index) > len(self.names):
+            self.names.extend(itertools.islice(index, len(self.names), None))
+        return codes
+
+    def lookup(self, mapping, dtype=np.int64):
+        """
+        Return mapping[name] for every interned name as an array indexed by code (0 if absent).
+
+        The array is cached per mapping and only extended for names added since the last call.
+        """
+        cached_mapping, values = self._lookups.get(id(mapping), (None, np.zeros(0, dtype=dtype)))
+        if cached_mapping is not mapping:
+            values = np.zeros(0, dtype=dtype)
+        if len(values) < len(self.names):
+            new = np.fromiter((mapping.get(name, 0) for name in self.names[len(values):]), dtype=dtype,
+                              count=len(self.names) - len(values))
+            values = np.concatenate((values, new))
+            self._lookups[id(mapping)] = (mapping, values)
+        return values
+
+class BlastHits:
+    """
+    A chunk of outfmt 6 hits read as typed columns.
+
+    The chunk is split into fields once; each column is converted (or, for
+    qseqid and sseqid, interned) the first time it is read with hits['pident']
+    etc., so a filter only pays for the columns it uses. hits.lines gives the
+    original text of each hit so selected hits can be written back unchanged.
+    """
+
+    def __init__(self, text, tokens, first_line_number, ids, rows=None):
+        self._text = text
+        self._tokens = tokens
+        self._first_line_number = first_line_number
+        self._rows = rows
+        self._columns = {}
+        self.ids = ids
+
+    def __len__(self):
+        return len(self._tokens) // N_COLUMNS if self._rows is None else len(self._rows)
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            i = COLUMN_INDEX[name]
+            field = self._tokens[i::N_COLUMNS]
+            try:
+                column = self.ids.intern(field) if i < 2 else np.array(field, dtype=BLAST_COLUMNS[i][1])
+            except ValueError:
+                _find_malformed_line(self._text.split('\n'), self._first_line_number)
+            self._columns[name] = column if self._rows is None else column[self._rows]
+        return self._columns[name]
+
+    @property
+    def lines(self):
+        """
+        The original lines of the hits, newline-terminated.
+        """
+        lines = [line + '\n' for line in self._text.split('\n') if line and not line.isspace()]
+        return lines if self._rows is None else [lines[row] for row in self._rows.tolist()]
+
+    def select(self, mask):
+        """
+        Return the hits where a boolean mask is True.
+        """
+        rows = np.flatnonzero(mask) if self._rows is None else self._rows[mask]
+        selected = BlastHits(self._text, self._tokens, self._first_line_number, self.ids, rows)
+        selected._columns = {name: column[mask] for name, column in self._columns.items()}
+        return selected
+
+def _find_malformed_line(lines, first_line_number):
+    """
+    Locate the first line of a chunk that is not a valid outfmt 6 row and raise for it.
+
+    Raises:
+        ValueError: Always, naming the offending line and its line number.
+    """
+    for line_number, line in enumerate(lines, first_line_number):
+        if not line or line.isspace():
+            continue
+        parts = line.rstrip('\n').split('\t')
+        try:
+            if len(parts) != N_COLUMNS or len(line.split()) != N_COLUMNS:
+                raise ValueError
+            for part, (_, dtype) in zip(parts[2:], BLAST_COLUMNS[2:]):
+                float(part) if dtype is np.float64 else int(part)
+        except ValueError:
+            logging.error("Invalid line format at line %d: %s", line_number, line)
+            raise ValueError(f"Invalid line format at line {line_number}: {line}")
+    raise ValueError(f"Invalid BLAST output near line {first_line_number}")
+
+def _rows_well_formed(text, n_tokens):
+    """
+    Check that every non-blank row of a chunk has exactly 12 non-empty fields.
+
+    Works on the positions of the tab and newline bytes, so no line is
+    split on its own: each row must hold 0 (blank) or 11 tabs, no tab may
+    sit next to another separator or at either end of the chunk (an empty
+    field), and the whitespace-split token count must then be exactly 12
+    per row, which rules out fields containing spaces.
+    """
+    data = np.frombuffer(text.encode(), dtype=np.uint8)
+    separators = np.flatnonzero((data == 9) | (data == 10))
+    is_tab = data[separators] == 9
+    newlines_before = np.cumsum(~is_tab)
+    tabs_per_row = np.bincount(newlines_before[is_tab], minlength=newlines_before[-1] + 1 if len(separators) else 1)
+    if not np.isin(tabs_per_row, (0, N_COLUMNS - 1)).all():
+        return False
+    if is_tab.any():
+        adjacent = np.flatnonzero(np.diff(separators) == 1)
+        if (is_tab[adjacent] | is_tab[adjacent + 1]).any():
+            return False
+        if (is_tab[0] and separators[0] == 0) or (is_tab[-1] and separators[-1] == len(data) - 1):
+            return False
+    return n_tokens == np.count_nonzero(tabs_per_row) * N_COLUMNS
+
+def _parse_chunk(text, first_line_number, ids):
+    """
+    Split a chunk of outfmt 6 text into fields and check that every row has 12 of them.
+
+    The whole chunk is split in one call and the rows are checked together
+    by _rows_well_formed; lines are only looked at one by one to report a
+    malformed one.
+    """
+    tokens = text.split()
+    if not _rows_well_formed(text, len(tokens)):
+        _find_malformed_line(text.split('\n'), first_line_number)
+    return BlastHits(text, tokens, first_line_number, ids)
+
+def read_blast_tabular(file, ids=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Stream a BLAST -outfmt 6 file as chunks of typed columns.
+
+    Memory use is bounded by chunk_bytes and the number of distinct sequence
+    identifiers, whatever the size of the file.
+
+    Args:
+        file (str): Path to the BLAST tabular output.
+        ids (SequenceIds): Table to intern qseqid and sseqid into; a new one if None.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+
+    Returns:
+        generator: BlastHits chunks in file order.
+
+    Raises:
+        IOError: If the file cannot be read.
+        ValueError: If a line is not a 12-column outfmt 6 row, or (when the column
+                    is first read) a numeric field is not a number.
+    """
+    ids = ids if ids is not None else SequenceIds()
+    try:
+        with open(file, 'r') as f:
+            line_number = 1
+            while True:
+                text = f.read(chunk_bytes)
+                if not text:
+                    break
+                if not text.endswith('\n'):
+                    text += f.readline()
+                    if not text.endswith('\n'):
+                        text += '\n'
+                yield _parse_chunk(text, line_number, ids)
+                line_number += text.count('\n')
+    except IOError:
+        logging.error("Error reading file: %s", file)
+        raise IOError(f"Error reading file: {file}")
+
+def qualifying_mask(hits, max_evalue=None, min_pident=None, min_bitscore=None, min_coverage=None,
+                    query_lengths=None):
+    """
+    Return a boolean mask of the hits that pass every given filter.
+
+    Args:
+        hits (BlastHits): Hits to filter.
+        max_evalue (float): Keep hits with evalue <= max_evalue.
+        min_pident (float): Keep hits with percent identity >= min_pident.
+        min_bitscore (float): Keep hits with bitscore >= min_bitscore.
+        min_coverage (float): Keep hits whose alignment covers >= min_coverage percent
+                              of the query (as BLAST's qcovhsp).
+        query_lengths (dict): Query lengths by qseqid, required for min_coverage.
+
+    Returns:
+        numpy.ndarray: Boolean mask over the hits.
+
+    Raises:
+        ValueError: If min_coverage is given without query_lengths, or a query has no length.
+    """
+    mask = np.ones(len(hits), dtype=bool)
+    if max_evalue is not None:
+        mask &= hits['evalue'] <= max_evalue
+    if min_pident is not None:
+        mask &= hits['pident'] >= min_pident
+    if min_bitscore is not None:
+        mask &= hits['bitscore'] >= min_bitscore
+    if min_coverage is not None:
+        if query_lengths is None:
+            raise ValueError("min_coverage needs query_lengths")
+        queries = hits['qseqid']  # interns the chunk's queries before the lookup
+        lengths = hits.ids.lookup(query_lengths)[queries]
+        if (lengths <= 0).any():
+            missing = hits.ids.names[queries[lengths <= 0][0]]
+            raise ValueError(f"No query length for: {missing}")
+        aligned = np.abs(hits['qend'] - hits['qstart']) + 1
+        mask &= aligned * 100 >= min_coverage * lengths
+    return mask
+
+def fasta_lengths(fasta_file):
+    """
+    Return the sequence length of each record in a FASTA file, keyed by the first word of its header.
+    """
+    lengths = {}
+    name = None
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                name = line[1:].split(None, 1)[0] if line[1:].strip() else ''
+                lengths[name] = 0
+            elif name is not None:
+                lengths[name] += len(line.strip())
+    return lengths
+
+def filter_blast_results(file, output_file, chunk_bytes=CHUNK_BYTES, **filters):
+    """
+    Write the hits of a BLAST -outfmt 6 file that pass the filters, unchanged and in order.
+
+    Args:
+        file (str): Path to the BLAST tabular output.
+        output_file (str): Path of the filtered output.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+        **filters: Filters accepted by qualifying_mask.
+
+    Returns:
+        int: Number of hits written.
+    """
+    written = 0
+    with open(output_file, 'w', buffering=OUTPUT_BUFFER_SIZE) as out:
+        for hits in read_blast_tabular(file, chunk_bytes=chunk_bytes):
+            selected = hits.select(qualifying_mask(hits, **filters))
+            out.write(''.join(selected.lines))
+            written += len(selected)
+    return written
+
+def qualifying_match_counter(file, chunk_bytes=CHUNK_BYTES, **filters):
+    """
+    Count the qualifying hits of each query in a BLAST -outfmt 6 file.
+
+    Args:
+        file (str): Path to the BLAST tabular output.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+        **filters: Filters accepted by qualifying_mask (max_evalue, min_pident,
+                   min_bitscore, min_coverage, query_lengths).
+
+    Returns:
+        dict: Number of qualifying hits per qseqid, in first-seen order. Queries
+              with no qualifying hit are included with a count of 0.
+    """
+    ids = SequenceIds()
+    counts = np.zeros(0, dtype=np.int64)
+    is_query = np.zeros(0, dtype=bool)
+    for hits in read_blast_tabular(file, ids=ids, chunk_bytes=chunk_bytes):
+        queries = hits['qseqid']
+        qualifying = queries[qualifying_mask(hits, **filters)]
+        if len(ids) > len(counts):
+            counts = np.concatenate((counts, np.zeros(len(ids) - len(counts), dtype=np.int64)))
+            is_query = np.concatenate((is_query, np.zeros(len(ids) - len(is_query), dtype=bool)))
+        is_query[queries] = True
+        counts += np.bincount(qualifying, minlength=len(counts))
+    return {ids.names[code]: int(counts[code]) for code in np.flatnonzero(is_query)}
+
+def _grow(array, size, fill):
+    """
+    Extend a per-identifier array to size entries, filling new entries with fill.
+    """
+    if len(array) >= size:
+        return array
+    return np.concatenate((array, np.full(size - len(array), fill, dtype=array.dtype)))
+
+def _best_hit_arrays(file, ids, chunk_bytes=CHUNK_BYTES, **filters):
+    """
+    Find the best qualifying hit of each query, indexed by query code in ids.
+
+    The best hit has the highest bitscore, then the lowest evalue; remaining
+    ties go to the hit seen first. Only one hit per query is kept, so memory
+    scales with the number of queries, not hits.
+
+    Returns:
+        tuple: Subject code (-1 if the query has no qualifying hit), bitscore and
+               evalue arrays, all indexed by query code.
+    """
+    subjects = np.zeros(0, dtype=np.int32)
+    bitscores = np.zeros(0, dtype=np.float64)
+    evalues = np.zeros(0, dtype=np.float64)
+    for hits in read_blast_tabular(file, ids=ids, chunk_bytes=chunk_bytes):
+        hits = hits.select(qualifying_mask(hits, **filters))
+        queries, chunk_subjects = hits['qseqid'], hits['sseqid']
+        chunk_bitscores, chunk_evalues = hits['bitscore'], hits['evalue']
+
+        # Best hit of each query within the chunk: first row of each query
+        # after sorting by query, bitscore descending, evalue, position.
+        order = np.lexsort((np.arange(len(queries)), chunk_evalues, -chunk_bitscores, queries))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = queries[order][1:] != queries[order][:-1]
+        best = order[first]
+        queries = queries[best]
+
+        subjects = _grow(subjects, len(ids), -1)
+        bitscores = _grow(bitscores, len(ids), -np.inf)
+        evalues = _grow(evalues, len(ids), np.inf)
+        better = ((chunk_bitscores[best] > bitscores[queries]) |
+                  ((chunk_bitscores[best] == bitscores[queries]) & (chunk_evalues[best] < evalues[queries])))
+        queries, best = queries[better], best[better]
+        subjects[queries] = chunk_subjects[best]
+        bitscores[queries] = chunk_bitscores[best]
+        evalues[queries] = chunk_evalues[best]
+    return _grow(subjects, len(ids), -1), _grow(bitscores, len(ids), -np.inf), _grow(evalues, len(ids), np.inf)
+
+def best_hits(file, chunk_bytes=CHUNK_BYTES, **filters):
+    """
+    Return the best qualifying hit of each query in a BLAST -outfmt 6 file.
+
+    The best hit has the highest bitscore, then the lowest evalue; remaining
+    ties go to the hit that comes first in the file.
+
+    Args:
+        file (str): Path to the BLAST tabular output.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+        **filters: Filters accepted by qualifying_mask, applied before choosing.
+
+    Returns:
+        dict: (sseqid, bitscore, evalue) of the best hit per qseqid.
+    """
+    ids = SequenceIds()
+    subjects, bitscores, evalues = _best_hit_arrays(file, ids, chunk_bytes, **filters)
+    return {ids.names[query]: (ids.names[subjects[query]], float(bitscores[query]), float(evalues[query]))
+            for query in np.flatnonzero(subjects >= 0)}
+
+def reciprocal_best_hits(forward_file, reverse_file, output_file, chunk_bytes=CHUNK_BYTES, **filters):
+    """
+    Call orthologs as reciprocal best hits from a forward and a reverse BLAST search.
+
+    Both files are streamed once, keeping only the best hit of each query
+    (see best_hits). Identifiers from both searches are interned into one
+    table, so the best hits of each direction are arrays indexed by the
+    same codes and the join is one vectorized lookup: A and B are reciprocal
+    best hits when B is A's best hit in the forward search and A is B's best
+    hit in the reverse search.
+
+    The output is in the gene-pair format read by unique_gene_pairs:
+    gene_a\tgene_b\tforward_bitscore\treverse_bitscore\tforward_evalue\treverse_evalue,
+    one pair per line in order of first appearance in the forward file.
+
+    Args:
+        forward_file (str): BLAST tabular output of genome A queries against genome B.
+        reverse_file (str): BLAST tabular output of genome B queries against genome A.
+        output_file (str): Path of the ortholog pair output.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+        **filters: Filters accepted by qualifying_mask, applied to both searches.
+
+    Returns:
+        int: Number of ortholog pairs written.
+    """
+    ids = SequenceIds()
+    forward, forward_bitscores, forward_evalues = _best_hit_arrays(forward_file, ids, chunk_bytes, **filters)
+    reverse, reverse_bitscores, reverse_evalues = _best_hit_arrays(reverse_file, ids, chunk_bytes, **filters)
+    forward = _grow(forward, len(ids), -1)
+
+    genes_a = np.flatnonzero(forward >= 0)
+    genes_a = genes_a[reverse[forward[genes_a]] == genes_a]
+    genes_b = forward[genes_a]
+
+    rows = zip(genes_a.tolist(), genes_b.tolist(), forward_bitscores[genes_a].tolist(),
+               reverse_bitscores[genes_b].tolist(), forward_evalues[genes_a].tolist(),
+               reverse_evalues[genes_b].tolist())
+    with open(output_file, 'w', buffering=OUTPUT_BUFFER_SIZE) as out:
+        for a, b, *scores in rows:
+            out.write('\t'.join([ids.names[a], ids.names[b]] + [repr(score) for score in scores]) + '\n')
+    return len(genes_a)
+
+def _query_runs(queries, previous):
+    """
+    Return the query code of each run of consecutive equal codes, skipping a
+    first run that continues the previous chunk's last query.
+    """
+    starts = np.ones(len(queries), dtype=bool)
+    starts[1:] = queries[1:] != queries[:-1]
+    if len(queries) and queries[0] == previous:
+        starts[0] = False
+    return queries[starts]
+
+def _shard_query_order(shard_files, ids, chunk_bytes):
+    """
+    Derive one query order consistent with the order of queries in every shard.
+
+    Each shard lists its queries in the order they were searched, but a
+    database-split shard may lack queries that had no hits in it. The order
+    of each shard is a chain of constraints; a topological sort of all
+    chains gives an order every shard agrees with, preferring queries seen
+    first.
+
+    Returns:
+        numpy.ndarray: Rank of each query code (-1 for codes that are not queries).
+
+    Raises:
+        ValueError: If the shards list their queries in contradictory orders.
+    """
+    successors = {}
+    indegree = {}
+    for shard_file in shard_files:
+        previous = -1
+        for hits in read_blast_tabular(shard_file, ids=ids, chunk_bytes=chunk_bytes):
+            for query in _query_runs(hits['qseqid'], previous).tolist():
+                indegree.setdefault(query, 0)
+                if previous >= 0 and query not in successors.setdefault(previous, set()):
+                    successors[previous].add(query)
+                    indegree[query] += 1
+                previous = query
+
+    ranks = np.full(len(ids), -1, dtype=np.int64)
+    ready = [query for query, degree in indegree.items() if degree == 0]
+    heapq.heapify(ready)
+    rank = 0
+    while ready:
+        query = heapq.heappop(ready)
+        ranks[query] = rank
+        rank += 1
+        for successor in successors.get(query, ()):
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                heapq.heappush(ready, successor)
+    if rank != len(indegree):
+        logging.error("Shards list their queries in contradictory orders")
+        raise ValueError("Shards list their queries in contradictory orders; pass query_order")
+    return ranks
+
+def _shard_query_groups(shard_file, ids, ranks, chunk_bytes):
+    """
+    Stream the hits of one shard grouped by query, as (rank, [(bitscore, evalue, line), ...]).
+
+    Raises:
+        ValueError: If a query has no rank or the shard is not in rank order.
+    """
+    group_rank, group = -1, []
+    for hits in read_blast_tabular(shard_file, ids=ids, chunk_bytes=chunk_bytes):
+        queries = hits['qseqid']
+        # Codes interned after the order was fixed are queries missing from it.
+        hit_ranks = np.full(len(queries), -1, dtype=np.int64)
+        known = queries < len(ranks)
+        hit_ranks[known] = ranks[queries[known]]
+
+        rows = zip(hit_ranks.tolist(), hits['bitscore'].tolist(), hits['evalue'].tolist(), hits.lines)
+        for rank, bitscore, evalue, line in rows:
+            if rank != group_rank:
+                if rank < group_rank or rank < 0:
+                    logging.error("Shard is not in query order: %s", shard_file)
+                    raise ValueError(f"Shard is not in query order, or has an unknown query: {shard_file}")
+                if group:
+                    yield group_rank, group
+                group_rank, group = rank, []
+            group.append((bitscore, evalue, line))
+    if group:
+        yield group_rank, group
+
+def merge_blast_shards(shard_files, output_file, top_n=None, query_order=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Merge sharded BLAST -outfmt 6 outputs into one file, keeping the top hits of each query.
+
+    The shards are merged as a streaming k-way merge on query order, so a
+    query's hits may be spread over several shards (database-split searches)
+    or live in one (query-split searches). Only the hits of the current query
+    are held in memory, in a heap bounded by top_n. Hits are ranked by
+    bitscore, then evalue, then shard and line order, and written unchanged
+    in that order.
+
+    The query order comes from query_order when given (for example the keys
+    of fasta_lengths(query_fasta)); otherwise it is derived from the shards
+    themselves in an extra pass over their qseqid column.
+
+    Args:
+        shard_files (list): Paths of the shard outputs, in shard order.
+        output_file (str): Path of the merged output.
+        top_n (int): Number of hits kept per query; all hits if None.
+        query_order (iterable): Query identifiers in search order.
+        chunk_bytes (int): Approximate number of bytes of input per chunk.
+
+    Returns:
+        int: Number of hits written.
+
+    Raises:
+        ValueError: If top_n is below 1, or the shards are not in a consistent query order.
+    """
+    if top_n is not None and top_n < 1:
+        raise ValueError(f"Invalid top_n: {top_n}")
+
+    ids = SequenceIds()
+    if query_order is not None:
+        ids.intern(list(query_order))
+        ranks = np.arange(len(ids), dtype=np.int64)
+    else:
+        ranks = _shard_query_order(shard_files, ids, chunk_bytes)
+
+    def shard_stream(shard, shard_file):
+        for rank, group in _shard_query_groups(shard_file, ids, ranks, chunk_bytes):
+            yield rank, shard, group
+
+    streams = [shard_stream(shard, shard_file) for shard, shard_file in enumerate(shard_files)]
+
+    written = 0
+    with open(output_file, 'w', buffering=OUTPUT_BUFFER_SIZE) as out:
+        merged = heapq.merge(*streams, key=lambda item: item[:2])
+        for _, query_groups in itertools.groupby(merged, key=lambda item: item[0]):
+            # Min-heap on (bitscore, -evalue, -position): its root is the weakest kept hit.
+            kept = []
+            position = 0
+            for _, _, group in query_groups:
+                for bitscore, evalue, line in group:
+                    item = (bitscore, -evalue, -position, line)
+                    position += 1
+                    if top_n is None or len(kept) < top_n:
+                        heapq.heappush(kept, item)
+                    elif item > kept[0]:
+                        heapq.heapreplace(kept, item)
+            kept.sort(reverse=True)
+            out.write(''.join(item[3] for item in kept))
+            written += len(kept)
+    return written
@@ -0,0 +1,497 @@
+import argparse
+import functools
+import importlib
+import logging
+import sys
+from contextlib import contextmanager
+from time import perf_counter
+
+# Only the standard library is imported at startup: each subcommand imports the
+# one module it runs (and with it numpy) when it is invoked, so --help and the
+# argument parsing stay fast.
+
+def _module(name):
+    """
+    Import a sibling module by name, inside the package or from a scripts checkout.
+    """
+    return importlib.import_module(f'{__package__}.{name}' if __package__ else name)
+
+def _peak_rss(who=None):
+    """
+    Return the peak resident set size of this process (or of its finished children) in bytes.
+    """
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+def _rss_high_water():
+    """
+    Return this process's resident set size high-water mark (VmHWM) in bytes, or None off Linux.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_rss_high_water():
+    """
+    Reset the high-water mark to the current RSS (Linux clear_refs); return False if that is not possible.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def _count_lines(path):
+    """
+    Return the number of lines in a file, reading it in binary blocks.
+    """
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(functools.partial(f.read, 1 << 20), b''):
+            lines += block.count(b'\n')
+    return lines
+
+class Profiler:
+    """
+    Per-stage wall time and peak RSS of one subcommand, reported by --profile.
+
+    Stage times are exclusive: time spent in a stage nested inside another
+    (for example a parse function called from a streaming loop) counts only
+    towards the inner stage. Library functions are attributed to a stage by
+    temporarily wrapping them in their module, so streaming code that parses,
+    computes and writes chunk by chunk is split into stages without changes.
+    When the profiler is disabled, stages and wrapping cost nothing.
+
+    A stage's peak_rss is the highest RSS reached while it ran, nested stages
+    included. It is measured by resetting the kernel's high-water mark at the
+    start of each stage, so it needs Linux; elsewhere it is None and only the
+    process-wide peak_rss of the report is available.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self._stack = []
+        self._patches = []
+        # Resetting the high-water mark also lowers ru_maxrss, so the
+        # process-wide peak is tracked here from then on
+        self._process_peak = (_peak_rss() or 0) if enabled else 0
+        self._stage_rss = enabled and _rss_high_water() is not None and _reset_rss_high_water()
+
+    def _high_water(self):
+        """
+        Return the RSS high-water mark since the last reset, in bytes.
+        """
+        high_water = _rss_high_water() or 0
+        self._process_peak = max(self._process_peak, high_water)
+        return high_water
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Count the time spent in the with block towards the named stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        # [start time, seconds in nested stages, peak RSS so far]
+        frame = [perf_counter(), 0.0, 0]
+        if self._stage_rss:
+            # Close off the enclosing stage's peak before starting this one's
+            if self._stack:
+                self._stack[-1][2] = max(self._stack[-1][2], self._high_water())
+            _reset_rss_high_water()
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = perf_counter() - frame[0]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            record = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_rss': None})
+            record['seconds'] += elapsed - frame[1]
+            record['calls'] += 1
+            if self._stage_rss:
+                peak = max(frame[2], self._high_water())
+                if self._stack:
+                    self._stack[-1][2] = max(self._stack[-1][2], peak)
+                record['peak_rss'] = max(record['peak_rss'] or 0, peak)
+
+    def attribute(self, module, function_name, name):
+        """
+        Count calls to module.function_name towards the named stage until restore() is called.
+        """
+        if not self.enabled:
+            return
+        function = getattr(module, function_name)
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        setattr(module, function_name, timed)
+        self._patches.append((module, function_name, function))
+
+    def restore(self):
+        """
+        Undo the wrapping done by attribute().
+        """
+        for module, function_name, function in reversed(self._patches):
+            setattr(module, function_name, function)
+        self._patches = []
+
+    def report(self, command, wall_time, rows):
+        """
+        Return the profile as a JSON-serialisable dict.
+
+        rows is the number of input rows of the command; the rows/sec of each
+        stage is rows over that stage's time, as every stage sees every row.
+        """
+        def rate(seconds):
+            return rows / seconds if rows is not None and seconds > 0 else None
+
+        try:
+            import resource
+            children = _peak_rss(resource.RUSAGE_CHILDREN)
+        except ImportError:
+            children = None
+        # Importing the command's module processes no rows
+        stages = {name: dict(record, rows_per_second=None if name == 'import' else rate(record['seconds']))
+                  for name, record in self.stages.items()}
+        peak_rss = _peak_rss()
+        if peak_rss is not None:
+            peak_rss = max(peak_rss, self._process_peak, self._high_water() if self._stage_rss else 0)
+        return {
+            'command': command,
+            'wall_time': wall_time,
+            'rows': rows,
+            'rows_per_second': rate(wall_time),
+            'peak_rss': peak_rss,
+            'peak_rss_children': children,
+            'stages': stages,
+        }
+
+def _blast_filters(args, module, profiler):
+    """
+    Return the qualifying_mask keyword arguments given on the command line.
+    """
+    filters = {name: getattr(args, name) for name in ('max_evalue', 'min_pident', 'min_bitscore', 'min_coverage')
+               if getattr(args, name) is not None}
+    if args.query_fasta:
+        with profiler.stage('parse'):
+            filters['query_lengths'] = module.fasta_lengths(args.query_fasta)
+    return filters
+
+def _write_table(output_file, rows):
+    """
+    Write tab-separated rows to a file, or to stdout if output_file is None or '-'.
+    """
+    out = sys.stdout if output_file in (None, '-') else open(output_file, 'w')
+    try:
+        out.write(''.join('\t'.join(map(str, row)) + '\n' for row in rows))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+def _run_pathways(module, args, profiler):
+    genes = module.GeneTable()
+    with profiler.stage('parse'):
+        if args.cache:
+            clusters = module.cached_read(module.read_clusters, args.clusters_file, genes, args.cache_dir)
+            pathways = module.cached_read(module.read_pathways, args.pathways_file, genes, args.cache_dir)
+        else:
+            clusters = module.read_clusters(args.clusters_file, genes)
+            pathways = module.read_pathways(args.pathways_file, genes)
+    profiler.attribute(module, 'write_pathway_counts', 'write')
+    with profiler.stage('compute'):
+        module.cluster_pathway_comparisons(clusters, pathways, args.output, enrichment=args.enrichment,
+                                           permutations=args.permutations, seed=args.seed,
+                                           processes=args.processes, min_pc=args.min_pc, store=args.store,
+                                           gene_table=genes)
+    return [args.clusters_file, args.pathways_file]
+
+def _run_unique_pairs(module, args, profiler):
+    profiler.attribute(module, '_write_outputs', 'write')
+    with profiler.stage('compute'):
+        output_format = None if args.format == 'none' else args.format
+        paths = module.unique_gene_pairs(args.file, args.output_dir, canonical=args.canonical,
+                                         memory_budget=args.memory_budget, processes=args.processes,
+                                         output_format=output_format)
+    logging.info("Unique gene pairs written to %s", ', '.join(path for path in paths if path))
+    return [args.file]
+
+def _run_lethal_pairs(module, args, profiler):
+    profiler.attribute(module, '_parse_chunk', 'parse')
+    profiler.attribute(module, '_classify', 'compute')
+    profiler.attribute(module, '_route_chunk', 'write')
+    with profiler.stage('compute'):
+        if len(args.thresholds) == 1:
+            module.lethal_gene_pairs(args.file, args.thresholds[0], args.output_dir, args.processes)
+        else:
+            module.lethal_gene_pair_bins(args.file, args.thresholds, args.output_dir, args.processes)
+    return [args.file]
+
+def _run_blast_filter(module, args, profiler):
+    filters = _blast_filters(args, module, profiler)
+    profiler.attribute(module, '_parse_chunk', 'parse')
+    profiler.attribute(module, 'qualifying_mask', 'compute')
+    with profiler.stage('write'):
+        written = module.filter_blast_results(args.file, args.output_file, **filters)
+    logging.info("%d hits written to %s", written, args.output_file)
+    return [args.file]
+
+def _run_blast_count(module, args, profiler):
+    filters = _blast_filters(args, module, profiler)
+    profiler.attribute(module, '_parse_chunk', 'parse')
+    with profiler.stage('compute'):
+        counts = module.qualifying_match_counter(args.file, **filters)
+    with profiler.stage('write'):
+        _write_table(args.output, counts.items())
+    return [args.file]
+
+def _run_blast_rbh(module, args, profiler):
+    filters = _blast_filters(args, module, profiler)
+    profiler.attribute(module, '_parse_chunk', 'parse')
+    with profiler.stage('compute'):
+        pairs = module.reciprocal_best_hits(args.forward_file, args.reverse_file, args.output_file, **filters)
+    logging.info("%d reciprocal best hits written to %s", pairs, args.output_file)
+    return [args.forward_file, args.reverse_file]
+
+def _run_blast_merge(module, args, profiler):
+    query_order = None
+    if args.query_fasta:
+        with profiler.stage('parse'):
+            query_order = list(module.fasta_lengths(args.query_fasta))
+    profiler.attribute(module, '_parse_chunk', 'parse')
+    with profiler.stage('compute'):
+        module.merge_blast_shards(args.shard_files, args.output_file, top_n=args.top_n, query_order=query_order)
+    return list(args.shard_files)
+
+def _run_shard_fasta(module, args, profiler):
+    with profiler.stage('write'):
+        shard_files = module.shard_fasta(args.query_file, args.n_shards, args.output_dir, args.shard_prefix)
+    print('\n'.join(shard_files))
+    return [args.query_file]
+
+def _run_slurm_script(module, args, profiler):
+    with profiler.stage('compute'):
+        slurm_script = module.generate_slurm_script(args.time, args.ntasks, args.cpus_per_task, args.memory,
+                                                    args.name, args.query_file, args.db_location,
+                                                    args.output_file, blastp=args.blastp)
+    with profiler.stage('write'):
+        if args.submit:
+            print(module.submit_slurm_job(slurm_script, sbatch=args.sbatch))
+        else:
+            sys.stdout.write(slurm_script)
+    return []
+
+def _run_submit_blast(module, args, profiler):
+    history = module.JobHistory(args.history) if args.history else None
+    with profiler.stage('compute'):
+        job_id = module.submit_blast_shards(module.SlurmExecutor(sbatch=args.sbatch), args.time, args.ntasks,
+                                            args.cpus_per_task, args.memory, args.name, args.shard_prefix,
+                                            args.n_shards, args.db_location, args.output_prefix,
+                                            manifest_file=args.manifest, max_concurrent=args.max_concurrent,
+                                            blastp=args.blastp, history=history, margin=args.margin)
+    print(job_id or "All shards complete")
+    return []
+
+def _run_record_job(module, args, profiler):
+    history = module.JobHistory(args.history)
+    with profiler.stage('parse'):
+        records = [history.add_job_log(log_file, args.query_file, args.db_location) for log_file in args.log_files]
+    logging.info("%d jobs added to %s", len(records), args.history)
+    return list(args.log_files)
+
+def _run_bench(module, args, profiler):
+    with profiler.stage('compute'):
+        args.exit_status = module.main(args.bench_args)
+    return []
+
+def _add_blast_filter_arguments(parser):
+    parser.add_argument('--max-evalue', type=float, help="Keep hits with evalue <= this.")
+    parser.add_argument('--min-pident', type=float, help="Keep hits with percent identity >= this.")
+    parser.add_argument('--min-bitscore', type=float, help="Keep hits with bitscore >= this.")
+    parser.add_argument('--min-coverage', type=float, help="Keep hits covering >= this percent of the query.")
+    parser.add_argument('--query-fasta', help="Query FASTA file, for the query lengths --min-coverage needs.")
+
+def _add_slurm_arguments(parser, time_required=True):
+    parser.add_argument('--time', required=time_required, help="Time limit, e.g. 00:30:00.")
+    parser.add_argument('--ntasks', type=int, default=1, help="Number of tasks. Default: 1")
+    parser.add_argument('--cpus-per-task', type=int, default=1, help="CPUs per task. Default: 1")
+    parser.add_argument('--memory', required=time_required, help="Memory per node, e.g. 1G.")
+    parser.add_argument('--name', required=True, help="Name used in the job name, e.g. SMITH.")
+    parser.add_argument('--blastp', default=None, help="blastp executable.")
+    parser.add_argument('--sbatch', default='sbatch', help="sbatch executable. Default: sbatch")
+
+def build_parser():
+    """
+    Return the argument parser of the bioinformatics-scripts command.
+
+    Each subcommand sets 'module' (the module it imports) and 'run' (the
+    function that runs it and returns its input files, counted for --profile).
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help="Write per-stage wall time, peak RSS and rows/sec as JSON to FILE (default: stderr).")
+
+    parser = argparse.ArgumentParser(prog='bioinformatics-scripts', description="Assorted bioinformatics scripts.")
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    def add_command(name, module, run, help_text):
+        subparser = subparsers.add_parser(name, parents=[common], help=help_text, description=help_text)
+        subparser.set_defaults(module=module, run=run)
+        return subparser
+
+    sub = add_command('pathways', 'cluster_pathway_analysis', _run_pathways,
+                      "Count the genes shared by every pathway and cluster.")
+    sub.add_argument('clusters_file')
+    sub.add_argument('pathways_file')
+    sub.add_argument('-o', '--output', default='pathway_counts.txt', help="Default: pathway_counts.txt")
+    sub.add_argument('--enrichment', action='store_true', help="Add hypergeometric p-values and BH q-values.")
+    sub.add_argument('--permutations', type=int, default=0, help="Add empirical p-values from this many permutations.")
+    sub.add_argument('--seed', type=int, default=0, help="Seed of the permutations. Default: 0")
+    sub.add_argument('--processes', type=int, default=None, help="Worker processes. Default: number of CPUs")
+    sub.add_argument('--min-pc', type=int, default=0, help="Skip rows with fewer shared genes. Default: 0")
+    sub.add_argument('--store', help="Incremental result store; only changed pathways and clusters are recomputed.")
+    sub.add_argument('--cache', action='store_true', help="Read the inputs through the parsed gene set cache.")
+    sub.add_argument('--cache-dir', help="Cache directory. Default: $XDG_CACHE_HOME/bioinformatics_scripts")
+
+    sub = add_command('unique-pairs', 'unique_gene_pairs', _run_unique_pairs,
+                      "Keep the first occurrence of every gene pair.")
+    sub.add_argument('file')
+    sub.add_argument('output_dir')
+    sub.add_argument('--canonical', action='store_true', help="Treat (A, B) and (B, A) as the same pair.")
+    sub.add_argument('--memory-budget', type=int, help="Deduplicate out of core within this many bytes.")
+    sub.add_argument('--processes', type=int, default=1, help="Processes for out-of-core buckets. Default: 1")
+    sub.add_argument('--format', choices=['pairstore', 'pickle', 'none'], default='pairstore',
+                     help="Index written next to the text output. Default: pairstore")
+
+    sub = add_command('lethal-pairs', 'lethal_gene_pairs', _run_lethal_pairs,
+                      "Split gene pairs by lethality thresholds.")
+    sub.add_argument('file')
+    sub.add_argument('thresholds', type=float, nargs='+',
+                     help="One threshold writes above/below_threshold.txt; several write lethality bins.")
+    sub.add_argument('-o', '--output-dir', default='.', help="Default: current directory")
+    sub.add_argument('--processes', type=int, default=1, help="Worker processes. Default: 1")
+
+    sub = add_command('blast-filter', 'blast_results_parser', _run_blast_filter,
+                      "Write the BLAST hits that pass the filters.")
+    sub.add_argument('file')
+    sub.add_argument('output_file')
+    _add_blast_filter_arguments(sub)
+
+    sub = add_command('blast-count', 'blast_results_parser', _run_blast_count,
+                      "Count the qualifying BLAST hits of every query.")
+    sub.add_argument('file')
+    sub.add_argument('-o', '--output', help="Output file. Default: stdout")
+    _add_blast_filter_arguments(sub)
+
+    sub = add_command('blast-rbh', 'blast_results_parser', _run_blast_rbh,
+                      "Call orthologs as reciprocal best BLAST hits.")
+    sub.add_argument('forward_file')
+    sub.add_argument('reverse_file')
+    sub.add_argument('output_file')
+    _add_blast_filter_arguments(sub)
+
+    sub = add_command('blast-merge', 'blast_results_parser', _run_blast_merge,
+                      "Merge sharded BLAST outputs, keeping the top hits of each query.")
+    sub.add_argument('output_file')
+    sub.add_argument('shard_files', nargs='+')
+    sub.add_argument('--top-n', type=int, help="Hits kept per query. Default: all")
+    sub.add_argument('--query-fasta', help="Query FASTA giving the query order. Default: derived from the shards")
+
+    sub = add_command('shard-fasta', 'hpcc_blast_job_submission', _run_shard_fasta,
+                      "Split a query FASTA into residue-balanced shards.")
+    sub.add_argument('query_file')
+    sub.add_argument('n_shards', type=int)
+    sub.add_argument('-o', '--output-dir', default='.', help="Default: current directory")
+    sub.add_argument('--shard-prefix', default='shard', help="Default: shard")
+
+    sub = add_command('slurm-script', 'hpcc_blast_job_submission', _run_slurm_script,
+                      "Print (or submit) the SLURM script of one BLAST search.")
+    sub.add_argument('query_file')
+    sub.add_argument('db_location')
+    sub.add_argument('output_file')
+    _add_slurm_arguments(sub)
+    sub.add_argument('--submit', action='store_true', help="Submit the script and print its job ID.")
+
+    sub = add_command('submit-blast', 'hpcc_blast_job_submission', _run_submit_blast,
+                      "Submit the pending shards of a sharded BLAST search as a job array.")
+    sub.add_argument('shard_prefix')
+    sub.add_argument('n_shards', type=int)
+    sub.add_argument('db_location')
+    sub.add_argument('output_prefix')
+    _add_slurm_arguments(sub, time_required=False)
+    sub.add_argument('--max-concurrent', type=int, help="Array tasks running at once.")
+    sub.add_argument('--manifest', help="Shard manifest. Default: <output_prefix>_manifest.json")
+    sub.add_argument('--history', help="Job history used to fill in a missing --time or --memory.")
+    sub.add_argument('--margin', type=float, default=1.5, help="Safety factor on predicted resources. Default: 1.5")
+
+    sub = add_command('record-job', 'hpcc_blast_job_submission', _run_record_job,
+                      "Add finished BLAST job logs to a job history.")
+    sub.add_argument('history')
+    sub.add_argument('query_file')
+    sub.add_argument('db_location')
+    sub.add_argument('log_files', nargs='+')
+
+    # Arguments other than --profile are passed on to the benchmark runner (see benchmarks.main)
+    add_command('bench', 'benchmarks', _run_bench, "Run the benchmarks on synthetic inputs.")
+
+    return parser
+
+def main(argv=None):
+    """
+    Run the bioinformatics-scripts command.
+
+    Returns:
+        int: Exit status.
+    """
+    start = perf_counter()
+    parser = build_parser()
+    args, extra_args = parser.parse_known_args(argv)
+    if extra_args and args.command != 'bench':
+        parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
+    args.bench_args = extra_args
+    logging.basicConfig(level=logging.INFO)
+
+    profiler = Profiler(enabled=args.profile is not None)
+    args.exit_status = 0
+    try:
+        with profiler.stage('import'):
+            module = _module(args.module)
+        if getattr(args, 'blastp', False) is None:
+            args.blastp = module.BLASTP
+        input_files = args.run(module, args, profiler)
+    except (IOError, ValueError) as e:
+        logging.error("%s: %s", args.command, e)
+        return 1
+    finally:
+        profiler.restore()
+
+    if profiler.enabled:
+        import json
+        rows = sum(_count_lines(path) for path in input_files) if input_files else None
+        report = json.dumps(profiler.report(args.command, perf_counter() - start, rows), indent=2)
+        if args.profile == '-':
+            sys.stderr.write(report + '\n')
+        else:
+            with open(args.profile, 'w') as f:
+                f.write(report + '\n')
+    return args.exit_status
+
+if __name__ == "__main__":
+    sys.exit(main())
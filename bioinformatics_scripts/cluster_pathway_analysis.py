@@ -1,41 +1,339 @@
 import sys
 import os
+import gzip
+import json
+import hashlib
 import logging
-from typing import Dict, List
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
-def cluster_reader_dict_writer(file_path: str) -> Dict[str, List[str]]:
+import numpy as np
+
+TOTAL_GENES = 27680  # Total number of genes in Arabidopsis thaliana
+OUTPUT_BUFFER_SIZE = 1 << 20
+CACHE_MAX_BYTES = 1 << 30
+CACHE_INDEX = 'index.json'
+# Version of what read_clusters/read_pathways produce; bump it whenever their parsing or the cached
+# array layout changes so that entries written by older code are not served.
+CACHE_FORMAT_VERSION = 1
+PERMUTATION_BATCH_SIZE = 64  # permutations per worker task
+PERMUTATION_ROUND_BATCHES = 32  # tasks between early-stopping checks
+PERMUTATION_LOOKUP_LIMIT = 1 << 24  # largest pathway x cluster table indexed densely in each worker
+COUNT_BLOCK_CELLS = 1 << 20  # pathway x cluster cells whose nPC, PnC and nPnC are derived at once
+
+# Gene sets keyed to a cluster or pathway ID: gene name lists, or gene ID arrays from read_clusters/read_pathways.
+GeneSets = Union[Dict[str, List[str]], Dict[str, np.ndarray]]
+
+class GeneTable:
     """
-    Reads a file containing gene clusters and outputs a dictionary.
+    Interns gene identifiers (e.g. AT1G01010) into compact integer IDs.
+
+    One table is shared by the cluster and pathway readers so that their gene sets can be compared
+    as integer arrays.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.genes: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.genes)
+
+    def intern(self, gene: str) -> int:
+        """
+        Returns the integer ID of a gene, assigning the next free ID to unseen genes.
+        """
+        gene_id = self.ids.get(gene)
+        if gene_id is None:
+            gene_id = self.ids[gene] = len(self.genes)
+            self.genes.append(gene)
+        return gene_id
+
+    def names(self, gene_ids: np.ndarray) -> List[str]:
+        """
+        Returns the gene identifiers of an array of integer IDs.
+        """
+        return [self.genes[gene_id] for gene_id in gene_ids.tolist()]
+
+def _open_input(file_path: str) -> IO[str]:
+    """
+    Opens an input file for streaming, logging and re-raising IOError if it cannot be read.
+    """
+    try:
+        return open(file_path, 'r')
+    except IOError:
+        logging.error(f"File not found: {file_path}")
+        raise IOError(f"File not found: {file_path}")
+
+def _open_input_binary(file_path: str) -> IO[bytes]:
+    """
+    Binary counterpart of _open_input.
+    """
+    try:
+        return open(file_path, 'rb')
+    except IOError:
+        logging.error(f"File not found: {file_path}")
+        raise IOError(f"File not found: {file_path}")
+
+def _iter_cluster_records(file_path: str) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Streams (cluster ID, gene list) records from a clusters file, skipping the header line.
+    """
+    with _open_input(file_path) as file:
+        next(file, None)  # skip header
+        for line in file:
+            line = line.strip()
+            if line:
+                parts = line.split("\t")
+                if len(parts) < 2:
+                    raise ValueError(f"Invalid line format: {line}")
+                yield parts[0], parts[1].split(',')
+
+def _iter_pathway_records(file_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Streams (pathway ID, AGI gene) records from a pathways file, skipping the header line.
+
+    Gene IDs are preferred over gene names, version suffixes are dropped, and records whose gene is
+    not an AGI locus identifier are skipped.
+    """
+    with _open_input(file_path) as file:
+        next(file, None)  # skip header
+        for line in file:
+            line = line.strip()
+            if line:
+                parts = line.split("\t")
+                if len(parts) != 4:
+                    raise ValueError(f"Invalid line format: {line}")
+                gene_id = parts[3].split('.')[0].upper()
+                gene = gene_id if gene_id.startswith("AT") else parts[2].split('.')[0].upper()
+
+                if gene.startswith("AT") and gene[3:4] == 'G':  # AT1G01010, ATCG00010, ATMG00010
+                    yield parts[1], gene
+
+def read_clusters(file_path: str, gene_table: Optional[GeneTable] = None) -> Dict[str, np.ndarray]:
+    """
+    Reads a file containing gene clusters into sorted arrays of interned gene IDs.
 
     Args:
         file_path (str): Path to the input file containing clusters data.
+        gene_table (Optional[GeneTable]): Table to intern genes into. Pass the same table to read_pathways
+                                          so both files share gene IDs. Default is a new table.
 
     Returns:
-        Dict[str, List[str]]: A dictionary with cluster IDs as keys and lists of genes as values.
+        Dict[str, np.ndarray]: A dictionary with cluster IDs as keys and sorted, duplicate-free int32 arrays
+        of gene IDs as values.
+
+    Raises:
+        IOError: If the file cannot be read.
+        ValueError: If the file format is incorrect.
+    """
+    gene_table = GeneTable() if gene_table is None else gene_table
+    intern = gene_table.intern
+    cluster_dict = {}
+    for cluster_id, genes in _iter_cluster_records(file_path):
+        cluster_dict[cluster_id] = np.unique(np.fromiter(map(intern, genes), dtype=np.int32, count=len(genes)))
+
+    return cluster_dict
+
+def read_pathways(file_path: str, gene_table: Optional[GeneTable] = None) -> Dict[str, np.ndarray]:
+    """
+    Reads a file containing gene-pathway associations into sorted arrays of interned gene IDs.
+
+    Args:
+        file_path (str): Path to the input file containing pathways data.
+        gene_table (Optional[GeneTable]): Table to intern genes into. Pass the same table to read_clusters
+                                          so both files share gene IDs. Default is a new table.
+
+    Returns:
+        Dict[str, np.ndarray]: A dictionary with pathway IDs as keys and sorted, duplicate-free int32 arrays
+        of gene IDs as values.
 
     Raises:
         IOError: If the file cannot be read.
         ValueError: If the file format is incorrect.
     """
+    gene_table = GeneTable() if gene_table is None else gene_table
+    intern = gene_table.intern
+    pathway_genes = {}
+    for pathway_id, gene in _iter_pathway_records(file_path):
+        gene_ids = pathway_genes.get(pathway_id)
+        if gene_ids is None:
+            gene_ids = pathway_genes[pathway_id] = []
+        gene_ids.append(intern(gene))
+
+    return {pathway_id: np.unique(np.array(gene_ids, dtype=np.int32))
+            for pathway_id, gene_ids in pathway_genes.items()}
+
+def _cache_dir(cache_dir: Optional[str]) -> str:
+    """
+    Resolves and creates the parsed-input cache directory.
+    """
+    if cache_dir is None:
+        cache_root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(cache_root, 'bioinformatics_scripts')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def _file_digest(file_path: str) -> str:
+    """
+    Returns a hex digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with _open_input_binary(file_path) as file:
+        for block in iter(lambda: file.read(OUTPUT_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _load_cache_index(cache_dir: str) -> Dict[str, str]:
+    """
+    Loads the mapping of file path, size and mtime keys to cache entry names.
+    """
     try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-    except IOError:
+        with open(os.path.join(cache_dir, CACHE_INDEX), 'r') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+def _atomic_write(path: str, write: Callable[[IO[bytes]], None]) -> None:
+    """
+    Writes a file through a temporary file in the same directory, so readers never see a partial file.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            write(file)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def _save_cache_index(cache_dir: str, index: Dict[str, str]) -> None:
+    _atomic_write(os.path.join(cache_dir, CACHE_INDEX), lambda file: file.write(json.dumps(index).encode()))
+
+def _save_gene_sets(path: str, gene_sets: Dict[str, np.ndarray], gene_table: GeneTable) -> None:
+    """
+    Stores gene sets as flat numpy arrays: set IDs, set offsets, concatenated gene IDs and the gene table.
+    """
+    sizes = np.array([len(genes) for genes in gene_sets.values()], dtype=np.int64)
+    arrays = {
+        'set_ids': np.array(list(gene_sets), dtype=str),
+        'offsets': np.concatenate(([0], np.cumsum(sizes))),
+        'members': np.concatenate([np.zeros(0, dtype=np.int32)] + list(gene_sets.values())),
+        'genes': np.array(gene_table.genes, dtype=str),
+    }
+    _atomic_write(path, lambda file: np.savez(file, **arrays))
+
+def _load_gene_sets(path: str, gene_table: GeneTable) -> Dict[str, np.ndarray]:
+    """
+    Loads gene sets stored by _save_gene_sets, re-interning their genes into the caller's gene table.
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        set_ids, offsets, members, genes = arrays['set_ids'], arrays['offsets'], arrays['members'], arrays['genes']
+
+    remap = np.fromiter(map(gene_table.intern, genes.tolist()), dtype=np.int32, count=len(genes))
+    set_index = np.repeat(np.arange(len(set_ids)), np.diff(offsets))
+    members = remap[members]
+    members = members[np.lexsort((members, set_index))]
+    return dict(zip(set_ids.tolist(), np.split(members, offsets[1:-1])))
+
+def _evict_cache(cache_dir: str, index: Dict[str, str], max_cache_bytes: int) -> None:
+    """
+    Deletes the least recently used cache entries until the cache fits in max_cache_bytes.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, name in sorted(entries):
+        if total <= max_cache_bytes:
+            break
+        os.remove(os.path.join(cache_dir, name))
+        total -= size
+
+    existing = {name for name in os.listdir(cache_dir) if name.endswith('.npz')}
+    for stat_key in [key for key, entry in index.items() if entry not in existing]:
+        del index[stat_key]
+
+def cached_read(reader: Callable[[str, Optional[GeneTable]], Dict[str, np.ndarray]], file_path: str,
+                gene_table: Optional[GeneTable] = None, cache_dir: Optional[str] = None,
+                max_cache_bytes: int = CACHE_MAX_BYTES) -> Dict[str, np.ndarray]:
+    """
+    Reads a clusters or pathways file through a persistent on-disk cache of the parsed gene sets.
+
+    Cache entries are named by the reader, CACHE_FORMAT_VERSION and a hash of the file contents, and an index maps each
+    file's path, size and modification time to its content hash. An unchanged file is therefore
+    loaded without being parsed or even hashed, and a touched but identical file is only hashed.
+    Entries are stored as uncompressed .npz arrays and evicted least recently used first.
+
+    Args:
+        reader (Callable): read_clusters or read_pathways.
+        file_path (str): Path to the input file.
+        gene_table (Optional[GeneTable]): Table to intern genes into. Default is a new table.
+        cache_dir (Optional[str]): Cache directory. Default is $XDG_CACHE_HOME/bioinformatics_scripts.
+        max_cache_bytes (int): Total size the cache directory is trimmed to after adding an entry.
+
+    Returns:
+        Dict[str, np.ndarray]: The same gene sets the reader would return.
+
+    Raises:
+        IOError: If the file cannot be read.
+        ValueError: If the file format is incorrect.
+    """
+    gene_table = GeneTable() if gene_table is None else gene_table
+    cache_dir = _cache_dir(cache_dir)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
         logging.error(f"File not found: {file_path}")
         raise IOError(f"File not found: {file_path}")
 
-    cluster_dict = {}
-    for line in lines[1:]:  # skip header
-        line = line.strip()
-        if line:
-            parts = line.split("\t")
-            if len(parts) < 2:
-                raise ValueError(f"Invalid line format: {line}")
-            cluster_id = parts[0]
-            gene_list = parts[1].split(',')
-            cluster_dict[cluster_id] = gene_list
+    index = _load_cache_index(cache_dir)
+    reader_key = f'{reader.__name__}-v{CACHE_FORMAT_VERSION}'
+    stat_key = f'{reader_key}:{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    entry = index.get(stat_key)
+    if entry is not None and os.path.exists(os.path.join(cache_dir, entry)):
+        os.utime(os.path.join(cache_dir, entry))
+        return _load_gene_sets(os.path.join(cache_dir, entry), gene_table)
 
-    return cluster_dict
+    entry = f'{reader_key}-{_file_digest(file_path)}.npz'
+    entry_path = os.path.join(cache_dir, entry)
+    if os.path.exists(entry_path):
+        os.utime(entry_path)
+    else:
+        parsed_table = GeneTable()
+        _save_gene_sets(entry_path, reader(file_path, parsed_table), parsed_table)
+
+    file_prefix = stat_key.rsplit(':', 2)[0] + ':'
+    for old_key in [key for key in index if key.startswith(file_prefix)]:
+        del index[old_key]
+    index[stat_key] = entry
+    _evict_cache(cache_dir, index, max_cache_bytes)
+    _save_cache_index(cache_dir, index)
+    if not os.path.exists(entry_path):
+        # The entry alone is larger than the cache, so it was evicted straight away.
+        return reader(file_path, gene_table)
+    return _load_gene_sets(entry_path, gene_table)
+
+def cluster_reader_dict_writer(file_path: str) -> Dict[str, List[str]]:
+    """
+    Reads a file containing gene clusters and outputs a dictionary.
+
+    Args:
+        file_path (str): Path to the input file containing clusters data.
+
+    Returns:
+        Dict[str, List[str]]: A dictionary with cluster IDs as keys and lists of genes as values.
+
+    Raises:
+        IOError: If the file cannot be read.
+        ValueError: If the file format is incorrect.
+    """
+    return dict(_iter_cluster_records(file_path))
 
 def pathways_reader_dict_writer(file_path: str) -> Dict[str, List[str]]:
     """
@@ -51,65 +349,670 @@ def pathways_reader_dict_writer(file_path: str) -> Dict[str, List[str]]:
         IOError: If the file cannot be read.
         ValueError: If the file format is incorrect.
     """
-    try:
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-    except IOError:
-        logging.error(f"File not found: {file_path}")
-        raise IOError(f"File not found: {file_path}")
+    pathway_genes = {}
+    for pathway_id, gene in _iter_pathway_records(file_path):
+        genes = pathway_genes.get(pathway_id)
+        if genes is None:
+            genes = pathway_genes[pathway_id] = {}
+        genes[gene] = None  # insertion-ordered set
 
-    pathway_dict = {}
-    for line in lines[1:]:  # skip header
-        line = line.strip()
-        if line:
-            parts = line.split("\t")
-            if len(parts) != 4:
-                raise ValueError(f"Invalid line format: {line}")
-            pathway_id = parts[1]
-            gene_name = parts[2].split('.')[0].upper()
-            gene_id = parts[3].split('.')[0].upper()
-            gene = gene_id if gene_id.startswith("AT") else gene_name
+    return {pathway_id: list(genes) for pathway_id, genes in pathway_genes.items()}
 
-            if gene.startswith("AT") and gene[2] == 'G':
-                if pathway_id not in pathway_dict:
-                    pathway_dict[pathway_id] = []
-                if gene not in pathway_dict[pathway_id]:
-                    pathway_dict[pathway_id].append(gene)
+def _is_encoded(gene_sets: GeneSets) -> bool:
+    return any(isinstance(genes, np.ndarray) for genes in gene_sets.values())
 
-    return pathway_dict
+def _set_sizes(gene_sets: GeneSets) -> np.ndarray:
+    """
+    Returns the number of distinct genes in each set, so a gene listed twice is counted once
+    whether the sets are gene name lists or (already deduplicated) gene ID arrays.
+    """
+    if _is_encoded(gene_sets):
+        return np.array([len(genes) for genes in gene_sets.values()], dtype=np.int64)
+    return np.array([len(set(genes)) for genes in gene_sets.values()], dtype=np.int64)
 
-def cluster_pathway_comparisons(cluster_dict: Dict[str, List[str]], pathway_dict: Dict[str, List[str]]) -> None:
+def _membership(gene_sets: GeneSets, gene_index: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    Compares genes in pathways and clusters and writes the results to a file.
+    Encodes a dictionary of gene sets as a sparse incidence matrix in coordinate form.
 
     Args:
-        cluster_dict (Dict[str, List[str]]): Dictionary containing the cluster genes as values keyed to the cluster number.
-        pathway_dict (Dict[str, List[str]]): Dictionary containing the pathway genes as values keyed to the pathway ID.
+        gene_sets (GeneSets): Dictionary of gene lists, or of gene ID arrays from read_clusters/read_pathways,
+                              keyed to the set ID.
+        gene_index (Dict[str, int]): Shared gene-to-integer table, extended in place with unseen genes.
+                                     Unused for gene ID arrays.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Gene indices and set indices of every (gene, set)
+        membership, each gene counted once per set, and the number of distinct genes in each set.
     """
-    output_buffer = 'Pathway_cluster\tPC\tnPC\tPnC\tnPnC\n'
-    total_genes = 27680  # Total number of genes in Arabidopsis thaliana
+    if _is_encoded(gene_sets):
+        sizes = np.array([len(genes) for genes in gene_sets.values()], dtype=np.int64)
+        member_genes = np.concatenate(list(gene_sets.values())).astype(np.int64)
+        return member_genes, np.repeat(np.arange(len(sizes)), sizes), sizes
 
-    for pathway_id, pathway_genes in pathway_dict.items():
-        for cluster_id, cluster_genes in cluster_dict.items():
-            shared_genes = set(cluster_genes).intersection(pathway_genes)
-            pc = len(shared_genes)
-            npc = len(cluster_genes) - pc
-            pnc = len(pathway_genes) - pc
-            npnc = total_genes - pc - npc - pnc
+    member_genes = []
+    member_sets = []
+    sizes = np.empty(len(gene_sets), dtype=np.int64)
+    for set_index, genes in enumerate(gene_sets.values()):
+        encoded = {gene_index.setdefault(gene, len(gene_index)) for gene in genes}
+        member_genes.extend(encoded)
+        member_sets.extend([set_index] * len(encoded))
+        sizes[set_index] = len(encoded)
 
-            output_buffer += f'{pathway_id}_{cluster_id}\t{pc}\t{npc}\t{pnc}\t{npnc}\n'
+    return (np.array(member_genes, dtype=np.int64),
+            np.array(member_sets, dtype=np.int64),
+            sizes)
 
-    with open('pathway_counts.txt', 'w') as output_file:
-        output_file.write(output_buffer)
+def _cluster_gene_index(cluster_genes: np.ndarray, cluster_sets: np.ndarray,
+                        n_genes: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Groups cluster memberships by gene (a CSR view of the gene x cluster incidence matrix).
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        logging.error("Usage: cluster_pathway_analysis.py <clusters_file> <pathways_file>")
-        sys.exit(1)
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Cluster indices ordered by gene, the number of clusters
+        of each gene and the offset of each gene's clusters.
+    """
+    order = np.argsort(cluster_genes, kind='stable')
+    clusters_per_gene = np.bincount(cluster_genes, minlength=n_genes)
+    return cluster_sets[order], clusters_per_gene, np.cumsum(clusters_per_gene) - clusters_per_gene
+
+def _shared_gene_keys(cluster_index: Tuple[np.ndarray, np.ndarray, np.ndarray], n_clusters: int,
+                      pathway_genes: np.ndarray, pathway_sets: np.ndarray) -> np.ndarray:
+    """
+    Joins pathway memberships to the cluster memberships of the same gene.
+
+    The work is proportional to the number of (gene, pathway, cluster) triples rather than to
+    pathways x clusters.
+
+    Returns:
+        np.ndarray: One flat (pathway * n_clusters + cluster) index per shared gene.
+    """
+    clusters_by_gene, clusters_per_gene, gene_offsets = cluster_index
+    repeats = clusters_per_gene[pathway_genes]
+    rows = np.repeat(pathway_sets, repeats)
+    starts = np.repeat(gene_offsets[pathway_genes] - (np.cumsum(repeats) - repeats), repeats)
+    cols = clusters_by_gene[starts + np.arange(len(rows))]
+
+    return rows * n_clusters + cols
+
+def _shared_gene_counts(cluster_genes: np.ndarray, cluster_sets: np.ndarray, n_clusters: int,
+                        pathway_genes: np.ndarray, pathway_sets: np.ndarray, n_pathways: int,
+                        n_genes: int, dtype: type = np.int64) -> np.ndarray:
+    """
+    Multiplies the pathway and cluster incidence matrices to count the genes shared by every pair.
+
+    The counts are accumulated one block of pathways at a time, so only the result is held at full
+    size, in the given dtype.
+
+    Returns:
+        np.ndarray: A (pathways x clusters) matrix of shared gene counts.
+    """
+    cluster_index = _cluster_gene_index(cluster_genes, cluster_sets, n_genes)
+    counts = np.empty((n_pathways, n_clusters), dtype=dtype)
+    order = np.argsort(pathway_sets, kind='stable')
+    bounds = np.searchsorted(pathway_sets[order], np.arange(n_pathways + 1))
+    for block in _row_blocks(n_pathways, n_clusters):
+        members = order[bounds[block.start]:bounds[block.stop]]
+        keys = _shared_gene_keys(cluster_index, n_clusters, pathway_genes[members], pathway_sets[members] - block.start)
+        counts[block] = np.bincount(keys, minlength=(block.stop - block.start) * n_clusters).reshape(-1, n_clusters)
+    return counts
+
+def _encode(cluster_dict: GeneSets, pathway_dict: GeneSets) -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray],
+                                                                     Tuple[np.ndarray, np.ndarray, np.ndarray], int]:
+    """
+    Encodes clusters and pathways against one gene index.
+
+    Returns:
+        Tuple: The cluster and pathway memberships as returned by _membership, and the number of gene indices used.
+
+    Raises:
+        ValueError: If one dictionary holds gene ID arrays and the other gene name lists.
+    """
+    if cluster_dict and pathway_dict and _is_encoded(cluster_dict) != _is_encoded(pathway_dict):
+        raise ValueError("Clusters and pathways must both be gene name lists or both be gene ID arrays")
+
+    gene_index = {}
+    clusters = _membership(cluster_dict, gene_index)
+    pathways = _membership(pathway_dict, gene_index)
+    n_genes = max(len(gene_index), int(clusters[0].max(initial=-1)) + 1, int(pathways[0].max(initial=-1)) + 1)
+    return clusters, pathways, n_genes
+
+def _count_dtype(*bounds: int) -> type:
+    """
+    Returns int32 if every count bounded by the given sizes fits in it, else int64.
+    """
+    return np.int32 if max(bounds, default=0) < np.iinfo(np.int32).max else np.int64
+
+def _pathway_cluster_pc(cluster_dict: GeneSets, pathway_dict: GeneSets) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the (pathways x clusters) PC matrix and the distinct gene count of every cluster and pathway.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: PC, in int32 where the set sizes allow it, the cluster
+        sizes and the pathway sizes.
+    """
+    (cluster_genes, cluster_sets, cluster_sizes), (pathway_genes, pathway_sets, pathway_sizes), n_genes = \
+        _encode(cluster_dict, pathway_dict)
+    pc = _shared_gene_counts(cluster_genes, cluster_sets, len(cluster_dict), pathway_genes, pathway_sets,
+                             len(pathway_dict), n_genes,
+                             _count_dtype(cluster_sizes.max(initial=0), pathway_sizes.max(initial=0)))
+    return pc, cluster_sizes, pathway_sizes
+
+def _contingency(pc: np.ndarray, cluster_sizes: np.ndarray, pathway_sizes: np.ndarray,
+                 total_genes: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Derives the nPC, PnC and nPnC counts of a block of PC rows from the cluster and pathway sizes.
+
+    Args:
+        pc (np.ndarray): (pathways x clusters) PC counts, or a block of their rows.
+        cluster_sizes (np.ndarray): Distinct genes in every cluster.
+        pathway_sizes (np.ndarray): Distinct genes in the pathways of the rows of pc.
+        total_genes (int): Number of genes in the genome.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The PC, nPC, PnC and nPnC counts.
+    """
+    dtype = _count_dtype(total_genes, cluster_sizes.max(initial=0), pathway_sizes.max(initial=0))
+    pc = pc.astype(dtype, copy=False)
+    npc = cluster_sizes.astype(dtype)[np.newaxis, :] - pc
+    pnc = pathway_sizes.astype(dtype)[:, np.newaxis] - pc
+    npnc = dtype(total_genes) - pc - npc - pnc
+    return pc, npc, pnc, npnc
+
+def _row_blocks(n_rows: int, n_cols: int) -> Iterator[slice]:
+    """
+    Splits the rows of a (n_rows x n_cols) table into blocks of about COUNT_BLOCK_CELLS cells.
+    """
+    rows_per_block = max(COUNT_BLOCK_CELLS // max(n_cols, 1), 1)
+    for start in range(0, n_rows, rows_per_block):
+        yield slice(start, min(start + rows_per_block, n_rows))
+
+def pathway_cluster_counts(cluster_dict: GeneSets, pathway_dict: GeneSets,
+                           total_genes: int = TOTAL_GENES) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the 2x2 contingency counts for every pathway and cluster combination at once.
+
+    Genes are encoded as integer indices once, and the shared gene counts for all pairs come from a
+    single sparse product of the pathway and cluster incidence matrices. Both dictionaries hold either
+    lists of gene names or gene ID arrays interned into the same GeneTable.
+
+    Args:
+        cluster_dict (GeneSets): Dictionary containing the cluster genes as values keyed to the cluster number.
+        pathway_dict (GeneSets): Dictionary containing the pathway genes as values keyed to the pathway ID.
+        total_genes (int): Number of genes in the genome. Default is the Arabidopsis thaliana gene count.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The PC, nPC, PnC and nPnC matrices, each
+        shaped (pathways x clusters) in the iteration order of the input dictionaries.
+
+    Raises:
+        ValueError: If one dictionary holds gene ID arrays and the other gene name lists.
+    """
+    return _contingency(*_pathway_cluster_pc(cluster_dict, pathway_dict), total_genes)
+
+def _gene_set_digests(gene_sets: GeneSets, gene_table: Optional[GeneTable]) -> List[str]:
+    """
+    Returns a content digest of each gene set that does not depend on gene order, duplicates or interning.
 
-    clusters_file = sys.argv[1]
-    pathways_file = sys.argv[2]
+    Raises:
+        ValueError: If the gene sets are gene ID arrays and no gene table is given.
+    """
+    if _is_encoded(gene_sets) and gene_table is None:
+        raise ValueError("A gene table is required to digest gene ID arrays")
+
+    digests = []
+    for genes in gene_sets.values():
+        names = gene_table.names(genes) if isinstance(genes, np.ndarray) else genes
+        digests.append(hashlib.blake2b('\n'.join(sorted(set(names))).encode(), digest_size=16).hexdigest())
+    return digests
+
+def _load_count_store(store_path: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Loads the arrays of an incremental result store, or returns None if there is no store yet.
+    """
+    if not os.path.exists(store_path):
+        return None
+    with np.load(store_path, allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+def _reused_index(ids: List[str], digests: List[str], stored_ids: np.ndarray, stored_digests: np.ndarray) -> np.ndarray:
+    """
+    Maps each current set to its row in the store, or -1 if it is new or its genes changed.
+    """
+    stored = {set_id: (position, digest)
+              for position, (set_id, digest) in enumerate(zip(stored_ids.tolist(), stored_digests.tolist()))}
+    reused = np.full(len(ids), -1, dtype=np.int64)
+    for position, (set_id, digest) in enumerate(zip(ids, digests)):
+        stored_position, stored_digest = stored.get(set_id, (-1, None))
+        if stored_digest == digest:
+            reused[position] = stored_position
+    return reused
+
+def _incremental_pathway_cluster_pc(cluster_dict: GeneSets, pathway_dict: GeneSets, store_path: str,
+                                    gene_table: Optional[GeneTable]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the PC matrix and set sizes like _pathway_cluster_pc, reusing and updating the result store.
+    """
+    pathway_ids, cluster_ids = list(pathway_dict), list(cluster_dict)
+    pathway_digests = _gene_set_digests(pathway_dict, gene_table)
+    cluster_digests = _gene_set_digests(cluster_dict, gene_table)
+    cluster_sizes = _set_sizes(cluster_dict)
+    pathway_sizes = _set_sizes(pathway_dict)
+    pc = np.zeros((len(pathway_ids), len(cluster_ids)),
+                  dtype=_count_dtype(cluster_sizes.max(initial=0), pathway_sizes.max(initial=0)))
+
+    stored = _load_count_store(store_path)
+    if stored is None:
+        reused_rows = np.full(len(pathway_ids), -1, dtype=np.int64)
+        reused_cols = np.full(len(cluster_ids), -1, dtype=np.int64)
+    else:
+        reused_rows = _reused_index(pathway_ids, pathway_digests, stored['pathway_ids'], stored['pathway_digests'])
+        reused_cols = _reused_index(cluster_ids, cluster_digests, stored['cluster_ids'], stored['cluster_digests'])
+        new_rows = np.full(len(stored['pathway_ids']), -1, dtype=np.int64)
+        new_cols = np.full(len(stored['cluster_ids']), -1, dtype=np.int64)
+        new_rows[reused_rows[reused_rows >= 0]] = np.flatnonzero(reused_rows >= 0)
+        new_cols[reused_cols[reused_cols >= 0]] = np.flatnonzero(reused_cols >= 0)
+        rows, cols = new_rows[stored['pc_rows']], new_cols[stored['pc_cols']]
+        kept = (rows >= 0) & (cols >= 0)
+        pc[rows[kept], cols[kept]] = stored['pc_values'][kept]
+
+    changed_rows, kept_rows = np.flatnonzero(reused_rows < 0), np.flatnonzero(reused_rows >= 0)
+    changed_cols = np.flatnonzero(reused_cols < 0)
+    if changed_rows.size:
+        changed_pathways = {pathway_ids[row]: pathway_dict[pathway_ids[row]] for row in changed_rows.tolist()}
+        pc[changed_rows] = _pathway_cluster_pc(cluster_dict, changed_pathways)[0]
+    if changed_cols.size and kept_rows.size:
+        kept_pathways = {pathway_ids[row]: pathway_dict[pathway_ids[row]] for row in kept_rows.tolist()}
+        changed_clusters = {cluster_ids[col]: cluster_dict[cluster_ids[col]] for col in changed_cols.tolist()}
+        pc[np.ix_(kept_rows, changed_cols)] = _pathway_cluster_pc(changed_clusters, kept_pathways)[0]
+    logging.info("Recomputed %d of %d pathways and %d of %d clusters",
+                 changed_rows.size, len(pathway_ids), changed_cols.size, len(cluster_ids))
+
+    pc_rows, pc_cols = np.nonzero(pc)
+    arrays = {
+        'pathway_ids': np.array(pathway_ids, dtype=str),
+        'cluster_ids': np.array(cluster_ids, dtype=str),
+        'pathway_digests': np.array(pathway_digests, dtype=str),
+        'cluster_digests': np.array(cluster_digests, dtype=str),
+        'pc_rows': pc_rows.astype(np.int32),
+        'pc_cols': pc_cols.astype(np.int32),
+        'pc_values': pc[pc_rows, pc_cols].astype(np.int32),
+    }
+    _atomic_write(store_path, lambda file: np.savez(file, **arrays))
+
+    return pc, cluster_sizes, pathway_sizes
+
+def incremental_pathway_cluster_counts(cluster_dict: GeneSets, pathway_dict: GeneSets, store_path: str,
+                                       gene_table: Optional[GeneTable] = None,
+                                       total_genes: int = TOTAL_GENES) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the same counts as pathway_cluster_counts, reusing PC counts persisted by a previous run.
 
-    c_dict = cluster_reader_dict_writer(clusters_file)
-    p_dict = pathways_reader_dict_writer(pathways_file)
-    cluster_pathway_comparisons(c_dict, p_dict)
\ No newline at end of file
+    The store keeps the non-zero PC cells together with the IDs and content digests of every pathway
+    and cluster. On a rerun, PC is only recomputed for pathways or clusters that are new or whose genes
+    changed; all other cells are copied from the store, which is then updated.
+
+    Args:
+        cluster_dict (GeneSets): Dictionary containing the cluster genes as values keyed to the cluster number.
+        pathway_dict (GeneSets): Dictionary containing the pathway genes as values keyed to the pathway ID.
+        store_path (str): Path of the .npz result store. It is created if it does not exist.
+        gene_table (Optional[GeneTable]): Gene table of gene ID array inputs. Not needed for gene name lists.
+        total_genes (int): Number of genes in the genome. Default is the Arabidopsis thaliana gene count.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The PC, nPC, PnC and nPnC matrices.
+
+    Raises:
+        ValueError: If the inputs are gene ID arrays and no gene table is given.
+    """
+    return _contingency(*_incremental_pathway_cluster_pc(cluster_dict, pathway_dict, store_path, gene_table),
+                        total_genes)
+
+def _log_factorials(n: int) -> np.ndarray:
+    """
+    Returns a table of log(k!) for k = 0..n.
+    """
+    table = np.zeros(n + 1)
+    np.cumsum(np.log(np.arange(1, n + 1)), out=table[1:])
+    return table
+
+def hypergeometric_pvalues(pc: np.ndarray, npc: np.ndarray, pnc: np.ndarray, npnc: np.ndarray) -> np.ndarray:
+    """
+    Computes one-sided hypergeometric p-values for over-representation of pathway genes in clusters.
+
+    The p-value of each row is P(X >= PC), where X is the overlap of a random cluster of the same size
+    with the pathway. The upper tail is summed in log space from a log-factorial table sized to the gene
+    universe, one tail offset at a time across all rows, so there is no per-row Python loop.
+
+    Args:
+        pc, npc, pnc, npnc (np.ndarray): Contingency counts of equal shape, as returned by pathway_cluster_counts.
+
+    Returns:
+        np.ndarray: P-values with the same shape as the counts.
+
+    Raises:
+        ValueError: If any of the counts is negative.
+    """
+    shape = np.shape(pc)
+    pc, npc, pnc, npnc = (np.asarray(counts, dtype=np.int64).ravel() for counts in (pc, npc, pnc, npnc))
+    if pc.size and min(pc.min(), npc.min(), pnc.min(), npnc.min()) < 0:
+        raise ValueError("Contingency counts must be non-negative")
+
+    pvalues = np.ones(pc.shape)
+    rows = np.flatnonzero(pc)
+    if rows.size == 0:
+        return pvalues.reshape(shape)
+
+    total = pc[rows] + npc[rows] + pnc[rows] + npnc[rows]
+    pathway_size = pc[rows] + pnc[rows]
+    cluster_size = pc[rows] + npc[rows]
+    log_fact = _log_factorials(int(total.max()))
+
+    def log_pmf(k, rows):
+        n, big_k, size = total[rows], pathway_size[rows], cluster_size[rows]
+        return (log_fact[big_k] - log_fact[k] - log_fact[big_k - k]
+                + log_fact[n - big_k] - log_fact[size - k] - log_fact[n - big_k - size + k]
+                - log_fact[n] + log_fact[size] + log_fact[n - size])
+
+    upper = np.minimum(pathway_size, cluster_size)
+    mode = (cluster_size + 1) * (pathway_size + 1) // (total + 2)
+
+    # Running log-sum-exp of the tail terms for the rows still being summed.
+    active = np.arange(rows.size)
+    k = pc[rows]
+    log_max = log_pmf(k, active)
+    scaled_sum = np.ones(rows.size)
+    while True:
+        k = k + 1
+        keep = k <= upper[active]
+        active, k = active[keep], k[keep]
+        if active.size == 0:
+            break
+        log_term = log_pmf(k, active)
+        new_max = np.maximum(log_max[active], log_term)
+        scaled_sum[active] = (scaled_sum[active] * np.exp(log_max[active] - new_max)
+                              + np.exp(log_term - new_max))
+        log_max[active] = new_max
+        # Past the mode the terms only shrink, so stop once they no longer change the sum.
+        keep = (k <= mode[active]) | (log_term - log_max[active] - np.log(scaled_sum[active]) > -40)
+        active, k = active[keep], k[keep]
+
+    pvalues[rows] = np.minimum(np.exp(log_max + np.log(scaled_sum)), 1.0)
+    return pvalues.reshape(shape)
+
+def benjamini_hochberg(pvalues: np.ndarray) -> np.ndarray:
+    """
+    Applies the Benjamini-Hochberg false discovery rate correction.
+
+    Args:
+        pvalues (np.ndarray): P-values of every tested row, in any shape.
+
+    Returns:
+        np.ndarray: Adjusted p-values (q-values) with the same shape as the input.
+    """
+    flat = np.asarray(pvalues, dtype=float).ravel()
+    order = np.argsort(flat, kind='stable')
+    ranked = flat[order] * flat.size / np.arange(1, flat.size + 1)
+    adjusted = np.empty_like(flat)
+    adjusted[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return adjusted.reshape(np.shape(pvalues))
+
+def _permutation_batch(task: Tuple) -> np.ndarray:
+    """
+    Runs one batch of cluster-label permutations and counts, per tested cell, how often the permuted
+    PC count reaches the observed one.
+
+    Relabelling cluster genes by a random permutation leaves the same overlaps as relabelling pathway
+    genes by its (equally random) inverse, so the cluster side of the join is indexed once and only
+    pathway genes are remapped.
+    Each batch draws from its own seed sequence, so results do not depend on which worker runs it.
+    """
+    (cluster_genes, cluster_sets, n_clusters, pathway_genes, pathway_sets,
+     universe, cells, observed, seed, batch_index, n_permutations) = task
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(batch_index,)))
+    cluster_index = _cluster_gene_index(cluster_genes, cluster_sets, universe)
+    n_keys = (int(pathway_sets.max(initial=-1)) + 1) * n_clusters
+    lookup = None
+    if n_keys <= PERMUTATION_LOOKUP_LIMIT:
+        lookup = np.full(n_keys, len(cells), dtype=np.int64)
+        lookup[cells] = np.arange(len(cells))
+
+    hits = np.zeros(len(cells), dtype=np.int64)
+    for _ in range(n_permutations):
+        keys = _shared_gene_keys(cluster_index, n_clusters, rng.permutation(universe)[pathway_genes], pathway_sets)
+        if lookup is not None:
+            counts = np.bincount(lookup[keys], minlength=len(cells) + 1)[:-1]
+        else:
+            positions = np.minimum(np.searchsorted(cells, keys), len(cells) - 1)
+            counts = np.bincount(positions[cells[positions] == keys], minlength=len(cells))
+        hits += counts >= observed
+    return hits
+
+def permutation_pvalues(cluster_dict: GeneSets, pathway_dict: GeneSets, n_permutations: int = 10000,
+                        seed: int = 0, processes: Optional[int] = None, early_stop_hits: int = 50,
+                        total_genes: int = TOTAL_GENES) -> np.ndarray:
+    """
+    Computes empirical p-values for the PC counts by permuting gene-to-cluster assignments.
+
+    Every permutation relabels the genes of the universe at random, which keeps cluster sizes and
+    overlaps intact, and recomputes the PC counts of the tested cells with the incidence join.
+    Permutations run in fixed-size batches on a process pool, each batch seeded from (seed, batch
+    number), so results are reproducible for any number of processes. Cells stop being permuted once
+    they have been matched early_stop_hits times (Besag-Clifford sequential stopping), since their
+    p-value is then clearly non-significant.
+
+    Args:
+        cluster_dict (GeneSets): Dictionary containing the cluster genes as values keyed to the cluster number.
+        pathway_dict (GeneSets): Dictionary containing the pathway genes as values keyed to the pathway ID.
+        n_permutations (int): Maximum number of permutations per cell. Default is 10000.
+        seed (int): Seed of the permutation stream. Default is 0.
+        processes (Optional[int]): Number of worker processes. Default is the number of CPUs; 1 runs in-process.
+        early_stop_hits (int): Number of permutations reaching the observed PC after which a cell stops.
+        total_genes (int): Number of genes in the genome. Default is the Arabidopsis thaliana gene count.
+
+    Returns:
+        np.ndarray: (pathways x clusters) empirical p-values. Cells without shared genes get 1.
+    """
+    (cluster_genes, cluster_sets, _), (pathway_genes, pathway_sets, _), n_genes = _encode(cluster_dict, pathway_dict)
+    n_clusters, n_pathways = len(cluster_dict), len(pathway_dict)
+    universe = max(total_genes, n_genes)
+
+    observed = _shared_gene_counts(cluster_genes, cluster_sets, n_clusters,
+                                   pathway_genes, pathway_sets, n_pathways, n_genes).ravel()
+    cells = np.flatnonzero(observed)
+    hits = np.zeros(len(cells), dtype=np.int64)
+    done = np.zeros(len(cells), dtype=np.int64)
+    active = np.ones(len(cells), dtype=bool)
+
+    batch_sizes = [min(PERMUTATION_BATCH_SIZE, n_permutations - start)
+                   for start in range(0, n_permutations, PERMUTATION_BATCH_SIZE)]
+    processes = processes or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    try:
+        for round_start in range(0, len(batch_sizes), PERMUTATION_ROUND_BATCHES):
+            tested = np.flatnonzero(active)
+            if tested.size == 0:
+                break
+            tested_pathways = np.isin(pathway_sets, np.unique(cells[tested] // max(n_clusters, 1)))
+            rounds = range(round_start, min(round_start + PERMUTATION_ROUND_BATCHES, len(batch_sizes)))
+            tasks = [(cluster_genes, cluster_sets, n_clusters, pathway_genes[tested_pathways],
+                      pathway_sets[tested_pathways], universe, cells[tested], observed[cells[tested]],
+                      seed, batch_index, batch_sizes[batch_index]) for batch_index in rounds]
+            for batch_hits in (pool.map(_permutation_batch, tasks) if pool else map(_permutation_batch, tasks)):
+                hits[tested] += batch_hits
+            done[tested] += sum(batch_sizes[batch_index] for batch_index in rounds)
+            active[tested] = hits[tested] < early_stop_hits
+    finally:
+        if pool:
+            pool.shutdown()
+
+    pvalues = np.ones(n_pathways * n_clusters)
+    pvalues[cells] = np.where(active, (hits + 1) / (done + 1), hits / np.maximum(done, 1))
+    return pvalues.reshape(n_pathways, n_clusters)
+
+def _row_template(cluster_ids: List[str]) -> str:
+    """
+    Builds a %-format template for one pathway's block of output lines.
+
+    Each line has a NUL placeholder for the pathway ID and a single %s field for its counts, so a
+    whole block is rendered by one C-level formatting call instead of one f-string per line.
+    """
+    return ''.join(f'\0_{cluster_id.replace("%", "%%")}\t%s\n' for cluster_id in cluster_ids)
+
+def _count_fields(col: int, pc: np.ndarray, npc: np.ndarray, pnc: np.ndarray, npnc: np.ndarray,
+                  columns: List[np.ndarray]) -> str:
+    """
+    Formats the tab-separated count (and optional p-value) fields of one output line.
+    """
+    fields = f'{pc[col]}\t{npc[col]}\t{pnc[col]}\t{npnc[col]}'
+    for values in columns:
+        fields += f'\t{values[col]:.6g}'
+    return fields
+
+def _format_pathway_row(template: str, pathway_id: str, pc: np.ndarray, npc: np.ndarray,
+                        pnc: np.ndarray, npnc: np.ndarray, cluster_sizes: np.ndarray,
+                        distinct_sizes: List[int], columns: List[np.ndarray]) -> str:
+    """
+    Renders the output lines of one pathway against every cluster.
+
+    Clusters that share no genes with the pathway only differ by cluster size, so their count fields
+    are formatted once per distinct size and the few overlapping clusters are patched in afterwards.
+    Extra p-value columns are 1 on rows without overlap.
+    """
+    pathway_size = int(pc[0] + pnc[0])
+    total_genes = int(pc[0] + npc[0] + pnc[0] + npnc[0])
+    zero_suffix = '\t1' * len(columns)
+    zero_fields = np.empty(max(distinct_sizes, default=0) + 1, dtype=object)
+    for size in distinct_sizes:
+        zero_fields[size] = f'0\t{size}\t{pathway_size}\t{total_genes - size - pathway_size}{zero_suffix}'
+
+    fields = zero_fields[cluster_sizes].tolist()
+    for col in np.flatnonzero(pc).tolist():
+        fields[col] = _count_fields(col, pc, npc, pnc, npnc, columns)
+
+    return template.replace('\0', pathway_id.replace('%', '%%')) % tuple(fields)
+
+@contextmanager
+def _open_output(output_file: Union[str, IO[str]], gzip_output: Optional[bool]) -> Iterator[IO[str]]:
+    """
+    Opens an output path for buffered text writing, or passes an open file object through unchanged.
+
+    Paths ending in '.gz' are gzip-compressed unless gzip_output says otherwise.
+    """
+    if not isinstance(output_file, (str, os.PathLike)):
+        yield output_file
+        return
+
+    if gzip_output is None:
+        gzip_output = os.fspath(output_file).endswith('.gz')
+    try:
+        if gzip_output:
+            handle = gzip.open(output_file, 'wt', compresslevel=6)
+        else:
+            handle = open(output_file, 'w', buffering=OUTPUT_BUFFER_SIZE)
+    except IOError:
+        logging.error(f"Cannot write output file: {output_file}")
+        raise IOError(f"Cannot write output file: {output_file}")
+    with handle:
+        yield handle
+
+def write_pathway_counts(output_file: Union[str, IO[str]], pathway_ids: List[str], cluster_ids: List[str],
+                         pc: np.ndarray, cluster_sizes: np.ndarray, pathway_sizes: np.ndarray,
+                         total_genes: int = TOTAL_GENES, columns: Optional[Dict[str, np.ndarray]] = None,
+                         min_pc: int = 0, gzip_output: Optional[bool] = None) -> None:
+    """
+    Streams a pathway x cluster contingency table to a file, one pathway block at a time.
+
+    Only the PC matrix is held whole; the nPC, PnC and nPnC counts are derived from the cluster and
+    pathway sizes for one block of rows at a time as the table is written.
+
+    Args:
+        output_file (Union[str, IO[str]]): Output path, or a text file object opened for writing.
+        pathway_ids (List[str]): Pathway IDs in row order of the PC matrix.
+        cluster_ids (List[str]): Cluster IDs in column order of the PC matrix.
+        pc (np.ndarray): (pathways x clusters) counts of shared genes.
+        cluster_sizes (np.ndarray): Distinct genes in every cluster.
+        pathway_sizes (np.ndarray): Distinct genes in every pathway.
+        total_genes (int): Number of genes in the genome. Default is the Arabidopsis thaliana gene count.
+        columns (Optional[Dict[str, np.ndarray]]): Extra (pathways x clusters) p-value columns to append, keyed
+                                                   to their header. Their value must be 1 wherever PC is 0.
+        min_pc (int): Rows with fewer shared genes than this are not written. Default is 0 (write all rows).
+        gzip_output (Optional[bool]): Compress the output with gzip. Default is to compress paths ending in '.gz'.
+    """
+    columns = columns or {}
+    header = '\t'.join(['Pathway_cluster', 'PC', 'nPC', 'PnC', 'nPnC'] + list(columns)) + '\n'
+    template = _row_template(cluster_ids) if min_pc <= 0 else None
+    distinct_sizes = np.unique(cluster_sizes).tolist()
+
+    with _open_output(output_file, gzip_output) as output:
+        output.write(header)
+        if not cluster_ids:
+            return
+        for block in _row_blocks(len(pathway_ids), len(cluster_ids)):
+            counts = _contingency(pc[block], cluster_sizes, pathway_sizes[block], total_genes)
+            for offset, pathway_id in enumerate(pathway_ids[block]):
+                row = block.start + offset
+                row_pc, row_npc, row_pnc, row_npnc = (matrix[offset] for matrix in counts)
+                row_columns = [values[row] for values in columns.values()]
+                if template is not None:
+                    output.write(_format_pathway_row(template, pathway_id, row_pc, row_npc, row_pnc, row_npnc,
+                                                     cluster_sizes, distinct_sizes, row_columns))
+                else:
+                    output.write(''.join(
+                        f'{pathway_id}_{cluster_ids[col]}\t'
+                        f'{_count_fields(col, row_pc, row_npc, row_pnc, row_npnc, row_columns)}\n'
+                        for col in np.flatnonzero(row_pc >= min_pc).tolist()
+                    ))
+
+def cluster_pathway_comparisons(cluster_dict: GeneSets, pathway_dict: GeneSets,
+                                output_file: Union[str, IO[str]] = 'pathway_counts.txt', *,
+                                enrichment: bool = False, permutations: int = 0, seed: int = 0,
+                                processes: Optional[int] = None, total_genes: int = TOTAL_GENES,
+                                min_pc: int = 0, gzip_output: Optional[bool] = None,
+                                store: Optional[str] = None, gene_table: Optional[GeneTable] = None) -> None:
+    """
+    Compares genes in pathways and clusters and writes the results to a file.
+
+    Args:
+        cluster_dict (GeneSets): Dictionary containing the cluster genes as values keyed to the cluster number.
+        pathway_dict (GeneSets): Dictionary containing the pathway genes as values keyed to the pathway ID.
+        output_file (Union[str, IO[str]]): Output path or text file object. Default is 'pathway_counts.txt'.
+        enrichment (bool): If True, also writes one-sided hypergeometric p-values and Benjamini-Hochberg
+                           q-values for every row. Default is False.
+        permutations (int): If non-zero, also writes empirical p-values from this many cluster-label
+                            permutations (see permutation_pvalues). Default is 0.
+        seed (int): Seed of the permutation stream. Default is 0.
+        processes (Optional[int]): Worker processes for the permutations. Default is the number of CPUs.
+        total_genes (int): Number of genes in the genome. Default is the Arabidopsis thaliana gene count.
+        min_pc (int): Rows with fewer shared genes than this are not written. q-values are still
+                      corrected over all rows. Default is 0 (write all rows).
+        gzip_output (Optional[bool]): Compress the output with gzip. Default is to compress paths ending in '.gz'.
+        store (Optional[str]): Path of an incremental result store. If given, only pathways and clusters
+                               that changed since the store was written are recomputed
+                               (see incremental_pathway_cluster_counts).
+        gene_table (Optional[GeneTable]): Gene table of gene ID array inputs, needed with store.
+    """
+    if store is not None:
+        pc, cluster_sizes, pathway_sizes = _incremental_pathway_cluster_pc(cluster_dict, pathway_dict, store,
+                                                                           gene_table)
+    else:
+        pc, cluster_sizes, pathway_sizes = _pathway_cluster_pc(cluster_dict, pathway_dict)
+    columns = {}
+    if enrichment:
+        pvalues = np.ones(pc.shape)
+        for block in _row_blocks(*pc.shape):
+            pvalues[block] = hypergeometric_pvalues(*_contingency(pc[block], cluster_sizes, pathway_sizes[block],
+                                                                  total_genes))
+        columns['p_value'] = pvalues
+        columns['q_value'] = benjamini_hochberg(columns['p_value'])
+    if permutations:
+        columns['empirical_p'] = permutation_pvalues(cluster_dict, pathway_dict, permutations, seed,
+                                                     processes, total_genes=total_genes)
+
+    write_pathway_counts(output_file, list(pathway_dict), list(cluster_dict), pc, cluster_sizes, pathway_sizes,
+                         total_genes, columns, min_pc=min_pc, gzip_output=gzip_output)
+
+if __name__ == "__main__":
+    # Same as: bioinformatics-scripts pathways <clusters_file> <pathways_file> [options]
+    from importlib import import_module
+    cli = import_module(f'{__package__}.cli' if __package__ else 'cli')
+    sys.exit(cli.main(['pathways'] + sys.argv[1:]))
\ No newline at end of file
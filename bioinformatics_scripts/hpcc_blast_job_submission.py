@@ -1,4 +1,28 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import re
 import subprocess
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter, sleep
+
+import numpy as np
+
+# Default location of the blastp executable used in the job scripts
+BLASTP = '~/bin/myblast/bin/blastp'
+
+# GNU time, which the job scripts run blastp under so the log records its peak
+# memory; they fall back to bash's time keyword (wall time only) without it
+GNU_TIME = '/usr/bin/time'
+
+# Search parameters shared by the job scripts; part of each shard's input digest
+BLAST_PARAMETERS = '-task blastp -evalue 1e-10 -seg yes -word_size 3'
 
 # Template SLURM script
 slurm_script_template = '''#!/bin/bash
@@ -11,17 +35,29 @@ slurm_script_template = '''#!/bin/bash
 
 ########## Command Lines to Run ##########
 
-### call your executable
+### call your executable, under GNU time -v for its peak memory if installed
+
+timed() {{ if [ -x {gnu_time} ]; then {gnu_time} -v "$@"; else time "$@"; fi; }}
+
+timed {blastp} -query {query_file} {blast_parameters} \
+-db {db_location} -out {output_file} -outfmt 6
+blast_status=$?
+
+### mark the output complete with its size (see ShardManifest)
 
-time ~/bin/myblast/bin/blastp -query {query_file} -task blastp \
--evalue 1e-10 -seg yes -word_size 3 -db {db_location} -out {output_file} -outfmt 6
+[ $blast_status -eq 0 ] && wc -c < {output_file} > {output_file}.done
 
 ### write job information to output file
 
 scontrol show job $SLURM_JOB_ID
+
+### report the BLAST exit status as the job's
+
+exit $blast_status
 '''
 
-def generate_slurm_script(time, ntasks, cpus_per_task, memory, your_name, query_file, db_location, output_file):
+def generate_slurm_script(time, ntasks, cpus_per_task, memory, your_name, query_file, db_location, output_file,
+                          blastp=BLASTP, gnu_time=GNU_TIME):
     """
     Generate a SLURM script with specified parameters.
     
@@ -34,6 +70,8 @@ def generate_slurm_script(time, ntasks, cpus_per_task, memory, your_name, query_
     - query_file (str): Location of the query fasta file.
     - db_location (str): Location of the protein database.
     - output_file (str): Output file name for BLAST results.
+    - blastp (str): Location of the blastp executable.
+    - gnu_time (str): Location of GNU time, used to record blastp's peak memory.
     
     Returns:
     - str: Generated SLURM script as a string.
@@ -48,27 +86,603 @@ def generate_slurm_script(time, ntasks, cpus_per_task, memory, your_name, query_
         job_name=job_name,
         query_file=query_file,
         db_location=db_location,
-        output_file=output_file
+        output_file=output_file,
+        blastp=blastp,
+        gnu_time=gnu_time,
+        blast_parameters=BLAST_PARAMETERS
     )
     return slurm_script
 
-def submit_slurm_job(slurm_script):
+# Template SLURM job-array script: task $SLURM_ARRAY_TASK_ID searches query shard
+# {shard_prefix}_<task>.fa and writes {output_prefix}_<task>.tsv
+slurm_array_script_template = '''#!/bin/bash
+
+#SBATCH --time={time}       # how long each array task will run (hh:mm:ss, or -t)
+#SBATCH --ntasks={ntasks}   # how many nodes that you require (or -n)
+#SBATCH --cpus-per-task={cpus_per_task}   # number of CPUs (or cores) per task (or -c)
+#SBATCH --mem={memory}      # memory required/node (in bytes)
+#SBATCH --job-name={job_name}    # job name for easier identification (or -J)
+#SBATCH --array={array}     # one array task per query shard
+
+########## Command Lines to Run ##########
+
+### call your executable on this task's shard, under GNU time -v for its peak memory if installed
+
+timed() {{ if [ -x {gnu_time} ]; then {gnu_time} -v "$@"; else time "$@"; fi; }}
+
+timed {blastp} -query {shard_prefix}_${{SLURM_ARRAY_TASK_ID}}.fa {blast_parameters} \
+-db {db_location} -out {output_prefix}_${{SLURM_ARRAY_TASK_ID}}.tsv -outfmt 6 \
+-num_threads {cpus_per_task}
+blast_status=$?
+
+### mark the output complete with its size (see ShardManifest)
+
+[ $blast_status -eq 0 ] && wc -c < {output_prefix}_${{SLURM_ARRAY_TASK_ID}}.tsv > {output_prefix}_${{SLURM_ARRAY_TASK_ID}}.tsv.done
+
+### write job information to output file
+
+scontrol show job $SLURM_JOB_ID
+
+### report the BLAST exit status as the task's
+
+exit $blast_status
+'''
+
+def _fasta_records(fasta_file):
+    """
+    Stream (header line, sequence lines, residue count) records from a FASTA file.
+    """
+    header, lines, residues = None, [], 0
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                if header is not None:
+                    yield header, lines, residues
+                header, lines, residues = line, [], 0
+            elif header is not None:
+                lines.append(line)
+                residues += len(line.strip())
+    if header is not None:
+        yield header, lines, residues
+
+def shard_fasta(query_file, n_shards, output_dir='.', shard_prefix='shard'):
+    """
+    Split a query FASTA file into shards with balanced total residue counts.
+
+    BLAST run time grows with the number of query residues, not sequences, so
+    shards are balanced on residues. The file is streamed twice: once to total
+    the residues and once to write each record to the shard its residue
+    midpoint falls in. Shards are contiguous runs of the input, so their
+    concatenation keeps the original query order, and each shard is within one
+    sequence's length of total_residues / n_shards.
+
+    Parameters:
+    - query_file (str): Location of the query fasta file.
+    - n_shards (int): Number of shards; capped at the number of sequences.
+    - output_dir (str): Directory where the shards will be written.
+    - shard_prefix (str): Shard i is written to <output_dir>/<shard_prefix>_<i>.fa.
+
+    Returns:
+    - list: Paths of the shard files, in order.
+
+    Raises:
+    - ValueError: If n_shards is below 1 or the file holds no sequences.
+    """
+    if n_shards < 1:
+        raise ValueError(f"Invalid number of shards: {n_shards}")
+
+    n_records, total_residues = 0, 0
+    for _, _, residues in _fasta_records(query_file):
+        n_records += 1
+        total_residues += residues
+    if n_records == 0:
+        raise ValueError(f"No sequences in FASTA file: {query_file}")
+    n_shards = min(n_shards, n_records)
+
+    shard_files = [os.path.join(output_dir, f"{shard_prefix}_{i}.fa") for i in range(n_shards)]
+    shards = [open(shard_file, 'w') for shard_file in shard_files]
+    try:
+        position, shard = 0, -1
+        for index, (header, lines, residues) in enumerate(_fasta_records(query_file)):
+            if total_residues:
+                target = (2 * position + residues) * n_shards // (2 * total_residues)
+            else:
+                target = index * n_shards // n_records
+            # Keep every shard non-empty: never skip a shard, and never leave
+            # fewer records than shards still to fill.
+            shard = min(max(target, n_shards - (n_records - index)), shard + 1, n_shards - 1)
+            shards[shard].write(header)
+            shards[shard].writelines(lines)
+            position += residues
+    finally:
+        for f in shards:
+            f.close()
+    return shard_files
+
+def generate_slurm_array_script(time, ntasks, cpus_per_task, memory, your_name, shard_prefix, n_shards,
+                                db_location, output_prefix, max_concurrent=None, blastp=BLASTP, task_ids=None,
+                                gnu_time=GNU_TIME):
+    """
+    Generate a SLURM job-array script that runs BLAST on each query shard.
+
+    Array task i searches <shard_prefix>_i.fa (as written by shard_fasta) with
+    -num_threads set to cpus_per_task and writes <output_prefix>_i.tsv.
+
+    Parameters:
+    - time (str): Time duration for each array task (hh:mm:ss).
+    - ntasks (int): Number of nodes required.
+    - cpus_per_task (int): Number of CPUs (or cores) per task, also used as BLAST's -num_threads.
+    - memory (str): Memory required per node (in bytes).
+    - your_name (str): Name to incorporate into job name.
+    - shard_prefix (str): Path prefix of the query shards.
+    - n_shards (int): Number of shards, i.e. array tasks.
+    - db_location (str): Location of the protein database.
+    - output_prefix (str): Path prefix of the per-shard BLAST results.
+    - max_concurrent (int): Maximum number of array tasks running at once (None for no limit).
+    - blastp (str): Location of the blastp executable.
+    - task_ids (list): Run only these shards (e.g. from pending_shards) instead of 0..n_shards-1.
+    - gnu_time (str): Location of GNU time, used to record blastp's peak memory.
+
+    Returns:
+    - str: Generated SLURM script as a string.
+    """
+    array = ','.join(str(task_id) for task_id in task_ids) if task_ids is not None else f"0-{n_shards - 1}"
+    if max_concurrent:
+        array += f"%{max_concurrent}"
+
+    return slurm_array_script_template.format(
+        time=time,
+        ntasks=ntasks,
+        cpus_per_task=cpus_per_task,
+        memory=memory,
+        job_name=f"run_blast_{your_name}",
+        array=array,
+        shard_prefix=shard_prefix,
+        db_location=db_location,
+        output_prefix=output_prefix,
+        blastp=blastp,
+        gnu_time=gnu_time,
+        blast_parameters=BLAST_PARAMETERS
+    )
+
+def shard_digest(query_file, db_location, blast_parameters=BLAST_PARAMETERS):
+    """
+    Hash everything a shard's BLAST output depends on.
+
+    The digest covers the query shard's contents, the database path and the
+    size and modification time of its files, and the search parameters, so
+    it changes whenever a rerun would produce different hits.
+
+    Parameters:
+    - query_file (str): Location of the query shard.
+    - db_location (str): Location of the protein database (the makeblastdb -out prefix).
+    - blast_parameters (str): BLAST search parameters.
+
+    Returns:
+    - str: Hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(query_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    db_path = os.path.abspath(os.path.expanduser(db_location))
+    digest.update(f"\0{db_path}\0{blast_parameters}".encode())
+    for db_file in sorted(glob.glob(glob.escape(db_path) + '*')):
+        stat = os.stat(db_file)
+        digest.update(f"\0{os.path.basename(db_file)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+class ShardManifest:
+    """
+    JSON record of the inputs each BLAST shard output was submitted with.
+
+    A job script marks its output complete by writing the output's size to
+    <output>.done once blastp succeeds. Together with the input digest
+    recorded at submission, that tells a finished shard from one that is
+    missing, truncated (the marker size disagrees with the file) or stale
+    (its query, database or parameters changed since). The ID of the job
+    each shard was last submitted in is kept too, so a shard whose job is
+    still queued or running is not mistaken for a missing one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        """
+        Write the manifest atomically, so an interrupted save never corrupts it.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def status(self, output_file, digest):
+        """
+        Return 'complete', 'missing', 'truncated' or 'stale' for a shard output.
+
+        The size of a complete output is recorded in the manifest.
+        """
+        entry = self.entries.get(os.path.abspath(output_file))
+        if entry is None or entry['inputs'] != digest:
+            return 'stale' if entry is not None or os.path.exists(output_file) else 'missing'
+        marker = output_file + '.done'
+        if not os.path.exists(output_file) or not os.path.exists(marker):
+            return 'missing'
+        with open(marker, 'r') as f:
+            marker_size = f.read().strip()
+        size = os.path.getsize(output_file)
+        if marker_size != str(size):
+            return 'truncated'
+        entry.update(size=size, complete=True)
+        return 'complete'
+
+    def record(self, output_file, digest):
+        """
+        Record that a shard output is being (re)computed from inputs with this digest.
+
+        Any completion marker left by an earlier run is removed first.
+        """
+        marker = output_file + '.done'
+        if os.path.exists(marker):
+            os.remove(marker)
+        self.entries[os.path.abspath(output_file)] = {'inputs': digest, 'size': None, 'complete': False}
+
+    def submitted(self, output_file, job_id):
+        """
+        Record the ID of the job a shard output was submitted in.
+        """
+        self.entries[os.path.abspath(output_file)]['job_id'] = job_id
+
+    def job_id(self, output_file):
+        """
+        Return the ID of the job a shard output was last submitted in, or None.
+        """
+        return self.entries.get(os.path.abspath(output_file), {}).get('job_id')
+
+def pending_shards(shard_prefix, n_shards, db_location, output_prefix, manifest):
+    """
+    Return the shards whose output is missing, truncated or stale.
+
+    Parameters:
+    - shard_prefix (str): Path prefix of the query shards (<shard_prefix>_i.fa).
+    - n_shards (int): Number of shards.
+    - db_location (str): Location of the protein database.
+    - output_prefix (str): Path prefix of the per-shard BLAST results (<output_prefix>_i.tsv).
+    - manifest (ShardManifest): Manifest of earlier submissions; updated and saved.
+
+    Returns:
+    - dict: Input digest of each shard to (re)run, by shard index.
+    """
+    pending = {}
+    for i in range(n_shards):
+        digest = shard_digest(f"{shard_prefix}_{i}.fa", db_location)
+        if manifest.status(f"{output_prefix}_{i}.tsv", digest) != 'complete':
+            pending[i] = digest
+    manifest.save()
+    return pending
+
+def _parse_duration(text):
+    """
+    Return seconds from a SLURM or GNU time duration ([D-]HH:MM:SS, MM:SS) or a bash time value (XmY.ZZZs).
+    """
+    match = re.fullmatch(r'(?:(\d+)h)?(\d+)m([\d.]+)s', text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + float(seconds)
+    days, _, clock = text.rpartition('-')
+    seconds = 0.0
+    for part in clock.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds + int(days or 0) * 86400
+
+def _parse_memory(text):
+    """
+    Return bytes from a SLURM memory size such as 4G, 4000M or 4096K (megabytes if no unit).
+    """
+    match = re.fullmatch(r'([\d.]+)([KMGT]?)B?', text.upper())
+    if not match:
+        return None
+    units = {'K': 1 << 10, '': 1 << 20, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    return int(float(match.group(1)) * units[match.group(2)])
+
+def _format_duration(seconds):
+    """
+    Format seconds as a SLURM time limit, [D-]HH:MM:SS.
+    """
+    seconds = int(math.ceil(round(seconds, 3)))
+    days, seconds = divmod(seconds, 86400)
+    clock = f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{days}-{clock}" if days else clock
+
+def parse_job_log(log_file):
+    """
+    Read the resource usage of a BLAST job from its log (the slurm-<job id>.out file).
+
+    The job scripts run blastp under GNU time -v (or bash's time where GNU
+    time is not installed) and then print scontrol show job, so the log holds
+    the wall time and, with GNU time, the peak memory ("Maximum resident set
+    size") of the search, and the job's CPUs, time limit and requested memory.
+
+    Parameters:
+    - log_file (str): Location of the job log.
+
+    Returns:
+    - dict: job_id, runtime (seconds), max_rss (bytes), cpus, time_limit (seconds),
+      requested_memory (bytes), timed_out and min_runtime (seconds); values the log
+      lacks are None. min_runtime is the time limit of a job killed at it, a lower
+      bound on the runtime the search needed.
+    """
+    with open(log_file, 'r', errors='replace') as f:
+        text = f.read()
+
+    fields = dict(re.findall(r'(?:^|\s)([A-Za-z/]+)=(\S*)', text))
+    job_id = fields.get('JobId')
+    if fields.get('ArrayJobId') and fields.get('ArrayTaskId'):
+        job_id = f"{fields['ArrayJobId']}_{fields['ArrayTaskId']}"
+
+    real_times = (re.findall(r'^real\s+(\S+)', text, re.MULTILINE) or
+                  re.findall(r'Elapsed \(wall clock\) time \(h:mm:ss or m:ss\): (\S+)', text))
+    runtime = sum(_parse_duration(real) for real in real_times) if real_times else None
+    max_rss = re.search(r'Maximum resident set size \(kbytes\): (\d+)', text)
+    requested_memory = fields.get('MinMemoryNode') or fields.get('MinMemoryCPU')
+    time_limit = _parse_duration(fields['TimeLimit']) if re.match(r'[\d-]', fields.get('TimeLimit', '')) else None
+    timed_out = 'DUE TO TIME LIMIT' in text
+
+    return {
+        'job_id': job_id,
+        'runtime': runtime,
+        'max_rss': int(max_rss.group(1)) * 1024 if max_rss else None,
+        'cpus': int(fields['NumCPUs']) if fields.get('NumCPUs', '').isdigit() else None,
+        'time_limit': time_limit,
+        'requested_memory': _parse_memory(requested_memory) if requested_memory else None,
+        'timed_out': timed_out,
+        'min_runtime': time_limit if timed_out else None,
+    }
+
+def database_size(db_location):
+    """
+    Return the size of a BLAST database, in residues for protein databases.
+
+    The .psq sequence files of a protein database hold one byte per residue,
+    so their total size is the residue count; for other layouts the total size
+    of all the database files is used.
+    """
+    db_path = os.path.abspath(os.path.expanduser(db_location))
+    db_files = glob.glob(glob.escape(db_path) + '*')
+    sequence_files = [db_file for db_file in db_files if db_file.endswith('.psq')]
+    return sum(os.path.getsize(db_file) for db_file in sequence_files or db_files)
+
+def fasta_residues(fasta_file):
+    """
+    Return the total number of residues in a FASTA file.
+    """
+    return sum(residues for _, _, residues in _fasta_records(fasta_file))
+
+class JobHistory:
+    """
+    Local store of BLAST job resource usage (a JSON-lines file), used to size new jobs.
+
+    Each record pairs what a job used (from parse_job_log) with the size of
+    its search: query residues times database size is the work a BLAST
+    search does, so runtime is modelled as
+
+        runtime * cpus = a * query_residues * db_size + b
+
+    and peak memory as a linear function of database size and query residues.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def add_job_log(self, log_file, query_file, db_location):
+        """
+        Parse a job log and add it to the history with the size of its search.
+
+        Returns:
+        - dict: The stored record.
+        """
+        record = parse_job_log(log_file)
+        record['query_residues'] = fasta_residues(query_file)
+        record['db_size'] = database_size(db_location)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return record
+
+    def records(self):
+        """
+        Return the stored records, keeping the latest one per job ID.
+        """
+        if not os.path.exists(self.path):
+            return []
+        records = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record['job_id'] or len(records)] = record
+        return list(records.values())
+
+    def fit(self):
+        """
+        Fit the runtime and memory models to the recorded jobs.
+
+        Jobs killed at their time limit did not finish, so their runtime is
+        censored: they are left out of the runtime fit and kept as lower
+        bounds instead, which suggest() applies to searches at least as large.
+
+        Returns:
+        - dict: 'runtime' coefficients (a, b) and 'memory' coefficients (c0, c_db, c_query),
+          each None when there are no usable records, and 'runtime_floors', the
+          (query_residues * db_size, minimum cpu-seconds) of each timed-out job.
+        """
+        records = self.records()
+        timed = [r for r in records if r['runtime'] is not None and r['cpus'] and not r['timed_out']]
+        censored = [r for r in records if r.get('min_runtime') and r['cpus']]
+        measured = [r for r in records if r['max_rss'] is not None]
+
+        runtime_model = None
+        if timed:
+            work = np.array([r['query_residues'] * r['db_size'] for r in timed], dtype=np.float64)
+            cpu_seconds = np.array([r['runtime'] * r['cpus'] for r in timed], dtype=np.float64)
+            if len(timed) >= 3 and np.ptp(work) > 0:
+                a, b = np.linalg.lstsq(np.column_stack((work, np.ones_like(work))), cpu_seconds, rcond=None)[0]
+            else:
+                a, b = cpu_seconds.sum() / max(work.sum(), 1.0), 0.0
+            runtime_model = (max(float(a), 0.0), max(float(b), 0.0))
+
+        memory_model = None
+        if measured:
+            design = np.array([[1.0, r['db_size'], r['query_residues']] for r in measured], dtype=np.float64)
+            rss = np.array([r['max_rss'] for r in measured], dtype=np.float64)
+            if len(measured) >= 4 and np.linalg.matrix_rank(design) == 3:
+                memory_model = tuple(float(c) for c in np.linalg.lstsq(design, rss, rcond=None)[0])
+            else:
+                memory_model = (float(rss.max()), 0.0, 0.0)
+        runtime_floors = sorted((r['query_residues'] * r['db_size'], r['min_runtime'] * r['cpus']) for r in censored)
+        return {'runtime': runtime_model, 'memory': memory_model, 'runtime_floors': runtime_floors}
+
+    def suggest(self, query_residues, db_size, cpus_per_task, margin=1.5, min_time=300, min_memory=1 << 30):
+        """
+        Suggest a time limit and memory request for a search of the given size.
+
+        Parameters:
+        - query_residues (int): Residues in the query (shard).
+        - db_size (int): Size of the database, as returned by database_size.
+        - cpus_per_task (int): CPUs the job will run with.
+        - margin (float): Safety factor applied to the predicted runtime and memory.
+        - min_time (int): Smallest time limit suggested, in seconds.
+        - min_memory (int): Smallest memory request suggested, in bytes.
+
+        Returns:
+        - dict: 'time' and 'memory' strings for the SLURM script (None where the
+          history has no data to predict from) and 'cpus_per_task'.
+        """
+        model = self.fit()
+        suggestion = {'time': None, 'memory': None, 'cpus_per_task': cpus_per_task}
+        work = query_residues * db_size
+        # A search at least as large as one that timed out needs at least that job's cpu-seconds
+        floors = [cpu_seconds for floor_work, cpu_seconds in model['runtime_floors'] if floor_work <= work]
+        if model['runtime'] or floors:
+            a, b = model['runtime'] or (0.0, 0.0)
+            runtime = max([a * work + b] + floors) / cpus_per_task
+            suggestion['time'] = _format_duration(max(runtime * margin, min_time))
+        if model['memory']:
+            c0, c_db, c_query = model['memory']
+            memory = c0 + c_db * db_size + c_query * query_residues
+            suggestion['memory'] = f"{int(math.ceil(max(memory * margin, min_memory) / (1 << 20)))}M"
+        return suggestion
+
+def submit_blast_shards(executor, time, ntasks, cpus_per_task, memory, your_name, shard_prefix, n_shards,
+                        db_location, output_prefix, manifest_file=None, max_concurrent=None, blastp=BLASTP,
+                        history=None, margin=1.5):
+    """
+    Submit a BLAST job array over the shards without a complete, current output.
+
+    Resubmitting after a node failure or timeout only launches the shards
+    that did not finish, plus any whose query, database or parameters changed.
+    Shards whose earlier job the executor still reports as queued or running
+    are left to it, so a resume while an array is in flight never starts a
+    second job writing the same output; they are picked up by a later resume
+    if that job fails.
+
+    Parameters:
+    - executor: Backend to submit with (SlurmExecutor or LocalExecutor).
+    - time, ntasks, cpus_per_task, memory, your_name, shard_prefix, n_shards, db_location,
+      output_prefix, max_concurrent, blastp: As for generate_slurm_array_script.
+    - manifest_file (str): Location of the manifest (default: <output_prefix>_manifest.json).
+    - history (JobHistory): If given, a time or memory of None is filled in from the
+      history's prediction for the largest pending shard, with the given safety margin.
+    - margin (float): Safety factor for predicted resources.
+
+    Returns:
+    - str: ID of the submitted job, or None if every shard is complete or still in flight.
+
+    Raises:
+    - ValueError: If time or memory is None and cannot be predicted.
+    """
+    manifest = ShardManifest(manifest_file or f"{output_prefix}_manifest.json")
+    pending = pending_shards(shard_prefix, n_shards, db_location, output_prefix, manifest)
+    job_ids = {i: manifest.job_id(f"{output_prefix}_{i}.tsv") for i in pending}
+    submitted = sorted({job_id for job_id in job_ids.values() if job_id})
+    in_flight = set(executor.pending(submitted)) if submitted else set()
+    if in_flight:
+        print(f"Skipping {sum(job_id in in_flight for job_id in job_ids.values())} shards "
+              "whose job is still queued or running")
+        pending = {i: digest for i, digest in pending.items() if job_ids[i] not in in_flight}
+    if not pending:
+        return None
+
+    if (time is None or memory is None) and history is not None:
+        # Array tasks share one resource request, so size it for the largest shard
+        query_residues = max(fasta_residues(f"{shard_prefix}_{i}.fa") for i in pending)
+        suggestion = history.suggest(query_residues, database_size(db_location), cpus_per_task, margin)
+        time = time or suggestion['time']
+        memory = memory or suggestion['memory']
+    if time is None or memory is None:
+        raise ValueError("No time or memory given and no job history to predict them from")
+
+    for i, digest in pending.items():
+        manifest.record(f"{output_prefix}_{i}.tsv", digest)
+    manifest.save()
+
+    slurm_script = generate_slurm_array_script(time, ntasks, cpus_per_task, memory, your_name, shard_prefix, n_shards,
+                                               db_location, output_prefix, max_concurrent, blastp, list(pending))
+    job_id = executor.submit(slurm_script)
+    for i in pending:
+        manifest.submitted(f"{output_prefix}_{i}.tsv", job_id)
+    manifest.save()
+    return job_id
+
+def _parse_job_id(sbatch_output):
+    """
+    Return the job ID from sbatch output ("Submitted batch job <id>", or "<id>[;cluster]" with --parsable).
+    """
+    match = re.search(r'Submitted batch job (\d+)', sbatch_output) or re.match(r'\s*(\d+)', sbatch_output)
+    if not match:
+        raise ValueError(f"Could not parse a job ID from sbatch output: {sbatch_output!r}")
+    return match.group(1)
+
+def submit_slurm_job(slurm_script, dependencies=None, sbatch='sbatch'):
     """
     Submit a SLURM job using the provided SLURM script.
     
     Parameters:
     - slurm_script (str): SLURM script content as a string.
+    - dependencies (list): Job IDs that must complete successfully before this job
+      starts (sbatch --dependency=afterok:<id>:<id>...). If one of them fails, the
+      job is cancelled (--kill-on-invalid-dep=yes) instead of pending forever.
+    - sbatch (str): sbatch command to run, e.g. a full path or a stand-in script.
+    
+    Returns:
+    - str: ID of the submitted job, parsed from the sbatch output.
     
     Raises:
     - subprocess.CalledProcessError: If the sbatch command returns a non-zero exit status.
+    - ValueError: If no job ID can be parsed from the sbatch output.
     """
+    command = [sbatch]
+    if dependencies:
+        command.append('--dependency=afterok:' + ':'.join(str(job_id) for job_id in dependencies))
+        command.append('--kill-on-invalid-dep=yes')
+
+    # Write the SLURM script to a uniquely named temporary file, so concurrent
+    # submissions never overwrite each other's script
+    script_fd, script_file = tempfile.mkstemp(prefix='submit_script_', suffix='.sh')
     try:
-        # Write the SLURM script to a temporary file
-        with open('submit_script.sh', 'w') as f:
+        with os.fdopen(script_fd, 'w') as f:
             f.write(slurm_script)
         
         # Submit the SLURM script using sbatch command
-        process = subprocess.run(['sbatch', 'submit_script.sh'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        process = subprocess.run(command + [script_file], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
 
         # Print the output from sbatch
         print("Submitted SLURM job. Output:")
@@ -84,18 +698,327 @@ def submit_slurm_job(slurm_script):
 
     finally:
         # Clean up: remove the temporary script file
-        subprocess.run(['rm', 'submit_script.sh'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        os.remove(script_file)
+
+    return _parse_job_id(process.stdout.decode())
+
+# Outcome of one job, or one task of an array job (job ID <array job>_<task>).
+# exit_status is None when the job never ran because a dependency failed, and
+# nonzero for any job that did not complete: 128 + the signal for one killed by
+# a signal, as in the shell, or 1 for one that ended in another state such as
+# TIMEOUT or NODE_FAIL with exit code 0; wall_time is in seconds.
+JobResult = namedtuple('JobResult', ['job_id', 'exit_status', 'wall_time'])
+
+def _array_task_ids(slurm_script):
+    """
+    Return the task IDs of the #SBATCH --array directive of a script, or [None] for a plain job.
+
+    Supports the "0-15", "0-15:2", "1,3,5" and "%<limit>" forms.
+    """
+    match = re.search(r'^#SBATCH\s+(?:--array[= ]|-a\s*)(\S+)', slurm_script, re.MULTILINE)
+    if not match:
+        return [None]
+    task_ids = []
+    for part in match.group(1).split('%')[0].split(','):
+        bounds, _, step = part.partition(':')
+        first, _, last = bounds.partition('-')
+        task_ids.extend(range(int(first), int(last or first) + 1, int(step or 1)))
+    return task_ids
+
+class SlurmExecutor:
+    """
+    Executor backend that runs job scripts on a SLURM cluster through sbatch.
+    """
+
+    def __init__(self, sbatch='sbatch', squeue='squeue', sacct='sacct', poll_interval=60):
+        """
+        Parameters:
+        - sbatch (str): sbatch command to submit with (a path, or a stand-in for testing).
+        - squeue (str): squeue command to poll with.
+        - sacct (str): sacct command to read exit status and wall time with.
+        - poll_interval (int): Seconds between squeue polls in wait().
+        """
+        self.sbatch = sbatch
+        self.squeue = squeue
+        self.sacct = sacct
+        self.poll_interval = poll_interval
+
+    def submit(self, slurm_script, dependencies=None):
+        """
+        Submit a job script, held until the dependencies complete successfully.
+
+        Returns:
+        - str: ID of the submitted job.
+        """
+        return submit_slurm_job(slurm_script, dependencies, self.sbatch)
+
+    def pending(self, job_ids):
+        """
+        Return the job IDs that are still queued or running.
+
+        A job held by a dependency that can never be satisfied (one submitted
+        without --kill-on-invalid-dep) will never run, so it is not counted.
+        """
+        if not job_ids:
+            return []
+        process = subprocess.run([self.squeue, '-h', '-o', '%i %r', '-j', ','.join(job_ids)],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # squeue rejects job IDs that have already left the system.
+        if process.returncode and b'Invalid job id' not in process.stderr:
+            raise subprocess.CalledProcessError(process.returncode, process.args, process.stdout, process.stderr)
+        # Array tasks are listed as <job id>_<task id>.
+        queued = {line.split()[0].split('_')[0] for line in process.stdout.decode().splitlines()
+                  if line.strip() and not line.endswith('DependencyNeverSatisfied')}
+        return [job_id for job_id in job_ids if job_id in queued]
+
+    def wait(self, job_ids):
+        """
+        Block until the jobs have left the queue and return their accounting records.
+
+        Returns:
+        - dict: JobResult of each job, or of each task of an array job, by job ID.
+        """
+        while self.pending(job_ids):
+            sleep(self.poll_interval)
+
+        process = subprocess.run([self.sacct, '-n', '-P', '-X', '-o', 'JobID,ExitCode,ElapsedRaw,State',
+                                  '-j', ','.join(job_ids)], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 check=True)
+        results = {}
+        for line in process.stdout.decode().splitlines():
+            job_id, exit_code, elapsed, state = line.split('|')[:4]
+            # Jobs cancelled, or left pending, because a dependency failed never ran.
+            never_ran = state.startswith(('CANCELLED', 'PENDING')) and int(elapsed or 0) == 0
+            status, _, signal = exit_code.partition(':')
+            exit_status = int(status) or (128 + int(signal) if int(signal or 0) else 0)
+            if not exit_status and state != 'COMPLETED':
+                exit_status = 1
+            results[job_id] = JobResult(job_id, None if never_ran else exit_status, float(elapsed or 0))
+        return results
+
+class LocalExecutor:
+    """
+    Executor backend that runs job scripts on this machine, for workstations and CI without a scheduler.
+
+    Scripts run under bash in a bounded pool, by default one job at a time
+    per available core. Each run gets its own temporary copy of the script and
+    the SLURM_JOB_ID (and, for array jobs, SLURM_ARRAY_TASK_ID) variables,
+    and writes its output to slurm-<job id>.out like sbatch does. A job with
+    dependencies is only queued once they have all exited with status 0; if
+    one failed the job is not run, as with afterok.
+    """
+
+    def __init__(self, max_workers=None, output_dir='.', shell='bash'):
+        """
+        Parameters:
+        - max_workers (int): Number of jobs run at once (default: available cores).
+        - output_dir (str): Directory for the slurm-<job id>.out files.
+        - shell (str): Shell used to run the scripts.
+        """
+        if max_workers is None:
+            max_workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        self.shell = shell
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        """
+        Wait for every submitted job and release the pool.
+        """
+        self.wait(list(self._jobs))
+        self._pool.shutdown(wait=True)
+
+    def _run(self, job_id, slurm_script):
+        """
+        Run one job or array task and return its JobResult.
+        """
+        env = dict(os.environ, SLURM_JOB_ID=job_id.split('_')[0])
+        if '_' in job_id:
+            env['SLURM_ARRAY_JOB_ID'], env['SLURM_ARRAY_TASK_ID'] = job_id.split('_')
+
+        script_fd, script_file = tempfile.mkstemp(prefix='submit_script_', suffix='.sh')
+        try:
+            with os.fdopen(script_fd, 'w') as f:
+                f.write(slurm_script)
+            with open(os.path.join(self.output_dir, f'slurm-{job_id}.out'), 'w') as log:
+                start = perf_counter()
+                exit_status = subprocess.run([self.shell, script_file], stdout=log, stderr=subprocess.STDOUT,
+                                             env=env).returncode
+                # subprocess reports a job killed by a signal as -signal
+                return JobResult(job_id, exit_status if exit_status >= 0 else 128 - exit_status,
+                                 perf_counter() - start)
+        finally:
+            os.remove(script_file)
+
+    def submit(self, slurm_script, dependencies=None):
+        """
+        Queue a job script, held until the dependencies complete successfully.
+
+        Returns:
+        - str: ID of the submitted job.
+        """
+        with self._lock:
+            job_id = str(len(self._jobs) + 1)
+            task_ids = _array_task_ids(slurm_script)
+            run_ids = [job_id if task_id is None else f'{job_id}_{task_id}' for task_id in task_ids]
+            futures = [Future() for _ in run_ids]
+            self._jobs[job_id] = futures
+            upstream = [future for dependency in dependencies or () for future in self._jobs[str(dependency)]]
+
+        def start():
+            if not all(future.exception() is None and future.result().exit_status == 0 for future in upstream):
+                for run_id, future in zip(run_ids, futures):
+                    future.set_result(JobResult(run_id, None, 0.0))
+                return
+            for run_id, future in zip(run_ids, futures):
+                task = self._pool.submit(self._run, run_id, slurm_script)
+                task.add_done_callback(lambda task, future=future: future.set_exception(task.exception())
+                                       if task.exception() else future.set_result(task.result()))
+
+        remaining = [len(upstream)]
+        def upstream_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                start()
+
+        if upstream:
+            for future in upstream:
+                future.add_done_callback(upstream_done)
+        else:
+            start()
+        return job_id
+
+    def pending(self, job_ids):
+        """
+        Return the job IDs that are still waiting or running.
+        """
+        # Jobs of another executor (e.g. from a manifest) are not running here
+        return [job_id for job_id in job_ids if not all(future.done() for future in self._jobs.get(job_id, ()))]
+
+    def wait(self, job_ids):
+        """
+        Block until the jobs have finished.
+
+        Returns:
+        - dict: JobResult of each job, or of each task of an array job, by job ID.
+        """
+        results = {}
+        for job_id in job_ids:
+            for future in self._jobs[job_id]:
+                result = future.result()
+                results[result.job_id] = result
+        return results
+
+class Pipeline:
+    """
+    A DAG of job stages submitted together, each held until the stages it
+    depends on have finished successfully.
+
+    Every stage is submitted up front with a dependency on the job IDs of its
+    upstream stages (sbatch --dependency=afterok with the SLURM backend), so
+    a downstream stage starts as soon as its inputs are ready instead of
+    waiting for someone to submit it. If a stage fails, the stages
+    downstream of it are cancelled, so wait() still returns.
+
+    Example:
+        pipeline = Pipeline()                        # or Pipeline(LocalExecutor())
+        pipeline.add_stage('blast', generate_slurm_array_script(...))
+        pipeline.add_stage('merge', merge_script, after=['blast'])
+        pipeline.add_stage('parse', parse_script, after=['merge'])
+        job_ids = pipeline.submit()
+        results = pipeline.wait()
+    """
+
+    def __init__(self, executor=None, sbatch='sbatch', squeue='squeue'):
+        """
+        Parameters:
+        - executor: Backend running the stages (SlurmExecutor or LocalExecutor). Default:
+          a SlurmExecutor using the sbatch and squeue commands below.
+        - sbatch (str): sbatch command to submit with (a path, or a stand-in for testing).
+        - squeue (str): squeue command to poll with.
+        """
+        self.executor = executor if executor is not None else SlurmExecutor(sbatch, squeue)
+        self.stages = {}
+        self.job_ids = {}
+
+    def add_stage(self, name, slurm_script, after=()):
+        """
+        Add a stage running slurm_script after the stages named in after.
+
+        Raises:
+        - ValueError: If the stage name is already used.
+        """
+        if name in self.stages:
+            raise ValueError(f"Duplicate pipeline stage: {name}")
+        self.stages[name] = (slurm_script, list(after))
+
+    def order(self):
+        """
+        Return the stage names in a dependency order, keeping insertion order where free.
+
+        Raises:
+        - ValueError: If a stage depends on an unknown stage or the stages form a cycle.
+        """
+        for name, (_, after) in self.stages.items():
+            for upstream in after:
+                if upstream not in self.stages:
+                    raise ValueError(f"Stage {name} depends on unknown stage: {upstream}")
+
+        ordered, done = [], set()
+        while len(ordered) < len(self.stages):
+            ready = [name for name, (_, after) in self.stages.items()
+                     if name not in done and all(upstream in done for upstream in after)]
+            if not ready:
+                raise ValueError("Pipeline stages form a dependency cycle")
+            ordered.extend(ready)
+            done.update(ready)
+        return ordered
+
+    def submit(self):
+        """
+        Submit every stage, upstream stages first.
+
+        Returns:
+        - dict: Job ID of each stage.
+        """
+        for name in self.order():
+            slurm_script, after = self.stages[name]
+            self.job_ids[name] = self.executor.submit(slurm_script, [self.job_ids[upstream] for upstream in after])
+        return dict(self.job_ids)
+
+    def pending(self):
+        """
+        Return the names of submitted stages that are still queued or running.
+        """
+        pending = set(self.executor.pending(list(self.job_ids.values())))
+        return [name for name, job_id in self.job_ids.items() if job_id in pending]
+
+    def wait(self):
+        """
+        Block until every submitted stage has finished.
+
+        Returns:
+        - dict: JobResult of each stage's job, or list of JobResults of its array tasks.
+        """
+        results = self.executor.wait(list(self.job_ids.values()))
+        return {name: results[job_id] if job_id in results else
+                [result for run_id, result in results.items() if run_id.split('_')[0] == job_id]
+                for name, job_id in self.job_ids.items()}
 
 # Example usage:
 if __name__ == "__main__":
-    time = "00:30:00"
-    ntasks = 1
-    cpus_per_task = 1
-    memory = "1G"
-    your_name = "SMITH"  # Replace with your actual name
-    query_file = "<.fa-file-location>"
-    db_location = "<prot-db-location>"
-    output_file = "<output-file-name>"
-
-    slurm_script = generate_slurm_script(time, ntasks, cpus_per_task, memory, your_name, query_file, db_location, output_file)
-    submit_slurm_job(slurm_script)
+    # Same as: bioinformatics-scripts slurm-script <query_file> <db_location> <output_file> --time ... --submit
+    from importlib import import_module
+    cli = import_module(f'{__package__}.cli' if __package__ else 'cli')
+    sys.exit(cli.main(['slurm-script'] + sys.argv[1:]))
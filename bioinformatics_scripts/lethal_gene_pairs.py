@@ -1,28 +1,39 @@
+import io
 import os
 import logging
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-def lethal_gene_pairs(file, lethality_threshold, output_dir='.'):
+import numpy as np
+
+CHUNK_BYTES = 1 << 22
+OUTPUT_BUFFER_SIZE = 1 << 20
+RANGES_PER_PROCESS = 4
+
+class MalformedLineError(ValueError):
+    """
+    Raised for an input line that cannot be parsed, with its 1-based line number.
     """
-    This function takes a tab-delimited file in the format gene1\tgene2\tlethality and
-    a lethality threshold as input and writes two text files: one for gene pairs that exceed
-    the threshold and another for gene pairs that are below the threshold.
 
-    Parameters:
-        file (str): Path to the input tab-delimited file.
-        lethality_threshold (float): Threshold for lethality to categorize gene pairs.
-        output_dir (str): Directory where output files will be saved. Default is the current directory.
+    def __init__(self, reason, line_number, text):
+        super().__init__(f"{reason} at line {line_number}: {text}")
+        self.reason = reason
+        self.line_number = line_number
+        self.text = text
+
+def _check_paths(file, output_dir):
+    """
+    Check that the input file exists and the output directory is writable.
 
     Raises:
-        ValueError: If the input file is not formatted correctly or contains invalid data.
-        IOError: If the input file cannot be read or the output files cannot be written.
+        IOError: If the input file is missing or the output directory is unusable.
     """
-    logging.basicConfig(level=logging.INFO)
-    
     # Check if input file exists
     if not os.path.isfile(file):
         logging.error("Input file not found: %s", file)
         raise IOError(f"File not found: {file}")
-    
+
     # Check if output directory exists and is writable
     if not os.path.isdir(output_dir):
         logging.error("Output directory does not exist: %s", output_dir)
@@ -31,41 +42,220 @@ def lethal_gene_pairs(file, lethality_threshold, output_dir='.'):
         logging.error("Output directory is not writable: %s", output_dir)
         raise IOError(f"Output directory is not writable: {output_dir}")
 
-    above_threshold = []
-    below_threshold = []
+def _parse_chunk(lines, first_line_number):
+    """
+    Parse a chunk of gene1\tgene2\tlethality lines.
+
+    The lethality column of the whole chunk is converted in one numpy call;
+    the per-value float() loop only runs to find (or tolerate) values numpy
+    rejects.
+
+    Args:
+        lines (list): Lines of the chunk.
+        first_line_number (int): 1-based line number of the first line, for error messages.
+
+    Returns:
+        tuple: The "gene1\tgene2\n" output line of each pair and a float64 array of lethalities.
+
+    Raises:
+        MalformedLineError: If a line does not have three fields or its lethality is not a number.
+    """
+    pairs = []
+    values = []
+    for line_number, line in enumerate(lines, first_line_number):
+        parts = line.strip().split('\t')
+        if len(parts) != 3:
+            raise MalformedLineError("Invalid line format", line_number, line)
+        pairs.append(f"{parts[0]}\t{parts[1]}\n")
+        values.append(parts[2])
+
+    try:
+        lethality = np.array(values, dtype=np.float64)
+    except ValueError:
+        lethality = np.empty(len(values), dtype=np.float64)
+        for i, lethality_str in enumerate(values):
+            try:
+                lethality[i] = float(lethality_str)
+            except ValueError:
+                raise MalformedLineError("Invalid lethality value", first_line_number + i, lethality_str)
+    return pairs, lethality
+
+def _classify(lethality, edges):
+    """
+    Return the bin index of each lethality: bin i holds values in [edges[i - 1], edges[i]).
+
+    NaN never reaches a threshold, so it falls in bin 0 like it did with ``>=``.
+    """
+    bins = np.searchsorted(edges, lethality, side='right')
+    bins[np.isnan(lethality)] = 0
+    return bins
+
+def _route_chunk(lines, first_line_number, edges, writers, counts):
+    """
+    Parse one chunk of lines and append each pair to the writer of its bin.
+    """
+    pairs, lethality = _parse_chunk(lines, first_line_number)
+    buffers = [[] for _ in writers]
+    for pair, b in zip(pairs, _classify(lethality, edges).tolist()):
+        buffers[b].append(pair)
+    for b, buffer in enumerate(buffers):
+        writers[b].write(''.join(buffer))
+        counts[b] += len(buffer)
+
+def _byte_ranges(file, n_ranges):
+    """
+    Split a file into at most n_ranges (start, end) byte ranges that begin and end on line boundaries.
+    """
+    size = os.path.getsize(file)
+    boundaries = [0]
+    with open(file, 'rb') as f:
+        for i in range(1, n_ranges):
+            f.seek(max(size * i // n_ranges - 1, boundaries[-1]))
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > boundaries[-1]:
+                boundaries.append(f.tell())
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _bin_range(task):
+    """
+    Bin the lines of one byte range into per-range part files.
+
+    Line numbers are counted from the start of the range; the caller turns
+    them into file line numbers.
+
+    Returns:
+        tuple: ('ok', counts, number of lines) or ('error', reason, line number, text).
+    """
+    file, start, end, edges, part_files = task
+    counts = [0] * len(part_files)
+    writers = [open(path, 'w', buffering=OUTPUT_BUFFER_SIZE) for path in part_files]
+    line_number = 1
+    try:
+        with open(file, 'rb') as f:
+            f.seek(start)
+            while f.tell() < end:
+                block = f.read(min(CHUNK_BYTES, end - f.tell()))
+                if not block.endswith(b'\n') and f.tell() < end:
+                    block += f.readline()
+                lines = io.TextIOWrapper(io.BytesIO(block)).readlines()
+                _route_chunk(lines, line_number, edges, writers, counts)
+                line_number += len(lines)
+    except MalformedLineError as e:
+        return 'error', e.reason, e.line_number, e.text
+    finally:
+        for writer in writers:
+            writer.close()
+    return 'ok', counts, line_number - 1
+
+def _bin_pairs_parallel(file, edges, output_files, processes):
+    """
+    Parallel variant of _bin_pairs over newline-aligned byte ranges of the input.
+
+    Each range is binned by a worker process into its own part files, which
+    are concatenated in range order, so the output is identical to the serial
+    run. The first malformed line in file order is reported with its line
+    number in the whole file.
+    """
+    ranges = _byte_ranges(file, processes * RANGES_PER_PROCESS)
+    output_dir = os.path.dirname(os.path.abspath(output_files[0]))
+    counts = [0] * len(output_files)
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as parts_dir:
+        part_files = [[os.path.join(parts_dir, f'part_{i}_{b}.txt') for b in range(len(output_files))]
+                      for i in range(len(ranges))]
+        tasks = [(file, start, end, edges, parts) for (start, end), parts in zip(ranges, part_files)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_bin_range, tasks))
+
+        lines_before = 0
+        for result in results:
+            if result[0] == 'error':
+                _, reason, line_number, text = result
+                raise MalformedLineError(reason, lines_before + line_number, text)
+            _, range_counts, n_lines = result
+            counts = [total + count for total, count in zip(counts, range_counts)]
+            lines_before += n_lines
+
+        for b, output_file in enumerate(output_files):
+            with open(output_file, 'wb') as out:
+                for parts in part_files:
+                    with open(parts[b], 'rb') as part:
+                        shutil.copyfileobj(part, out)
+    return counts
+
+def _bin_pairs(file, edges, output_files, processes=1):
+    """
+    Stream the input once and route each pair to the output file of its bin.
+
+    The bins are written to a temporary directory next to the outputs and
+    moved into place only once the whole input has parsed, so a malformed
+    line leaves any earlier output files untouched, as with processes > 1.
+
+    Returns:
+        list: Number of pairs written to each output file.
+
+    Raises:
+        MalformedLineError: If a line cannot be parsed.
+    """
+    try:
+        if processes > 1 and os.path.getsize(file) > CHUNK_BYTES:
+            return _bin_pairs_parallel(file, edges, output_files, processes)
+
+        counts = [0] * len(output_files)
+        output_dir = os.path.dirname(os.path.abspath(output_files[0]))
+        with tempfile.TemporaryDirectory(dir=output_dir) as bins_dir:
+            bin_files = [os.path.join(bins_dir, f'bin_{b}.txt') for b in range(len(output_files))]
+            writers = [open(path, 'w', buffering=OUTPUT_BUFFER_SIZE) for path in bin_files]
+            try:
+                with open(file, 'r') as f:
+                    line_number = 1
+                    while True:
+                        lines = f.readlines(CHUNK_BYTES)
+                        if not lines:
+                            break
+                        _route_chunk(lines, line_number, edges, writers, counts)
+                        line_number += len(lines)
+            finally:
+                for writer in writers:
+                    writer.close()
+            for bin_file, output_file in zip(bin_files, output_files):
+                os.replace(bin_file, output_file)
+        return counts
+    except MalformedLineError as e:
+        logging.error("%s", e)
+        raise
+
+def lethal_gene_pairs(file, lethality_threshold, output_dir='.', processes=1):
+    """
+    This function takes a tab-delimited file in the format gene1\tgene2\tlethality and
+    a lethality threshold as input and writes two text files: one for gene pairs that exceed
+    the threshold and another for gene pairs that are below the threshold.
+
+    Parameters:
+        file (str): Path to the input tab-delimited file.
+        lethality_threshold (float): Threshold for lethality to categorize gene pairs.
+        output_dir (str): Directory where output files will be saved. Default is the current directory.
+        processes (int): Number of worker processes. Above 1, the input is split into
+                         newline-aligned byte ranges that are binned in parallel.
+
+    Raises:
+        ValueError: If the input file is not formatted correctly or contains invalid data.
+        IOError: If the input file cannot be read or the output files cannot be written.
+    """
+    logging.basicConfig(level=logging.INFO)
+    _check_paths(file, output_dir)
 
     try:
-        with open(file, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                parts = line.strip().split('\t')
-                if len(parts) != 3:
-                    logging.error("Invalid line format: %s", line)
-                    raise ValueError(f"Invalid line format: {line}")
-                gene1, gene2, lethality_str = parts
-                try:
-                    lethality = float(lethality_str)
-                except ValueError:
-                    logging.error("Invalid lethality value: %s", lethality_str)
-                    raise ValueError(f"Invalid lethality value: {lethality_str}")
-                
-                if lethality >= lethality_threshold:
-                    above_threshold.append((gene1, gene2))
-                else:
-                    below_threshold.append((gene1, gene2))
-        
         above_threshold_file = os.path.join(output_dir, 'above_threshold.txt')
         below_threshold_file = os.path.join(output_dir, 'below_threshold.txt')
 
-        with open(above_threshold_file, 'w') as f:
-            for pair in above_threshold:
-                f.write(f"{pair[0]}\t{pair[1]}\n")
-        
-        with open(below_threshold_file, 'w') as f:
-            for pair in below_threshold:
-                f.write(f"{pair[0]}\t{pair[1]}\n")
+        _bin_pairs(file, np.array([lethality_threshold], dtype=np.float64),
+                   [below_threshold_file, above_threshold_file], processes)
 
-        logging.info("Processing complete. Results saved in %s and %s", 
+        logging.info("Processing complete. Results saved in %s and %s",
                      above_threshold_file, below_threshold_file)
 
     except IOError as e:
@@ -73,4 +263,51 @@ def lethal_gene_pairs(file, lethality_threshold, output_dir='.'):
         raise
     except Exception as e:
         logging.error("An unexpected error occurred: %s", str(e))
-        raise
\ No newline at end of file
+        raise
+
+def lethal_gene_pair_bins(file, thresholds, output_dir='.', processes=1):
+    """
+    Split gene pairs into lethality bins for several thresholds in one pass over the input.
+
+    The thresholds are the bin edges: with thresholds t1 < t2 < ... < tn, bin 0 holds
+    pairs with lethality below t1, bin i holds pairs in [ti, ti+1) and bin n holds pairs
+    at or above tn. Pairs at or above a threshold tk are therefore the union of bins
+    k..n, which is what lethal_gene_pairs writes to above_threshold.txt for tk.
+
+    Each bin is written to lethality_bin_<i>.txt and a per-bin count summary
+    (bin, lower, upper, count) to lethality_bins.txt. The input is read in
+    fixed-size chunks, so memory use does not depend on the file size.
+
+    Parameters:
+        file (str): Path to the input tab-delimited file.
+        thresholds (list): Bin edges; they are sorted and must be distinct.
+        output_dir (str): Directory where output files will be saved. Default is the current directory.
+        processes (int): Number of worker processes, as in lethal_gene_pairs.
+
+    Returns:
+        list: Number of pairs in each bin.
+
+    Raises:
+        ValueError: If the thresholds are empty or repeated, or the input is malformed.
+        IOError: If the input file cannot be read or the output files cannot be written.
+    """
+    logging.basicConfig(level=logging.INFO)
+    _check_paths(file, output_dir)
+
+    edges = np.unique(np.asarray(thresholds, dtype=np.float64))
+    if len(edges) == 0 or len(edges) != len(thresholds) or np.isnan(edges).any():
+        logging.error("Invalid lethality thresholds: %s", thresholds)
+        raise ValueError(f"Invalid lethality thresholds: {thresholds}")
+
+    bin_files = [os.path.join(output_dir, f'lethality_bin_{i}.txt') for i in range(len(edges) + 1)]
+    counts = _bin_pairs(file, edges, bin_files, processes)
+
+    summary_file = os.path.join(output_dir, 'lethality_bins.txt')
+    bounds = ['-inf'] + [repr(float(edge)) for edge in edges] + ['inf']
+    with open(summary_file, 'w') as f:
+        f.write("bin\tlower\tupper\tcount\n")
+        for i, count in enumerate(counts):
+            f.write(f"{i}\t{bounds[i]}\t{bounds[i + 1]}\t{count}\n")
+
+    logging.info("Processing complete. %d bins saved in %s", len(counts), output_dir)
+    return counts
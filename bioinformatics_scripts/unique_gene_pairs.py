@@ -1,7 +1,27 @@
 
+import heapq
+import json
+import math
 import pickle
 import os
 import logging
+import shutil
+import struct
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Approximate in-memory size of a deduplicated pair relative to its line in the input file.
+EXTERNAL_MEMORY_FACTOR = 4
+MAX_BUCKETS = 1024
+# File descriptors left free for the input, outputs and worker pipes when every spill bucket is open.
+OPEN_FILE_HEADROOM = 64
+PAIR_STORE_NAME = 'unique_gene_pairs.pairs'
+PAIR_STORE_MAGIC = b'GPSTORE1'
+# Pairs handled at once while the pair store's CSR arrays are built on disk.
+PAIR_STORE_BLOCK = 1 << 20
 
 def contains_gene(dictionary, key, target_gene):
      """
@@ -18,21 +38,493 @@ def contains_gene(dictionary, key, target_gene):
     """
      return any(target_gene == gene for gene, _ in dictionary.get(key, []))
 
-def unique_gene_pairs(filename, output_dir):
+def pair_key(gene1, gene2, canonical=False):
+    """
+    Return the key identifying a gene pair in the pair index.
+
+    Args:
+        gene1 (str): First gene of the pair.
+        gene2 (str): Second gene of the pair.
+        canonical (bool): If True, (A, B) and (B, A) map to the same key.
+
+    Returns:
+        tuple: The pair key.
+    """
+    if canonical and gene2 < gene1:
+        return gene2, gene1
+    return gene1, gene2
+
+def _parse_pair_line(line):
+    """
+    Split an input line into gene1, gene2 and the list of values.
+
+    Raises:
+        ValueError: If the line has fewer than two fields.
+    """
+    parts = line.strip().split('\t')
+    if len(parts) < 2:
+        logging.error("Invalid line format: %s", line)
+        raise ValueError(f"Invalid line format: {line}")
+    return parts[0], parts[1], parts[2:]
+
+def _dedup_bucket(bucket_file, canonical):
+    """
+    Keep the first occurrence of each pair in one spill bucket.
+
+    Bucket lines are "line_number<TAB>input line" in input order, so the first
+    occurrence within a bucket is the first occurrence in the whole input.
+    Survivors are written back to the bucket file in the same format.
+
+    Returns:
+        tuple: The number of surviving pairs and the first line number of each gene1.
+    """
+    seen_pairs = set()
+    survivors = []
+    first_lines = {}
+    with open(bucket_file, 'r') as f:
+        for record in f:
+            line_number, line = record.split('\t', 1)
+            gene1, gene2, _ = _parse_pair_line(line)
+            key = pair_key(gene1, gene2, canonical)
+            if key in seen_pairs:
+                continue
+            seen_pairs.add(key)
+            line_number = int(line_number)
+            survivors.append(record)
+            if gene1 not in first_lines:
+                first_lines[gene1] = line_number
+
+    with open(bucket_file, 'w') as f:
+        f.writelines(survivors)
+    return len(survivors), first_lines
+
+def _sort_bucket(task):
+    """
+    Sort the survivors of one bucket into output order: by the first line of
+    their gene1 group, then by their own line number.
+    """
+    bucket_file, first_lines = task
+    records = []
+    with open(bucket_file, 'r') as f:
+        for record in f:
+            line_number, line = record.split('\t', 1)
+            gene1 = line.split('\t', 1)[0]
+            records.append((first_lines[gene1], int(line_number), line))
+    records.sort()
+
+    with open(bucket_file, 'w') as f:
+        f.writelines(f"{group}\t{line_number}\t{line}" for group, line_number, line in records)
+
+def _read_sorted_bucket(bucket_file):
+    """
+    Stream (group, line number, input line) records from a sorted bucket.
+    """
+    with open(bucket_file, 'r') as f:
+        for record in f:
+            group, line_number, line = record.split('\t', 2)
+            yield int(group), int(line_number), line
+
+def _max_open_buckets():
+    """
+    Return how many spill buckets can be open at once under the open file limit (ulimit -n).
+    """
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return MAX_BUCKETS
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return MAX_BUCKETS
+    return max(min(soft_limit - OPEN_FILE_HEADROOM, MAX_BUCKETS), 1)
+
+def _unique_gene_pairs_external(filename, output_dir, canonical, memory_budget, processes, output_format):
+    """
+    Out-of-core variant of unique_gene_pairs for inputs larger than memory.
+
+    Pairs are hash-partitioned into on-disk buckets small enough to deduplicate
+    within memory_budget, each bucket is deduplicated (in parallel if processes > 1),
+    and the sorted buckets are merged into the same output order as the in-memory
+    path. The pair store is written while merging; the pickle format is not
+    supported since it needs every pair in memory.
+
+    Returns:
+        tuple: Paths to the output text file and the pair store (or None).
+    """
+    # Every bucket is open at once while partitioning and again while merging
+    n_buckets = max(math.ceil(os.path.getsize(filename) * EXTERNAL_MEMORY_FACTOR / memory_budget), 1)
+    max_buckets = _max_open_buckets()
+    if n_buckets > max_buckets:
+        logging.warning("Using %d spill buckets instead of %d to stay within the open file limit; "
+                        "buckets may exceed the memory budget", max_buckets, n_buckets)
+        n_buckets = max_buckets
+    pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    run = pool.map if pool else map
+
+    try:
+        with tempfile.TemporaryDirectory(dir=output_dir) as spill_dir:
+            bucket_files = [os.path.join(spill_dir, f'bucket_{i}.txt') for i in range(n_buckets)]
+            buckets = [open(bucket_file, 'w') for bucket_file in bucket_files]
+            try:
+                with open(filename, 'r') as f:
+                    for line_number, line in enumerate(f):
+                        gene1, gene2, _ = _parse_pair_line(line)
+                        bucket = hash(pair_key(gene1, gene2, canonical)) % n_buckets
+                        buckets[bucket].write(f"{line_number}\t{line.strip()}\n")
+            except IOError:
+                logging.error("Error reading file: %s", filename)
+                raise IOError(f"Error reading file: {filename}")
+            finally:
+                for bucket in buckets:
+                    bucket.close()
+
+            unique_gene_pairs_counter = 0
+            first_lines = {}
+            bucket_first_lines = []
+            for count, bucket_lines in run(_dedup_bucket, bucket_files, [canonical] * n_buckets):
+                unique_gene_pairs_counter += count
+                bucket_first_lines.append(bucket_lines)
+                for gene1, line_number in bucket_lines.items():
+                    if line_number < first_lines.get(gene1, line_number + 1):
+                        first_lines[gene1] = line_number
+
+            # Each bucket only gets the first lines of its own gene1s, updated to the whole-input values
+            for bucket_lines in bucket_first_lines:
+                for gene1 in bucket_lines:
+                    bucket_lines[gene1] = first_lines[gene1]
+            del first_lines
+            list(run(_sort_bucket, zip(bucket_files, bucket_first_lines)))
+
+            merged = (_parse_pair_line(line) for _, _, line in heapq.merge(*map(_read_sorted_bucket, bucket_files)))
+            output_file, store_file = _write_outputs(output_dir, unique_gene_pairs_counter, merged,
+                                                     output_format == 'pairstore')
+    finally:
+        if pool:
+            pool.shutdown()
+
+    return output_file, store_file
+
+def _write_outputs(output_dir, unique_gene_pairs_counter, pairs, write_store):
+    """
+    Write the text output and, optionally, the pair store from one pass over the pairs.
+
+    Args:
+        output_dir (str): Directory where the output files will be saved.
+        unique_gene_pairs_counter (int): Number of pairs, written in the header line.
+        pairs (iterable): (gene1, gene2, values) tuples in output order.
+        write_store (bool): Also write unique_gene_pairs.pairs.
+
+    Returns:
+        tuple: Paths to the output text file and the pair store (or None).
+    """
+    output_file = os.path.join(output_dir, 'unique_gene_pairs.txt')
+    store_file = os.path.join(output_dir, PAIR_STORE_NAME) if write_store else None
+
+    def write_text(pairs):
+        with open(output_file, 'w') as f:
+            f.write(f"Number of unique gene pairs: {unique_gene_pairs_counter}\n")
+            for gene1, gene2, values in pairs:
+                f.write(f"{gene1}\t{gene2}\t{','.join(values)}\n")
+                yield gene1, gene2, values
+
+    if store_file:
+        write_pair_store(store_file, write_text(pairs))
+    else:
+        for _ in write_text(pairs):
+            pass
+    return output_file, store_file
+
+def _spool_pairs(pairs, gene_ids, pair_ids, value_ends, values_blob):
+    """
+    Write the gene IDs, value end offsets and values of a stream of pairs to temporary files.
+
+    Gene IDs are assigned in first-seen order in gene_ids; only one block of
+    pairs is buffered in memory at a time.
+
+    Returns:
+        tuple: Number of pairs and total size of the values.
+    """
+    ids = array('i')
+    ends = array('q')
+    n_pairs = n_value_bytes = 0
+    for gene1, gene2, values in pairs:
+        ids.append(gene_ids.setdefault(gene1, len(gene_ids)))
+        ids.append(gene_ids.setdefault(gene2, len(gene_ids)))
+        n_value_bytes += values_blob.write('\t'.join(values).encode())
+        ends.append(n_value_bytes)
+        if len(ends) == PAIR_STORE_BLOCK:
+            ids.tofile(pair_ids)
+            ends.tofile(value_ends)
+            n_pairs += len(ends)
+            del ids[:], ends[:]
+    ids.tofile(pair_ids)
+    ends.tofile(value_ends)
+    return n_pairs + len(ends), n_value_bytes
+
+def _fill_csr(gene_id_pairs, ranks, offsets, partners, value_ids):
+    """
+    Place pairs into CSR partner and value ID arrays, ordered by gene1 and then gene2.
+
+    gene_id_pairs is an (n_pairs, 2) array of gene IDs in input order, and
+    ranks maps a gene ID to its position in the sorted gene table. Pairs are
+    read one block at a time and scattered to the next free slots of their
+    gene1s, then each run of gene1 segments is sorted by partner.
+    """
+    cursor = offsets[:-1].copy()
+    for start in range(0, len(gene_id_pairs), PAIR_STORE_BLOCK):
+        block = ranks[gene_id_pairs[start:start + PAIR_STORE_BLOCK]]
+        order = np.argsort(block[:, 0], kind='stable')
+        first = block[order, 0]
+        slots = cursor[first] + np.arange(len(first)) - np.searchsorted(first, first)
+        partners[slots] = block[order, 1]
+        value_ids[slots] = start + order
+        cursor += np.bincount(first, minlength=len(cursor))
+
+    gene = 0
+    while gene < len(offsets) - 1:
+        end_gene = max(int(np.searchsorted(offsets, offsets[gene] + PAIR_STORE_BLOCK, 'right')) - 1, gene + 1)
+        end_gene = min(end_gene, len(offsets) - 1)
+        start, end = offsets[gene], offsets[end_gene]
+        segment_genes = np.repeat(np.arange(gene, end_gene), np.diff(offsets[gene:end_gene + 1]))
+        order = np.lexsort((partners[start:end], segment_genes))
+        partners[start:end] = partners[start:end][order]
+        value_ids[start:end] = value_ids[start:end][order]
+        gene = end_gene
+
+def write_pair_store(path, pairs):
+    """
+    Write gene pairs to a compact binary pair store readable with PairStore.
+
+    The file holds a sorted fixed-width gene table, CSR offsets and partner
+    arrays (partners sorted within each gene), and the values of every pair
+    packed into one tab-separated UTF-8 blob. Pairs are spooled to temporary
+    files as they are read and the CSR arrays are filled block by block in
+    the memory-mapped store, so memory grows with the number of distinct
+    genes but not with the number of pairs.
+
+    Args:
+        path (str): Path of the pair store to write.
+        pairs (iterable): (gene1, gene2, values) tuples, values being a list of strings.
+
+    Returns:
+        int: Number of pairs written.
+    """
+    gene_ids = {}
+    store_dir = os.path.dirname(os.path.abspath(path))
+
+    with tempfile.TemporaryFile(dir=store_dir) as values_blob, \
+            tempfile.TemporaryFile(dir=store_dir) as pair_ids, \
+            tempfile.TemporaryFile(dir=store_dir) as value_ends:
+        n_pairs, n_value_bytes = _spool_pairs(pairs, gene_ids, pair_ids, value_ends, values_blob)
+        pair_ids.flush()
+
+        names = np.array([gene.encode() for gene in gene_ids], dtype=bytes)
+        if names.size == 0:
+            names = np.zeros(0, dtype='S1')
+        order = np.argsort(names, kind='stable')
+        ranks = np.empty(len(order), dtype=np.int32)
+        ranks[order] = np.arange(len(order), dtype=np.int32)
+        del gene_ids
+
+        if n_pairs:
+            gene_id_pairs = np.memmap(pair_ids, dtype=np.int32, mode='r', shape=(n_pairs, 2))
+        else:
+            gene_id_pairs = np.zeros((0, 2), dtype=np.int32)
+        counts = np.zeros(len(names), dtype=np.int64)
+        for start in range(0, n_pairs, PAIR_STORE_BLOCK):
+            counts += np.bincount(ranks[gene_id_pairs[start:start + PAIR_STORE_BLOCK, 0]], minlength=len(names))
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+        sections = {
+            'genes': (names.dtype, len(names)),
+            'offsets': (offsets.dtype, len(offsets)),
+            'partners': (np.dtype(np.int32), n_pairs),
+            'value_ids': (np.dtype(np.int64), n_pairs),
+            'value_offsets': (np.dtype(np.int64), n_pairs + 1),
+        }
+        header = {'n_genes': len(names), 'n_pairs': n_pairs, 'sections': {}}
+        position = 0
+        for name, (dtype, count) in sections.items():
+            header['sections'][name] = [position, dtype.str, count]
+            position += -(-dtype.itemsize * count // 8) * 8
+        header['sections']['values'] = [position, '|u1', n_value_bytes]
+        header_bytes = json.dumps(header).encode()
+        data_start = -(-(len(PAIR_STORE_MAGIC) + 8 + len(header_bytes)) // 8) * 8
+
+        with open(path, 'wb') as f:
+            f.write(PAIR_STORE_MAGIC)
+            f.write(struct.pack('<Q', data_start))
+            f.write(header_bytes)
+            f.write(b'\0' * (data_start - f.tell()))
+            for name, section in (('genes', names[order]), ('offsets', offsets)):
+                f.seek(data_start + header['sections'][name][0])
+                f.write(section.tobytes())
+            # partners and value_ids are left as a hole, filled in through a memory map below
+            f.seek(data_start + header['sections']['value_offsets'][0])
+            f.write(struct.pack('<q', 0))
+            value_ends.seek(0)
+            shutil.copyfileobj(value_ends, f)
+            f.write(b'\0' * (data_start + header['sections']['values'][0] - f.tell()))
+            values_blob.seek(0)
+            shutil.copyfileobj(values_blob, f)
+
+        if n_pairs:
+            store = np.memmap(path, dtype=np.uint8, mode='r+')
+            partners_start = data_start + header['sections']['partners'][0]
+            value_ids_start = data_start + header['sections']['value_ids'][0]
+            partners = store[partners_start:partners_start + 4 * n_pairs].view(np.int32)
+            value_ids = store[value_ids_start:value_ids_start + 8 * n_pairs].view(np.int64)
+            _fill_csr(gene_id_pairs, ranks, offsets, partners, value_ids)
+            store.flush()
+            del partners, value_ids, store, gene_id_pairs
+
+    return n_pairs
+
+class PairStore:
+    """
+    Read-only, memory-mapped view of a pair store written by write_pair_store.
+
+    Opening a store only maps the file, so it costs the same whatever the number
+    of pairs; lookups binary-search the sorted gene table and partner lists.
+
+    Example:
+        with PairStore('unique_gene_pairs.pairs') as store:
+            store.partners_of('AT1G01010')
+    """
+
+    def __init__(self, path):
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        if self._map[:len(PAIR_STORE_MAGIC)].tobytes() != PAIR_STORE_MAGIC:
+            raise ValueError(f"Not a pair store: {path}")
+        data_start, = struct.unpack('<Q', self._map[len(PAIR_STORE_MAGIC):len(PAIR_STORE_MAGIC) + 8].tobytes())
+        header = json.loads(self._map[len(PAIR_STORE_MAGIC) + 8:data_start].tobytes().rstrip(b'\0'))
+
+        self._closed = False
+        self._sections = list(header['sections'])
+        for name, (offset, dtype, count) in header['sections'].items():
+            setattr(self, f'_{name}', np.frombuffer(self._map, dtype=np.dtype(dtype), count=count,
+                                                    offset=data_start + offset))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        self._check_open()
+        return len(self._partners)
+
+    def close(self):
+        """
+        Drop the memory map; it is unmapped once no array taken from the store refers to it.
+
+        Any later use of the store raises ValueError.
+        """
+        self._closed = True
+        self._map = None
+        for name in self._sections:
+            setattr(self, f'_{name}', None)
+
+    def _check_open(self):
+        if self._closed:
+            raise ValueError("PairStore is closed")
+
+    def _gene_id(self, gene):
+        key = gene.encode()
+        gene_id = int(np.searchsorted(self._genes, key))
+        if gene_id < len(self._genes) and self._genes[gene_id] == key:
+            return gene_id
+        return -1
+
+    def _slot_values(self, slot):
+        value_id = self._value_ids[slot]
+        blob = self._values[self._value_offsets[value_id]:self._value_offsets[value_id + 1]]
+        return blob.tobytes().decode().split('\t') if len(blob) else []
+
+    def _slot(self, gene1, gene2):
+        gene1_id, gene2_id = self._gene_id(gene1), self._gene_id(gene2)
+        if gene1_id < 0 or gene2_id < 0:
+            return -1
+        start, end = self._offsets[gene1_id], self._offsets[gene1_id + 1]
+        slot = start + int(np.searchsorted(self._partners[start:end], gene2_id))
+        return slot if slot < end and self._partners[slot] == gene2_id else -1
+
+    def partners_of(self, gene):
+        """
+        Return the genes paired with a gene (as gene1), in sorted order.
+
+        Args:
+            gene (str): The gene to look up.
+
+        Returns:
+            list: Partner genes; empty if the gene has no pairs.
+        """
+        self._check_open()
+        gene_id = self._gene_id(gene)
+        if gene_id < 0:
+            return []
+        partners = self._partners[self._offsets[gene_id]:self._offsets[gene_id + 1]]
+        return [partner.decode() for partner in self._genes[partners]]
+
+    def has_pair(self, gene1, gene2):
+        """
+        Return True if the pair (gene1, gene2) is in the store.
+        """
+        self._check_open()
+        return self._slot(gene1, gene2) >= 0
+
+    def values(self, gene1, gene2):
+        """
+        Return the values of the pair (gene1, gene2), or None if it is not in the store.
+        """
+        self._check_open()
+        slot = self._slot(gene1, gene2)
+        return self._slot_values(slot) if slot >= 0 else None
+
+    def iterate(self):
+        """
+        Yield every (gene1, gene2, values) tuple, ordered by gene1 and then gene2.
+
+        Closing the store stops the iteration with ValueError.
+        """
+        self._check_open()
+        for gene1_id in np.flatnonzero(np.diff(self._offsets)):
+            self._check_open()
+            gene1 = self._genes[gene1_id].decode()
+            for slot in range(self._offsets[gene1_id], self._offsets[gene1_id + 1]):
+                self._check_open()
+                yield gene1, self._genes[self._partners[slot]].decode(), self._slot_values(slot)
+
+def unique_gene_pairs(filename, output_dir, canonical=False, memory_budget=None, processes=1,
+                      output_format='pairstore'):
     """
     Process a file containing gene pairs and their associated values, and produce
-    an output file and a pickle file with unique gene pairs.
+    an output file and a binary pair store (or pickle file) with unique gene pairs.
+
+    The first occurrence of each pair is kept. Pairs are looked up in a hash index,
+    so hub genes with many partners do not slow down deduplication.
 
     Args:
         filename (str): Path to the input file containing gene pairs and values.
         output_dir (str): Path to the directory where the output files will be saved.
+        canonical (bool): If True, treat (A, B) and (B, A) as the same pair. The
+                          orientation of the first occurrence is kept.
+        memory_budget (int): If set, deduplicate out of core in hash-partitioned
+                             spill buckets sized to this many bytes of memory. The
+                             pickle file is not written in this mode.
+        processes (int): Number of processes deduplicating buckets in out-of-core mode.
+        output_format (str): 'pairstore' writes unique_gene_pairs.pairs (see PairStore),
+                             'pickle' writes the unique_gene_pairs.pkl dict of lists,
+                             None writes only the text file.
 
     Raises:
         IOError: If the input file is not found or the output directory is not writable.
-        ValueError: If a line in the input file does not have the expected format.
+        ValueError: If a line in the input file does not have the expected format, or
+                    the output format is unknown.
 
     Returns:
-        tuple: Paths to the output text file and the output pickle file.
+        tuple: Paths to the output text file and the pair store or pickle file (None
+               if not written).
     """
     logging.basicConfig(level=logging.INFO)
 
@@ -48,39 +540,42 @@ def unique_gene_pairs(filename, output_dir):
     if not os.access(output_dir, os.W_OK):
         logging.error("Output directory is not writable: %s", output_dir)
         raise IOError(f"Output directory is not writable: {output_dir}")
-    
+
+    if output_format not in ('pairstore', 'pickle', None):
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    if memory_budget is not None:
+        return _unique_gene_pairs_external(filename, output_dir, canonical, memory_budget, processes, output_format)
+
     unique_gene_pairs = {}
     unique_gene_pairs_counter = 0
+    seen_pairs = set()
 
     try:
         with open(filename, 'r') as f:
-            lines = f.readlines()
-            for line in lines:
-                parts = line.strip().split('\t')
-                if len(parts) < 2:
-                    logging.error("Invalid line format: %s", line)
-                    raise ValueError(f"Invalid line format: {line}")
-                gene1 = parts[0]
-                gene2 = parts[1]
-                values = parts[2:]  # Values are all parts after the first two
-                
+            for line in f:
+                gene1, gene2, values = _parse_pair_line(line)
+
+                key = pair_key(gene1, gene2, canonical)
+                if key in seen_pairs:
+                    continue
+                seen_pairs.add(key)
+
                 if gene1 not in unique_gene_pairs:
                     unique_gene_pairs[gene1] = [(gene2, values)]
-                    unique_gene_pairs_counter += 1
-                elif not contains_gene(unique_gene_pairs, gene1, gene2):
+                else:
                     unique_gene_pairs[gene1].append((gene2, values))
-                    unique_gene_pairs_counter += 1
+                unique_gene_pairs_counter += 1
     except IOError:
         logging.error("Error reading file: %s", filename)
         raise IOError(f"Error reading file: {filename}")
 
-    output_file = os.path.join(output_dir, 'unique_gene_pairs.txt')
-    with open(output_file, 'w') as f:
-        f.write(f"Number of unique gene pairs: {unique_gene_pairs_counter}\n")
-        for gene1, pairs in unique_gene_pairs.items():
-            for gene2, values in pairs:
-                f.write(f"{gene1}\t{gene2}\t{','.join(values)}\n")
-    
+    pairs = ((gene1, gene2, values) for gene1, pairs in unique_gene_pairs.items() for gene2, values in pairs)
+    output_file, store_file = _write_outputs(output_dir, unique_gene_pairs_counter, pairs,
+                                             output_format == 'pairstore')
+    if output_format != 'pickle':
+        return output_file, store_file
+
     pickle_file = os.path.join(output_dir, 'unique_gene_pairs.pkl')
     with open(pickle_file, 'wb') as f:
         pickle.dump(unique_gene_pairs, f)
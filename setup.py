@@ -6,6 +6,12 @@ setup(
     packages=find_packages(),
     install_requires=[
         # List your project dependencies here
+        'numpy',
     ],
+    entry_points={
+        'console_scripts': [
+            'bioinformatics-scripts=bioinformatics_scripts.cli:main',
+        ],
+    },
     test_suite='tests',
 )
\ No newline at end of file
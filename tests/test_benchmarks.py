@@ -0,0 +1,73 @@
+import copy
+import os
+import tempfile
+import pytest
+import benchmarks
+from benchmarks import (agi_gene_ids, compare_results, generate_tier, read_results, run_benchmarks,
+                        write_gene_pairs, write_results)
+from cluster_pathway_analysis import GeneTable, read_clusters, read_pathways
+from unique_gene_pairs import unique_gene_pairs
+
+TINY_TIER = {'genes': 300, 'clusters': 10, 'pathways': 20, 'pairs': 2000,
+             'queries': 50, 'subjects': 40, 'hits_per_query': 5, 'shards': 2}
+
+def test_agi_gene_ids():
+    genes = agi_gene_ids()
+    assert len(genes) == len(set(genes)) == 27680
+    assert genes[0] == 'AT1G01010'
+    assert {gene[:4] for gene in genes} == {'AT1G', 'AT2G', 'AT3G', 'AT4G', 'AT5G', 'ATCG', 'ATMG'}
+
+def test_generate_tier():
+    with tempfile.TemporaryDirectory() as tempdir:
+        for name in ('a', 'b'):
+            os.mkdir(os.path.join(tempdir, name))
+        data = generate_tier(os.path.join(tempdir, 'a'), TINY_TIER, seed=1)
+        generate_tier(os.path.join(tempdir, 'b'), TINY_TIER, seed=1)
+        with open(data['pairs']) as f, open(os.path.join(tempdir, 'b', 'pairs.txt')) as g:
+            assert f.read() == g.read()
+
+        genes = GeneTable()
+        assert len(read_clusters(data['clusters'], genes)) == TINY_TIER['clusters']
+        assert len(read_pathways(data['pathways'], genes)) <= TINY_TIER['pathways']
+        assert all(gene.startswith('AT') for gene in genes.genes)
+        with open(data['blast']) as f:
+            lines = f.readlines()
+        assert len(lines) == data['rows']['blast']
+        assert all(len(line.split('\t')) == 12 for line in lines)
+
+def test_gene_pairs_hubs_and_duplicates():
+    with tempfile.TemporaryDirectory() as tempdir:
+        pairs_file = os.path.join(tempdir, 'pairs.txt')
+        write_gene_pairs(pairs_file, 5000, n_genes=1000, duplicate_fraction=0.2)
+        with open(pairs_file) as f:
+            first_genes = [line.split('\t')[0] for line in f]
+        assert max(first_genes.count(gene) for gene in set(first_genes)) > 5000 // 20
+
+        output_file, _ = unique_gene_pairs(pairs_file, tempdir, output_format=None)
+        with open(output_file) as f:
+            assert len(f.readlines()) < 5000 * 0.9
+
+def test_run_and_compare_benchmarks(monkeypatch):
+    monkeypatch.setitem(benchmarks.TIERS, 'tiny', TINY_TIER)
+    results = run_benchmarks(['tiny'], repeat=1)
+    assert sorted(results['results']) == sorted(f"{name}[tiny]" for name in benchmarks.BENCHMARKS)
+    assert all(result['rows'] > 0 and result['peak_memory'] > 0 for result in results['results'].values())
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        baseline_file = os.path.join(tempdir, 'baseline.json')
+        write_results(baseline_file, results)
+        baseline = read_results(baseline_file)
+    assert compare_results(results, baseline) == []
+
+    slower = copy.deepcopy(results)
+    slower['results']['unique_gene_pairs[tiny]']['seconds'] += 1.0
+    regressions = compare_results(slower, baseline)
+    assert [(regression['benchmark'], regression['metric']) for regression in regressions] == [
+        ('unique_gene_pairs[tiny]', 'seconds')]
+
+    with pytest.raises(ValueError):
+        run_benchmarks(['huge'])
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import pytest
+from blast_results_parser import (best_hits, fasta_lengths, filter_blast_results, qualifying_match_counter,
+                                  merge_blast_shards, read_blast_tabular, reciprocal_best_hits)
+
+BLAST_LINES = [
+    "q1\ts1\t98.50\t100\t1\t0\t1\t100\t5\t104\t1e-50\t200.0\n",
+    "q1\ts2\t40.00\t50\t30\t2\t51\t100\t1\t50\t1e-5\t45.2\n",
+    "q2\ts1\t75.00\t80\t20\t1\t11\t90\t1\t80\t2e-30\t150\n",
+    "\n",
+    "q3\ts3\t60.00\t30\t12\t0\t1\t30\t1\t30\t0.5\t20.1\n",
+]
+
+@pytest.fixture
+def blast_file():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, 'blast.tsv')
+        with open(path, 'w') as f:
+            f.writelines(BLAST_LINES)
+        yield path
+
+def test_read_blast_tabular(blast_file):
+    chunks = list(read_blast_tabular(blast_file, chunk_bytes=100))
+    assert sum(len(hits) for hits in chunks) == 4
+
+    hits = list(read_blast_tabular(blast_file))[0]
+    assert [hits.ids.names[code] for code in hits['qseqid']] == ['q1', 'q1', 'q2', 'q3']
+    assert [hits.ids.names[code] for code in hits['sseqid']] == ['s1', 's2', 's1', 's3']
+    assert hits['pident'].tolist() == [98.5, 40.0, 75.0, 60.0]
+    assert hits['length'].tolist() == [100, 50, 80, 30]
+    assert hits['evalue'].tolist() == [1e-50, 1e-5, 2e-30, 0.5]
+    assert hits.lines[2] == BLAST_LINES[2]
+
+def test_read_blast_tabular_malformed(blast_file):
+    with open(blast_file, 'a') as f:
+        f.write("q4\ts4\t60.00\tthirty\t12\t0\t1\t30\t1\t30\t0.5\t20.1\n")
+    hits = list(read_blast_tabular(blast_file))[0]
+    assert len(hits) == 5
+    assert hits['pident'].tolist() == [98.5, 40.0, 75.0, 60.0, 60.0]
+    with pytest.raises(ValueError, match="line 6"):
+        hits['length']
+
+    with open(blast_file, 'w') as f:
+        f.writelines(BLAST_LINES + ["q5\ts5\t60.00\n"])
+    with pytest.raises(ValueError, match="line 6"):
+        list(read_blast_tabular(blast_file))
+
+    # A 13-field row and an 11-field row balance out in the chunk totals
+    with open(blast_file, 'w') as f:
+        f.writelines([BLAST_LINES[0], BLAST_LINES[1].rstrip('\n') + "\textra\n",
+                      BLAST_LINES[2].split('\t', 1)[1]] + BLAST_LINES[3:])
+    with pytest.raises(ValueError, match="line 2"):
+        list(read_blast_tabular(blast_file))
+
+    for bad_line in ("q5\ts5\t\t50\t12\t0\t1\t30\t1\t30\t0.5\t20.1\t60.00\n",
+                     "q 5\ts5\t60.00\t30\t12\t0\t1\t30\t1\t30\t0.5\t20.1\n"):
+        with open(blast_file, 'w') as f:
+            f.writelines(BLAST_LINES + [bad_line])
+        with pytest.raises(ValueError, match="line 6"):
+            list(read_blast_tabular(blast_file))
+
+def test_filter_blast_results(blast_file):
+    output_file = os.path.join(os.path.dirname(blast_file), 'filtered.tsv')
+    assert filter_blast_results(blast_file, output_file, max_evalue=1e-10, min_pident=70) == 2
+    with open(output_file) as f:
+        assert f.readlines() == [BLAST_LINES[0], BLAST_LINES[2]]
+
+def test_qualifying_match_counter(blast_file):
+    assert qualifying_match_counter(blast_file) == {'q1': 2, 'q2': 1, 'q3': 1}
+    assert qualifying_match_counter(blast_file, max_evalue=1e-3, min_bitscore=100) == {'q1': 1, 'q2': 1, 'q3': 0}
+
+    fasta_file = os.path.join(os.path.dirname(blast_file), 'queries.fa')
+    with open(fasta_file, 'w') as f:
+        f.write(">q1 first query\nMKV\n" + "A" * 97 + "\n>q2\n" + "A" * 100 + "\n>q3\n" + "A" * 40 + "\n")
+    query_lengths = fasta_lengths(fasta_file)
+    assert query_lengths == {'q1': 100, 'q2': 100, 'q3': 40}
+    assert qualifying_match_counter(blast_file, min_coverage=75, query_lengths=query_lengths) == {
+        'q1': 1, 'q2': 1, 'q3': 1}
+    with pytest.raises(ValueError):
+        qualifying_match_counter(blast_file, min_coverage=75)
+
+    output_file = os.path.join(os.path.dirname(blast_file), 'covered.tsv')
+    assert filter_blast_results(blast_file, output_file, min_coverage=75, query_lengths=query_lengths) == 3
+
+def test_best_hits(blast_file):
+    with open(blast_file, 'a') as f:
+        f.write("q2\ts4\t99.00\t80\t1\t0\t11\t90\t1\t80\t1e-40\t150\n")
+        f.write("q2\ts5\t99.00\t80\t1\t0\t11\t90\t1\t80\t1e-40\t150\n")
+
+    assert best_hits(blast_file) == {
+        'q1': ('s1', 200.0, 1e-50), 'q2': ('s4', 150.0, 1e-40), 'q3': ('s3', 20.1, 0.5)}
+    assert best_hits(blast_file, max_evalue=1e-10) == {'q1': ('s1', 200.0, 1e-50), 'q2': ('s4', 150.0, 1e-40)}
+
+def test_reciprocal_best_hits():
+    with tempfile.TemporaryDirectory() as tempdir:
+        forward_file = os.path.join(tempdir, 'forward.tsv')
+        reverse_file = os.path.join(tempdir, 'reverse.tsv')
+        output_file = os.path.join(tempdir, 'orthologs.txt')
+        with open(forward_file, 'w') as f:
+            f.write("a1\tb1\t90.0\t100\t10\t0\t1\t100\t1\t100\t1e-60\t250\n")
+            f.write("a1\tb2\t80.0\t100\t20\t0\t1\t100\t1\t100\t1e-40\t180\n")
+            f.write("a2\tb2\t85.0\t100\t15\t0\t1\t100\t1\t100\t1e-50\t210\n")
+            f.write("a3\tb3\t70.0\t100\t30\t0\t1\t100\t1\t100\t1e-20\t100\n")
+        with open(reverse_file, 'w') as f:
+            f.write("b2\ta1\t80.0\t100\t20\t0\t1\t100\t1\t100\t1e-40\t180\n")
+            f.write("b1\ta1\t90.0\t100\t10\t0\t1\t100\t1\t100\t1e-60\t250\n")
+            f.write("b2\ta2\t85.0\t100\t15\t0\t1\t100\t1\t100\t1e-50\t212\n")
+            f.write("b3\ta4\t70.0\t100\t30\t0\t1\t100\t1\t100\t1e-20\t100\n")
+
+        assert reciprocal_best_hits(forward_file, reverse_file, output_file) == 2
+        with open(output_file) as f:
+            assert f.readlines() == ["a1\tb1\t250.0\t250.0\t1e-60\t1e-60\n",
+                                     "a2\tb2\t210.0\t212.0\t1e-50\t1e-50\n"]
+
+def test_merge_blast_shards():
+    with tempfile.TemporaryDirectory() as tempdir:
+        shard_files = [os.path.join(tempdir, f'shard_{i}.tsv') for i in range(3)]
+        shard_hits = [
+            [("q1", "s1", 1e-50, 200), ("q1", "s2", 1e-10, 60), ("q3", "s1", 1e-5, 40)],
+            [("q2", "s5", 1e-20, 90), ("q3", "s6", 1e-30, 120), ("q3", "s7", 1e-30, 120)],
+            [("q1", "s8", 1e-60, 210), ("q2", "s9", 1e-20, 90), ("q4", "s1", 1e-3, 30)],
+        ]
+        lines = {}
+        for shard_file, hits in zip(shard_files, shard_hits):
+            with open(shard_file, 'w') as f:
+                for query, subject, evalue, bitscore in hits:
+                    lines[query, subject] = f"{query}\t{subject}\t90.0\t100\t10\t0\t1\t100\t1\t100\t{evalue}\t{bitscore}\n"
+                    f.write(lines[query, subject])
+
+        output_file = os.path.join(tempdir, 'merged.tsv')
+        assert merge_blast_shards(shard_files, output_file, top_n=2) == 7
+        with open(output_file) as f:
+            assert f.readlines() == [lines['q1', 's8'], lines['q1', 's1'], lines['q2', 's5'], lines['q2', 's9'],
+                                     lines['q3', 's6'], lines['q3', 's7'], lines['q4', 's1']]
+
+        assert merge_blast_shards(shard_files, output_file, query_order=['q1', 'q2', 'q3', 'q4']) == 9
+
+        with pytest.raises(ValueError):
+            merge_blast_shards(shard_files, output_file, query_order=['q3', 'q2', 'q1', 'q4'])
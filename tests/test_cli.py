@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import pytest
+import numpy as np
+from cli import Profiler, main
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_lazy_package_import():
+    code = ("import sys, bioinformatics_scripts, bioinformatics_scripts.cli\n"
+            "assert 'numpy' not in sys.modules and 'bioinformatics_scripts.blast_results_parser' not in sys.modules\n"
+            "assert bioinformatics_scripts.read_clusters.__module__ == 'bioinformatics_scripts.cluster_pathway_analysis'\n"
+            "assert 'bioinformatics_scripts.blast_results_parser' not in sys.modules\n"
+            "assert bioinformatics_scripts.unique_gene_pairs.unique_gene_pairs\n")
+    subprocess.run([sys.executable, '-c', code], cwd=PACKAGE_DIR, check=True)
+
+def test_lethal_pairs_profile():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'pairs.txt')
+        with open(input_file, 'w') as f:
+            f.write("GeneA\tGeneB\t0.9\nGeneC\tGeneD\t0.2\nGeneE\tGeneF\t0.5\n")
+        profile_file = os.path.join(tempdir, 'profile.json')
+
+        assert main(['lethal-pairs', input_file, '0.5', '-o', tempdir, '--profile', profile_file]) == 0
+
+        with open(os.path.join(tempdir, 'above_threshold.txt')) as f:
+            assert f.read() == "GeneA\tGeneB\nGeneE\tGeneF\n"
+        with open(profile_file) as f:
+            profile = json.load(f)
+        assert profile['command'] == 'lethal-pairs' and profile['rows'] == 3
+        assert list(profile['stages']) == ['import', 'parse', 'compute', 'write']
+        assert all(stage['seconds'] >= 0 and stage['peak_rss'] > 0 for stage in profile['stages'].values())
+        assert profile['stages']['import']['rows_per_second'] is None
+
+        assert main(['lethal-pairs', input_file, '0.3', '0.7', '-o', tempdir]) == 0
+        assert os.path.exists(os.path.join(tempdir, 'lethality_bins.txt'))
+
+def test_profiler_stage_peak_rss():
+    profiler = Profiler(enabled=True)
+    if not profiler._stage_rss:
+        pytest.skip("per-stage peak RSS needs /proc/self/clear_refs")
+    with profiler.stage('outer'):
+        with profiler.stage('large'):
+            block = np.ones(64 << 20, dtype=np.uint8)
+            del block
+        with profiler.stage('small'):
+            pass
+    stages = profiler.report('test', 1.0, None)['stages']
+    # Each stage reports its own peak, not the process high-water mark so far
+    assert stages['large']['peak_rss'] - stages['small']['peak_rss'] > 48 << 20
+    assert stages['outer']['peak_rss'] >= stages['large']['peak_rss']
+    assert profiler.report('test', 1.0, None)['peak_rss'] >= stages['large']['peak_rss']
+
+def test_blast_count(capsys):
+    with tempfile.TemporaryDirectory() as tempdir:
+        blast_file = os.path.join(tempdir, 'blast.tsv')
+        with open(blast_file, 'w') as f:
+            f.write("q1\ts1\t98.50\t100\t1\t0\t1\t100\t5\t104\t1e-50\t200.0\n"
+                    "q1\ts2\t40.00\t50\t30\t2\t51\t100\t1\t50\t1e-5\t45.2\n")
+
+        assert main(['blast-count', blast_file, '--max-evalue', '1e-10']) == 0
+        assert capsys.readouterr().out == "q1\t1\n"
+
+        assert main(['blast-count', os.path.join(tempdir, 'missing.tsv')]) == 1
+        with pytest.raises(SystemExit):
+            main(['blast-count', blast_file, '--unknown'])
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,7 +1,12 @@
+import gzip
+import io
+import math
 import os
 import tempfile
+import numpy as np
 import pytest
-from cluster_pathway_analysis import cluster_reader_dict_writer, pathways_reader_dict_writer, cluster_pathway_comparisons
+import cluster_pathway_analysis
+from cluster_pathway_analysis import cluster_reader_dict_writer, pathways_reader_dict_writer, cluster_pathway_comparisons, pathway_cluster_counts, hypergeometric_pvalues, benjamini_hochberg, GeneTable, read_clusters, read_pathways, cached_read, permutation_pvalues, incremental_pathway_cluster_counts
 
 # Test data files
 clusters_file = "test_clusters.txt"
@@ -14,8 +19,10 @@ Cluster2\tGeneD,GeneE
 """
 
 pathways_data = """
-Pathway1\tID1\tGeneA.1\tID123
-Pathway2\tID2\tGeneB\tID456
+Pathway1\tID1\tGeneA.1\tAT1G01010.1
+Pathway1\tID1\tGeneA.2\tAT1G01010.2
+Pathway2\tID2\tAt2g02020\tID456
+Pathway2\tID2\tGeneC\tID789
 """
 
 def create_temp_file(file_name, content):
@@ -41,12 +48,71 @@ def test_cluster_reader_dict_writer(setup_files):
 def test_pathways_reader_dict_writer(setup_files):
     """Test pathways_reader_dict_writer function."""
     expected_result = {
-        'ID1': ['GeneA'],
-        'ID2': ['GeneB']
+        'ID1': ['AT1G01010'],
+        'ID2': ['AT2G02020']
     }
     result = pathways_reader_dict_writer(pathways_file)
     assert result == expected_result
 
+def test_read_clusters_and_pathways(setup_files):
+    """Test read_clusters and read_pathways share interned gene IDs."""
+    genes = GeneTable()
+    clusters = read_clusters(clusters_file, genes)
+    pathways = read_pathways(pathways_file, genes)
+
+    assert list(clusters) == ['Cluster1', 'Cluster2']
+    assert genes.names(clusters['Cluster1']) == ['GeneA', 'GeneB', 'GeneC']
+    assert {pathway_id: genes.names(gene_ids) for pathway_id, gene_ids in pathways.items()} == {
+        'ID1': ['AT1G01010'],
+        'ID2': ['AT2G02020']
+    }
+
+    pc, npc, pnc, npnc = pathway_cluster_counts(clusters, pathways)
+    assert pc.tolist() == [[0, 0], [0, 0]]
+    assert npc.tolist() == [[3, 2], [3, 2]]
+
+def test_duplicated_cluster_gene():
+    """Test a gene listed twice in a cluster counts once, for gene name lists and gene ID arrays alike."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        duplicated_file = os.path.join(tempdir, 'clusters.txt')
+        with open(duplicated_file, 'w') as f:
+            f.write("cluster\tgenes\nCluster1\tAT1G01010,AT1G01020,AT1G01010\n")
+        genes = GeneTable()
+        encoded = pathway_cluster_counts(read_clusters(duplicated_file, genes),
+                                         {'ID1': np.array([genes.intern('AT1G01010')], dtype=np.int32)})
+        listed = pathway_cluster_counts(cluster_reader_dict_writer(duplicated_file), {'ID1': ['AT1G01010']})
+        for encoded_counts, listed_counts in zip(encoded, listed):
+            assert encoded_counts.tolist() == listed_counts.tolist()
+        assert [counts.tolist() for counts in listed] == [[[1]], [[1]], [[0]], [[27678]]]
+
+def test_cached_read(setup_files, monkeypatch):
+    """Test cached_read only parses a file again once it changes."""
+    calls = []
+
+    def read_pathways_counted(file_path, gene_table):
+        calls.append(file_path)
+        return read_pathways(file_path, gene_table)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first_genes, second_genes = GeneTable(), GeneTable()
+        first = cached_read(read_pathways_counted, pathways_file, first_genes, cache_dir)
+        second = cached_read(read_pathways_counted, pathways_file, second_genes, cache_dir)
+        assert len(calls) == 1
+        assert {k: first_genes.names(v) for k, v in first.items()} == \
+            {k: second_genes.names(v) for k, v in second.items()}
+
+        with open(pathways_file, 'a') as f:
+            f.write("Pathway3\tID3\tGeneD\tAT3G03030\n")
+        third_genes = GeneTable()
+        third = cached_read(read_pathways_counted, pathways_file, third_genes, cache_dir)
+        assert len(calls) == 2
+        assert third_genes.names(third['ID3']) == ['AT3G03030']
+
+        # A new parser format version does not reuse entries of the old one
+        monkeypatch.setattr(cluster_pathway_analysis, 'CACHE_FORMAT_VERSION', 2)
+        cached_read(read_pathways_counted, pathways_file, GeneTable(), cache_dir)
+        assert len(calls) == 3
+
 def test_cluster_pathway_comparisons(setup_files):
     """Test cluster_pathway_comparisons function."""
     cluster_dict = {
@@ -60,9 +126,9 @@ def test_cluster_pathway_comparisons(setup_files):
     expected_output = (
         "Pathway_cluster\tPC\tnPC\tPnC\tnPnC\n"
         "ID1_Cluster1\t1\t2\t0\t27677\n"
-        "ID1_Cluster2\t0\t3\t0\t27677\n"
+        "ID1_Cluster2\t0\t2\t1\t27677\n"
         "ID2_Cluster1\t1\t2\t0\t27677\n"
-        "ID2_Cluster2\t1\t2\t0\t27677\n"
+        "ID2_Cluster2\t0\t2\t1\t27677\n"
     )
 
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -72,5 +138,134 @@ def test_cluster_pathway_comparisons(setup_files):
             result = f.read()
         assert result == expected_output
 
+def test_cluster_pathway_comparisons_filtered_gzip():
+    """Test cluster_pathway_comparisons with a minimum PC filter and gzip output."""
+    cluster_dict = {
+        'Cluster1': ['GeneA', 'GeneB', 'GeneC'],
+        'Cluster2': ['GeneD', 'GeneE']
+    }
+    pathways_dict = {
+        'ID1': ['GeneA'],
+        'ID2': ['GeneB', 'GeneD']
+    }
+    expected_output = (
+        "Pathway_cluster\tPC\tnPC\tPnC\tnPnC\n"
+        "ID1_Cluster1\t1\t2\t0\t27677\n"
+        "ID2_Cluster1\t1\t2\t1\t27676\n"
+        "ID2_Cluster2\t1\t1\t1\t27677\n"
+    )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_output_file = os.path.join(temp_dir, 'test_output.txt.gz')
+        cluster_pathway_comparisons(cluster_dict, pathways_dict, temp_output_file, min_pc=1)
+        with gzip.open(temp_output_file, 'rt') as f:
+            result = f.read()
+        assert result == expected_output
+
+    buffer = io.StringIO()
+    cluster_pathway_comparisons(cluster_dict, pathways_dict, buffer, min_pc=1)
+    assert buffer.getvalue() == expected_output
+
+def test_incremental_pathway_cluster_counts(monkeypatch):
+    """Test incremental_pathway_cluster_counts only recomputes changed pathways and clusters."""
+    cluster_dict = {
+        'Cluster1': ['GeneA', 'GeneB', 'GeneC'],
+        'Cluster2': ['GeneD', 'GeneE']
+    }
+    pathways_dict = {
+        'ID1': ['GeneA'],
+        'ID2': ['GeneB', 'GeneD']
+    }
+    recomputed = []
+
+    pathway_cluster_pc = cluster_pathway_analysis._pathway_cluster_pc
+
+    def counting_pathway_cluster_pc(clusters, pathways):
+        recomputed.append((list(pathways), list(clusters)))
+        return pathway_cluster_pc(clusters, pathways)
+
+    monkeypatch.setattr(cluster_pathway_analysis, '_pathway_cluster_pc', counting_pathway_cluster_pc)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = os.path.join(temp_dir, 'counts.npz')
+        incremental_pathway_cluster_counts(cluster_dict, pathways_dict, store)
+        assert recomputed == [(['ID1', 'ID2'], ['Cluster1', 'Cluster2'])]
+
+        recomputed.clear()
+        pathways_dict['ID2'] = ['GeneD', 'GeneE']
+        cluster_dict['Cluster3'] = ['GeneA']
+        result = incremental_pathway_cluster_counts(cluster_dict, pathways_dict, store)
+        assert recomputed == [(['ID2'], ['Cluster1', 'Cluster2', 'Cluster3']), (['ID1'], ['Cluster3'])]
+
+    expected = pathway_cluster_counts(cluster_dict, pathways_dict)
+    for result_counts, expected_counts in zip(result, expected):
+        assert result_counts.tolist() == expected_counts.tolist()
+
+def test_pathway_cluster_counts():
+    """Test pathway_cluster_counts against per-pair set intersections."""
+    cluster_dict = {
+        'Cluster1': ['GeneA', 'GeneB', 'GeneC'],
+        'Cluster2': ['GeneD', 'GeneE'],
+        'Cluster3': ['GeneA', 'GeneE']
+    }
+    pathways_dict = {
+        'ID1': ['GeneA', 'GeneE'],
+        'ID2': ['GeneB'],
+        'ID3': []
+    }
+
+    pc, npc, pnc, npnc = pathway_cluster_counts(cluster_dict, pathways_dict)
+
+    assert pc.tolist() == [[1, 1, 2], [1, 0, 0], [0, 0, 0]]
+    assert npc.tolist() == [[2, 1, 0], [2, 2, 2], [3, 2, 2]]
+    assert pnc.tolist() == [[1, 1, 0], [0, 1, 1], [0, 0, 0]]
+    assert (pc + npc + pnc + npnc == 27680).all()
+
+def test_hypergeometric_pvalues():
+    """Test hypergeometric_pvalues against the exact upper tail."""
+    pc = [[0, 2, 3], [1, 5, 40]]
+    npc = [[4, 3, 0], [9, 0, 10]]
+    pnc = [[6, 8, 2], [0, 20, 5]]
+    npnc = [[90, 87, 95], [90, 75, 45]]
+
+    result = hypergeometric_pvalues(pc, npc, pnc, npnc)
+
+    for row in range(2):
+        for col in range(3):
+            a, b, c, d = pc[row][col], npc[row][col], pnc[row][col], npnc[row][col]
+            total, pathway_size, cluster_size = a + b + c + d, a + c, a + b
+            expected = sum(math.comb(pathway_size, k) * math.comb(total - pathway_size, cluster_size - k)
+                           for k in range(a, min(pathway_size, cluster_size) + 1)) / math.comb(total, cluster_size)
+            assert result[row][col] == pytest.approx(expected, rel=1e-9)
+
+def test_permutation_pvalues(monkeypatch):
+    """Test permutation_pvalues is reproducible and separates enriched from random overlaps."""
+    cluster_dict = {
+        'Cluster1': [f'Gene{i}' for i in range(10)],
+        'Cluster2': [f'Gene{i}' for i in range(10, 15)]
+    }
+    pathways_dict = {
+        'ID1': [f'Gene{i}' for i in range(8)],
+        'ID2': ['Gene12', 'Gene40']
+    }
+
+    result = permutation_pvalues(cluster_dict, pathways_dict, 500, seed=7, processes=1, total_genes=100)
+    assert result[0][0] < 0.01
+    assert result[0][1] == 1
+    assert result[1][0] == 1
+    assert 0.05 < result[1][1] < 1
+
+    parallel = permutation_pvalues(cluster_dict, pathways_dict, 500, seed=7, processes=2, total_genes=100)
+    assert parallel.tolist() == result.tolist()
+
+    monkeypatch.setattr(cluster_pathway_analysis, 'PERMUTATION_LOOKUP_LIMIT', 0)
+    sparse_lookup = permutation_pvalues(cluster_dict, pathways_dict, 500, seed=7, processes=1, total_genes=100)
+    assert sparse_lookup.tolist() == result.tolist()
+
+def test_benjamini_hochberg():
+    """Test benjamini_hochberg step-up adjustment."""
+    result = benjamini_hochberg([0.01, 0.04, 0.03, 0.5])
+    assert result.tolist() == pytest.approx([0.04, 0.04 * 4 / 3, 0.04 * 4 / 3, 0.5])
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
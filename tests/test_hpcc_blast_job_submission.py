@@ -1,5 +1,60 @@
+import os
+import stat
+import sys
+import tempfile
 import pytest
-from blast_slurm_submit import generate_slurm_script, submit_slurm_job
+from hpcc_blast_job_submission import (JobHistory, JobResult, LocalExecutor, Pipeline, ShardManifest, SlurmExecutor,
+                                       generate_slurm_array_script, generate_slurm_script, parse_job_log,
+                                       pending_shards, shard_fasta, submit_blast_shards, submit_slurm_job)
+
+FAKE_SBATCH = """#!{python}
+import os, sys
+log = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sbatch.log')
+with open(log, 'a') as f:
+    f.write(' '.join(sys.argv[1:-1]) + '\\n')
+with open(log) as f:
+    print('Submitted batch job', 100 + len(f.readlines()))
+"""
+
+FAKE_SQUEUE = """#!{python}
+import sys
+print('{queued}')
+"""
+
+FAKE_SACCT = """#!{python}
+print('101|0:0|35|COMPLETED')
+print('102_0|0:0|20|COMPLETED')
+print('102_1|2:0|21|FAILED')
+print('103|0:0|0|CANCELLED by 0')
+print('104|0:0|0|PENDING')
+print('105|0:0|600|TIMEOUT')
+print('106|0:125|30|OUT_OF_MEMORY')
+print('107|0:9|12|CANCELLED by 1000')
+"""
+
+FAKE_BLASTP = """#!{python}
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+with open(args['-query']) as query, open(args['-out'], 'w') as out:
+    for line in query:
+        if line.startswith('>'):
+            out.write(line[1:].split()[0] + '\\ts1\\t90.0\\t100\\t10\\t0\\t1\\t100\\t1\\t100\\t1e-50\\t200\\n')
+"""
+
+FAKE_GNU_TIME = """#!{python}
+import subprocess, sys
+assert sys.argv[1] == '-v'
+returncode = subprocess.run(sys.argv[2:]).returncode
+sys.stderr.write('\\tElapsed (wall clock) time (h:mm:ss or m:ss): 0:01.50\\n')
+sys.stderr.write('\\tMaximum resident set size (kbytes): 4096\\n')
+sys.exit(returncode)
+"""
+
+def write_fake_command(path, template, **fields):
+    with open(path, 'w') as f:
+        f.write(template.format(python=sys.executable, **fields))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
 
 def test_generate_slurm_script():
     time = "00:30:00"
@@ -23,6 +78,293 @@ def test_generate_slurm_script():
     assert f"-out {output_file}" in slurm_script
     assert "-outfmt 6" in slurm_script
 
+def test_shard_fasta():
+    with tempfile.TemporaryDirectory() as tempdir:
+        query_file = os.path.join(tempdir, 'query.fa')
+        with open(query_file, 'w') as f:
+            f.write(">p1 long\n" + "M" * 60 + "\n" + "M" * 40 + "\n")
+            for i in range(2, 12):
+                f.write(f">p{i}\n" + "M" * 10 + "\n")
+
+        shard_files = shard_fasta(query_file, 2, tempdir)
+
+        assert shard_files == [os.path.join(tempdir, 'shard_0.fa'), os.path.join(tempdir, 'shard_1.fa')]
+        with open(shard_files[0]) as f:
+            assert f.read() == ">p1 long\n" + "M" * 60 + "\n" + "M" * 40 + "\n"
+        with open(shard_files[1]) as f:
+            assert f.read().count('>') == 10
+
+        assert len(shard_fasta(query_file, 50, tempdir)) == 11
+
+def test_generate_slurm_array_script():
+    slurm_script = generate_slurm_array_script("01:00:00", 1, 8, "4G", "SMITH", "shards/shard", 16,
+                                               "<prot-db-location>", "results/blast", max_concurrent=4)
+
+    assert "#SBATCH --array=0-15%4" in slurm_script
+    assert "#SBATCH --cpus-per-task=8" in slurm_script
+    assert "-query shards/shard_${SLURM_ARRAY_TASK_ID}.fa" in slurm_script
+    assert "-out results/blast_${SLURM_ARRAY_TASK_ID}.tsv -outfmt 6" in slurm_script
+    assert "-num_threads 8" in slurm_script
+
+def test_pipeline(monkeypatch):
+    with tempfile.TemporaryDirectory() as tempdir:
+        monkeypatch.chdir(tempdir)
+        sbatch = write_fake_command(os.path.join(tempdir, 'sbatch'), FAKE_SBATCH)
+        squeue = write_fake_command(os.path.join(tempdir, 'squeue'), FAKE_SQUEUE, queued='103_2 Priority')
+
+        pipeline = Pipeline(sbatch=sbatch, squeue=squeue)
+        pipeline.add_stage('analysis', '#!/bin/bash\n', after=['parse', 'merge'])
+        pipeline.add_stage('blast', '#!/bin/bash\n')
+        pipeline.add_stage('merge', '#!/bin/bash\n', after=['blast'])
+        pipeline.add_stage('parse', '#!/bin/bash\n', after=['merge'])
+
+        assert pipeline.submit() == {'blast': '101', 'merge': '102', 'parse': '103', 'analysis': '104'}
+        with open(os.path.join(tempdir, 'sbatch.log')) as f:
+            assert f.read().splitlines() == ['', '--dependency=afterok:101 --kill-on-invalid-dep=yes',
+                                             '--dependency=afterok:102 --kill-on-invalid-dep=yes',
+                                             '--dependency=afterok:103:102 --kill-on-invalid-dep=yes']
+        assert pipeline.pending() == ['parse']
+        assert sorted(os.listdir(tempdir)) == ['sbatch', 'sbatch.log', 'squeue']
+
+        with pytest.raises(ValueError):
+            pipeline.add_stage('blast', '#!/bin/bash\n')
+        pipeline.add_stage('cycle', '#!/bin/bash\n', after=['cycle'])
+        with pytest.raises(ValueError):
+            pipeline.order()
+
+def test_slurm_executor_wait():
+    with tempfile.TemporaryDirectory() as tempdir:
+        # 104 was submitted without --kill-on-invalid-dep and is stuck behind 102
+        squeue = write_fake_command(os.path.join(tempdir, 'squeue'), FAKE_SQUEUE,
+                                    queued='104 DependencyNeverSatisfied')
+        sacct = write_fake_command(os.path.join(tempdir, 'sacct'), FAKE_SACCT)
+
+        executor = SlurmExecutor(squeue=squeue, sacct=sacct)
+        assert executor.pending(['101', '104']) == []
+        # Killed jobs never report the exit status of a successful one
+        assert executor.wait(['101', '102', '103', '104', '105', '106', '107']) == {
+            '101': JobResult('101', 0, 35.0),
+            '102_0': JobResult('102_0', 0, 20.0),
+            '102_1': JobResult('102_1', 2, 21.0),
+            '103': JobResult('103', None, 0.0),
+            '104': JobResult('104', None, 0.0),
+            '105': JobResult('105', 1, 600.0),
+            '106': JobResult('106', 128 + 125, 30.0),
+            '107': JobResult('107', 128 + 9, 12.0),
+        }
+
+def test_local_executor():
+    with tempfile.TemporaryDirectory() as tempdir:
+        blastp = write_fake_command(os.path.join(tempdir, 'blastp'), FAKE_BLASTP)
+        query_file = os.path.join(tempdir, 'query.fa')
+        with open(query_file, 'w') as f:
+            f.write(">p1\nMKV\n>p2\nMKVL\n>p3\nMK\n")
+        shard_fasta(query_file, 2, tempdir)
+
+        blast_script = generate_slurm_array_script("00:10:00", 1, 2, "1G", "SMITH", os.path.join(tempdir, 'shard'), 2,
+                                                   "db", os.path.join(tempdir, 'blast'), blastp=blastp)
+        merged_file = os.path.join(tempdir, 'merged.tsv')
+        merge_script = f"#!/bin/bash\ncat {tempdir}/blast_0.tsv {tempdir}/blast_1.tsv > {merged_file}\n"
+
+        with LocalExecutor(max_workers=2, output_dir=tempdir) as executor:
+            pipeline = Pipeline(executor)
+            pipeline.add_stage('blast', blast_script)
+            pipeline.add_stage('merge', merge_script, after=['blast'])
+            pipeline.add_stage('fail', "#!/bin/bash\nexit 3\n")
+            pipeline.add_stage('skipped', f"#!/bin/bash\ntouch {tempdir}/never\n", after=['fail', 'merge'])
+            pipeline.submit()
+            results = pipeline.wait()
+
+        assert [(result.job_id, result.exit_status) for result in results['blast']] == [('1_0', 0), ('1_1', 0)]
+        assert results['merge'].exit_status == 0
+        assert results['fail'].exit_status == 3
+        assert results['skipped'] == JobResult('4', None, 0.0)
+        assert all(result.wall_time >= 0 for result in results['blast'])
+        with open(merged_file) as f:
+            assert [line.split('\t')[0] for line in f] == ['p1', 'p2', 'p3']
+        assert not os.path.exists(os.path.join(tempdir, 'never'))
+        assert os.path.exists(os.path.join(tempdir, 'slurm-1_1.out'))
+
+def test_submit_blast_shards_resume():
+    with tempfile.TemporaryDirectory() as tempdir:
+        blastp = write_fake_command(os.path.join(tempdir, 'blastp'), FAKE_BLASTP)
+        db_location = os.path.join(tempdir, 'db')
+        with open(db_location + '.pin', 'w') as f:
+            f.write('db')
+        query_file = os.path.join(tempdir, 'query.fa')
+        with open(query_file, 'w') as f:
+            f.write(">p1\nMKV\n>p2\nMKVL\n>p3\nMK\n")
+        shard_prefix, output_prefix = os.path.join(tempdir, 'shard'), os.path.join(tempdir, 'blast')
+        shard_fasta(query_file, 3, tempdir)
+
+        def submit(executor):
+            job_id = submit_blast_shards(executor, "00:10:00", 1, 1, "1G", "SMITH", shard_prefix, 3, db_location,
+                                         output_prefix, blastp=blastp)
+            return sorted(executor.wait([job_id])) if job_id else []
+
+        with LocalExecutor(max_workers=2, output_dir=tempdir) as executor:
+            assert submit(executor) == ['1_0', '1_1', '1_2']
+            assert submit(executor) == []
+
+            # Truncated output and changed query shard are rerun; the rest are kept
+            with open(output_prefix + '_1.tsv', 'a') as f:
+                f.write("p2\ts1\t90.0")
+            with open(shard_prefix + '_2.fa', 'a') as f:
+                f.write(">p4\nMKVLA\n")
+            manifest = ShardManifest(output_prefix + '_manifest.json')
+            assert manifest.status(output_prefix + '_0.tsv', list(manifest.entries.values())[0]['inputs']) == 'complete'
+            assert sorted(pending_shards(shard_prefix, 3, db_location, output_prefix, manifest)) == [1, 2]
+            assert submit(executor) == ['2_1', '2_2']
+
+            # A rebuilt database makes every shard stale
+            os.utime(db_location + '.pin', ns=(0, 0))
+            assert submit(executor) == ['3_0', '3_1', '3_2']
+
+        with open(output_prefix + '_2.tsv') as f:
+            assert [line.split('\t')[0] for line in f] == ['p3', 'p4']
+
+def test_submit_blast_shards_in_flight():
+    with tempfile.TemporaryDirectory() as tempdir:
+        db_location = os.path.join(tempdir, 'db')
+        with open(db_location + '.pin', 'w') as f:
+            f.write('db')
+        query_file = os.path.join(tempdir, 'query.fa')
+        with open(query_file, 'w') as f:
+            f.write(">p1\nMKV\n>p2\nMKVL\n>p3\nMK\n")
+        shard_prefix, output_prefix = os.path.join(tempdir, 'shard'), os.path.join(tempdir, 'blast')
+        shard_fasta(query_file, 3, tempdir)
+
+        class QueuedExecutor:
+            def __init__(self):
+                self.scripts, self.queued = [], set()
+            def submit(self, script, dependencies=None):
+                self.scripts.append(script)
+                job_id = str(len(self.scripts))
+                self.queued.add(job_id)
+                return job_id
+            def pending(self, job_ids):
+                return [job_id for job_id in job_ids if job_id in self.queued]
+
+        def submit(executor):
+            return submit_blast_shards(executor, "00:10:00", 1, 1, "1G", "SMITH", shard_prefix, 3, db_location,
+                                       output_prefix)
+
+        executor = QueuedExecutor()
+        assert submit(executor) == '1'
+        # The first array has not written any output yet, but is still queued
+        assert submit(executor) is None
+        assert len(executor.scripts) == 1
+
+        # Once it has left the queue without finishing, its shards are submitted again
+        executor.queued.clear()
+        assert submit(executor) == '2'
+        assert "#SBATCH --array=0,1,2" in executor.scripts[1]
+        assert ShardManifest(output_prefix + '_manifest.json').job_id(output_prefix + '_0.tsv') == '2'
+
+JOB_LOG = """Job ID: 555
+{maxrss}
+real\t{real}
+user\t0m1.000s
+sys\t0m0.100s
+JobId=555_{task} ArrayJobId=555 ArrayTaskId={task} JobName=run_blast_SMITH
+   JobState=RUNNING Reason=None Dependency=(null)
+   RunTime=00:00:{task:02d} TimeLimit=01:00:00 TimeMin=N/A
+   NumNodes=1 NumCPUs={cpus} NumTasks=1 CPUs/Task={cpus} ReqB:S:C:T=0:0:*:*
+   MinCPUsNode={cpus} MinMemoryNode=2G MinTmpDiskNode=0
+"""
+
+def test_job_history():
+    with tempfile.TemporaryDirectory() as tempdir:
+        log_file = os.path.join(tempdir, 'slurm-555_0.out')
+        with open(log_file, 'w') as f:
+            f.write(JOB_LOG.format(maxrss="\tMaximum resident set size (kbytes): 2048", real="1m30.500s",
+                                   task=0, cpus=4))
+        assert parse_job_log(log_file) == {'job_id': '555_0', 'runtime': 90.5, 'max_rss': 2 << 20, 'cpus': 4,
+                                           'time_limit': 3600.0, 'requested_memory': 2 << 30, 'timed_out': False,
+                                           'min_runtime': None}
+
+        # Searches whose cpu-seconds grow with query residues times database residues
+        db_location = os.path.join(tempdir, 'db')
+        with open(db_location + '.psq', 'w') as f:
+            f.write('M' * 1000)
+        history = JobHistory(os.path.join(tempdir, 'history.jsonl'))
+        for task, residues in enumerate([10, 20, 40]):
+            query_file = os.path.join(tempdir, f'query_{task}.fa')
+            with open(query_file, 'w') as f:
+                f.write(">p1\n" + 'M' * residues + "\n")
+            with open(log_file, 'w') as f:
+                f.write(JOB_LOG.format(maxrss="", real=f"0m{residues}s", task=task, cpus=2))
+            history.add_job_log(log_file, query_file, db_location)
+        history.add_job_log(log_file, query_file, db_location)
+        assert len(history.records()) == 3
+
+        a, b = history.fit()['runtime']
+        assert a == pytest.approx(2 / 1000) and b == pytest.approx(0, abs=1e-6)
+        assert history.fit()['memory'] is None
+        assert history.suggest(400, 1000, 2, margin=1.5) == {'time': '00:10:00', 'memory': None, 'cpus_per_task': 2}
+
+        # Resources left out are filled in from the history for the largest pending shard
+        shard_prefix = os.path.join(tempdir, 'shard')
+        with open(query_file, 'w') as f:
+            f.write(">p1\n" + 'M' * 3000 + "\n>p2\nMK\n")
+        shard_fasta(query_file, 2, tempdir)
+        with open(log_file, 'w') as f:
+            f.write(JOB_LOG.format(maxrss="Maximum resident set size (kbytes): 4096", real="50m2s", task=5, cpus=2))
+        history.add_job_log(log_file, query_file, db_location)
+
+        scripts = []
+        class RecordingExecutor:
+            def submit(self, script, dependencies=None):
+                scripts.append(script)
+                return '1'
+        with pytest.raises(ValueError):
+            submit_blast_shards(RecordingExecutor(), None, 1, 1, None, "SMITH", shard_prefix, 2, db_location,
+                                os.path.join(tempdir, 'blast'))
+        submit_blast_shards(RecordingExecutor(), None, 1, 1, None, "SMITH", shard_prefix, 2, db_location,
+                            os.path.join(tempdir, 'blast'), history=history, margin=2)
+        assert "#SBATCH --time=03:20:00" in scripts[0]
+        assert "#SBATCH --mem=1024M" in scripts[0]
+
+        # A job killed at its 1 hour limit is kept as a lower bound for searches at least its size
+        assert history.suggest(200, 1000, 2, margin=1)['time'] == '00:05:00'
+        with open(log_file, 'w') as f:
+            f.write(JOB_LOG.format(maxrss="", real="60m0s", task=6, cpus=2) +
+                    "slurmstepd: error: *** JOB 555 ON node1 CANCELLED AT 2024-01-01T01:00:00 DUE TO TIME LIMIT ***\n")
+        record = history.add_job_log(log_file, query_file, db_location)
+        assert record['timed_out'] and record['min_runtime'] == 3600.0
+        query_work = record['query_residues'] * record['db_size']
+        assert history.fit()['runtime_floors'] == [(query_work, 7200.0)]
+        assert history.suggest(200, 1000, 2, margin=1)['time'] == '00:05:00'
+        assert history.suggest(record['query_residues'], 1000, 2, margin=1.5)['time'] == '01:30:00'
+
+def test_job_history_from_job_script():
+    with tempfile.TemporaryDirectory() as tempdir:
+        blastp = write_fake_command(os.path.join(tempdir, 'blastp'), FAKE_BLASTP)
+        gnu_time = write_fake_command(os.path.join(tempdir, 'time'), FAKE_GNU_TIME)
+        db_location = os.path.join(tempdir, 'db')
+        with open(db_location + '.psq', 'w') as f:
+            f.write('M' * 1000)
+        query_file = os.path.join(tempdir, 'query.fa')
+        with open(query_file, 'w') as f:
+            f.write(">p1\nMKV\n>p2\nMKVL\n")
+        shard_prefix = os.path.join(tempdir, 'shard')
+        shard_fasta(query_file, 2, tempdir)
+
+        # The log the array script itself writes carries blastp's peak memory
+        script = generate_slurm_array_script("00:10:00", 1, 1, "1G", "SMITH", shard_prefix, 2, db_location,
+                                             os.path.join(tempdir, 'blast'), blastp=blastp, gnu_time=gnu_time)
+        with LocalExecutor(output_dir=tempdir) as executor:
+            job_id = executor.submit(script)
+            assert all(result.exit_status == 0 for result in executor.wait([job_id]).values())
+
+        history = JobHistory(os.path.join(tempdir, 'history.jsonl'))
+        for task in range(2):
+            record = history.add_job_log(os.path.join(tempdir, f'slurm-{job_id}_{task}.out'),
+                                         f'{shard_prefix}_{task}.fa', db_location)
+            assert record['max_rss'] == 4096 * 1024 and record['runtime'] == 1.5
+        assert history.fit()['memory'] == (4096 * 1024, 0.0, 0.0)
+        assert history.suggest(4, 1000, 1, margin=2, min_memory=0)['memory'] == '8M'
+
 
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
@@ -1,7 +1,8 @@
 import os
 import tempfile
 import pytest
-from lethal_gene_pairs import lethal_gene_pairs
+import lethal_gene_pairs as lethal_gene_pairs_module
+from lethal_gene_pairs import lethal_gene_pair_bins, lethal_gene_pairs
 
 def test_lethal_gene_pairs():
     lethality_threshold = 0.5
@@ -38,3 +39,86 @@ def test_lethal_gene_pairs():
 
         except Exception as e:
             pytest.fail(f"Test failed with exception: {e}")
+
+def test_lethal_gene_pair_bins():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            f.write("gene1\tgene2\t0.4\n")
+            f.write("gene3\tgene4\t0.9\n")
+            f.write("gene5\tgene6\t0.5\n")
+            f.write("gene7\tgene8\tnan\n")
+            f.write("gene9\tgene10\t0.8\n")
+
+        counts = lethal_gene_pair_bins(input_file, [0.8, 0.5], tempdir)
+
+        assert counts == [2, 1, 2]
+        with open(os.path.join(tempdir, 'lethality_bin_0.txt')) as f:
+            assert f.read() == "gene1\tgene2\ngene7\tgene8\n"
+        with open(os.path.join(tempdir, 'lethality_bin_1.txt')) as f:
+            assert f.read() == "gene5\tgene6\n"
+        with open(os.path.join(tempdir, 'lethality_bin_2.txt')) as f:
+            assert f.read() == "gene3\tgene4\ngene9\tgene10\n"
+        with open(os.path.join(tempdir, 'lethality_bins.txt')) as f:
+            assert f.read() == ("bin\tlower\tupper\tcount\n"
+                                "0\t-inf\t0.5\t2\n"
+                                "1\t0.5\t0.8\t1\n"
+                                "2\t0.8\tinf\t2\n")
+
+        with pytest.raises(ValueError):
+            lethal_gene_pair_bins(input_file, [0.5, 0.5], tempdir)
+
+def test_lethal_gene_pairs_invalid_value():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            f.write("gene1\tgene2\t0.4\n")
+            f.write("gene3\tgene4\tlethal\n")
+
+        with pytest.raises(ValueError, match="line 2"):
+            lethal_gene_pairs(input_file, 0.5, tempdir)
+
+def test_lethal_gene_pairs_malformed_keeps_outputs():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            f.write("gene1\tgene2\t0.4\ngene3\tgene4\t0.6\n")
+        lethal_gene_pairs(input_file, 0.5, tempdir)
+
+        with open(input_file, 'a') as f:
+            f.write("gene5\tgene6\tlethal\n")
+        with pytest.raises(ValueError, match="line 3"):
+            lethal_gene_pairs(input_file, 0.5, tempdir)
+        with open(os.path.join(tempdir, 'above_threshold.txt')) as f:
+            assert f.read() == "gene3\tgene4\n"
+        with open(os.path.join(tempdir, 'below_threshold.txt')) as f:
+            assert f.read() == "gene1\tgene2\n"
+        assert sorted(os.listdir(tempdir)) == ['above_threshold.txt', 'below_threshold.txt', 'input.txt']
+
+def test_lethal_gene_pairs_parallel(monkeypatch):
+    monkeypatch.setattr(lethal_gene_pairs_module, 'CHUNK_BYTES', 64)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            for i in range(500):
+                f.write(f"gene{i}\tgene{i + 1}\t{(i * 37 % 100) / 100}\n")
+
+        serial_dir = os.path.join(tempdir, 'serial')
+        parallel_dir = os.path.join(tempdir, 'parallel')
+        os.mkdir(serial_dir)
+        os.mkdir(parallel_dir)
+
+        assert (lethal_gene_pair_bins(input_file, [0.25, 0.75], serial_dir) ==
+                lethal_gene_pair_bins(input_file, [0.25, 0.75], parallel_dir, processes=3))
+        for name in ['lethality_bin_0.txt', 'lethality_bin_1.txt', 'lethality_bin_2.txt', 'lethality_bins.txt']:
+            with open(os.path.join(serial_dir, name)) as serial, open(os.path.join(parallel_dir, name)) as parallel:
+                assert serial.read() == parallel.read()
+
+        with open(input_file, 'a') as f:
+            f.write("gene500\tgene501\n")
+            f.write("gene502\tgene503\tlethal\n")
+        with pytest.raises(ValueError, match="Invalid line format at line 501"):
+            lethal_gene_pairs(input_file, 0.5, parallel_dir, processes=3)
+        assert sorted(os.listdir(parallel_dir)) == ['lethality_bin_0.txt', 'lethality_bin_1.txt', 'lethality_bin_2.txt',
+                                                    'lethality_bins.txt']
@@ -2,7 +2,8 @@ import os
 import pickle
 import tempfile
 import pytest
-from unique_gene_pairs import unique_gene_pairs
+import unique_gene_pairs as unique_gene_pairs_module
+from unique_gene_pairs import PairStore, unique_gene_pairs, write_pair_store
 
 def test_unique_gene_pairs():
     # Create a temporary directory
@@ -16,7 +17,7 @@ def test_unique_gene_pairs():
             f.write("gene4\tgene5\tvalue7\tvalue8\n")
         
         # Run the function
-        output_file, pickle_file = unique_gene_pairs(input_file, tempdir)
+        output_file, pickle_file = unique_gene_pairs(input_file, tempdir, output_format='pickle')
         
         # Verify the output file content
         with open(output_file, 'r') as f:
@@ -34,4 +35,161 @@ def test_unique_gene_pairs():
         assert unique_gene_pairs_data == {
             'gene1': [('gene2', ['value1', 'value2']), ('gene3', ['value3', 'value4'])],
             'gene4': [('gene5', ['value7', 'value8'])]
-        }
\ No newline at end of file
+        }
+
+def test_unique_gene_pairs_canonical():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            f.write("gene1\tgene2\tvalue1\n")
+            f.write("gene2\tgene1\tvalue2\n")
+            f.write("gene3\tgene1\tvalue3\n")
+            f.write("gene1\tgene3\tvalue4\n")
+            f.write("gene1\tgene1\tvalue5\n")
+
+        output_file, _ = unique_gene_pairs(input_file, tempdir, canonical=True)
+
+        with open(output_file, 'r') as f:
+            content = f.readlines()
+
+        assert content == [
+            "Number of unique gene pairs: 3\n",
+            "gene1\tgene2\tvalue1\n",
+            "gene1\tgene1\tvalue5\n",
+            "gene3\tgene1\tvalue3\n",
+        ]
+
+def test_unique_gene_pairs_out_of_core():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            for i in range(200):
+                f.write(f"gene{i % 7}\tgene{i % 11}\tvalue{i}\n")
+
+        in_memory_dir = os.path.join(tempdir, 'in_memory')
+        out_of_core_dir = os.path.join(tempdir, 'out_of_core')
+        os.mkdir(in_memory_dir)
+        os.mkdir(out_of_core_dir)
+
+        expected_file, _ = unique_gene_pairs(input_file, in_memory_dir)
+        output_file, store_file = unique_gene_pairs(input_file, out_of_core_dir, memory_budget=256, processes=2)
+
+        with open(expected_file, 'r') as f:
+            expected = f.read()
+        with open(output_file, 'r') as f:
+            content = f.read()
+
+        assert content.startswith("Number of unique gene pairs: 77\n")
+        assert content == expected
+        assert sorted(os.listdir(out_of_core_dir)) == ['unique_gene_pairs.pairs', 'unique_gene_pairs.txt']
+        with open(os.path.join(in_memory_dir, 'unique_gene_pairs.pairs'), 'rb') as f:
+            expected_store = f.read()
+        with open(store_file, 'rb') as f:
+            assert f.read() == expected_store
+
+def test_unique_gene_pairs_open_file_limit(caplog):
+    resource = pytest.importorskip('resource')
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            for i in range(500):
+                f.write(f"gene{i % 13}\tgene{i % 17}\tvalue{i}\n")
+        in_memory_dir = os.path.join(tempdir, 'in_memory')
+        out_of_core_dir = os.path.join(tempdir, 'out_of_core')
+        os.mkdir(in_memory_dir)
+        os.mkdir(out_of_core_dir)
+        expected_files = unique_gene_pairs(input_file, in_memory_dir)
+
+        # A tiny budget asks for more buckets than can be open under the limit
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (128, hard_limit))
+        try:
+            output_files = unique_gene_pairs(input_file, out_of_core_dir, memory_budget=1)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
+        assert "Using 64 spill buckets" in caplog.text
+        for expected_file, output_file in zip(expected_files, output_files):
+            with open(expected_file, 'rb') as f, open(output_file, 'rb') as g:
+                assert g.read() == f.read()
+
+def test_unique_gene_pairs_clamped_buckets(monkeypatch, caplog):
+    monkeypatch.setattr(unique_gene_pairs_module, '_max_open_buckets', lambda: 2)
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            for i in range(300):
+                f.write(f"gene{i * 7 % 23}\tgene{i * 3 % 19}\tvalue{i}\n")
+        in_memory_dir = os.path.join(tempdir, 'in_memory')
+        out_of_core_dir = os.path.join(tempdir, 'out_of_core')
+        os.mkdir(in_memory_dir)
+        os.mkdir(out_of_core_dir)
+
+        expected_files = unique_gene_pairs(input_file, in_memory_dir)
+        output_files = unique_gene_pairs(input_file, out_of_core_dir, memory_budget=16, processes=2)
+
+        assert "Using 2 spill buckets" in caplog.text
+        for expected_file, output_file in zip(expected_files, output_files):
+            with open(expected_file, 'rb') as f, open(output_file, 'rb') as g:
+                assert g.read() == f.read()
+
+def test_pair_store():
+    with tempfile.TemporaryDirectory() as tempdir:
+        input_file = os.path.join(tempdir, 'input.txt')
+        with open(input_file, 'w') as f:
+            f.write("gene4\tgene5\tvalue1\tvalue2\n")
+            f.write("gene1\tgene3\n")
+            f.write("gene1\tgene2\tvalue3\n")
+            f.write("gene1\tgene3\tvalue4\n")
+
+        _, store_file = unique_gene_pairs(input_file, tempdir)
+
+        with PairStore(store_file) as store:
+            assert len(store) == 3
+            assert store.partners_of('gene1') == ['gene2', 'gene3']
+            assert store.partners_of('gene2') == []
+            assert store.partners_of('missing') == []
+            assert store.has_pair('gene4', 'gene5')
+            assert not store.has_pair('gene5', 'gene4')
+            assert store.values('gene4', 'gene5') == ['value1', 'value2']
+            assert store.values('gene1', 'gene3') == []
+            assert store.values('gene1', 'gene4') is None
+            assert list(store.iterate()) == [
+                ('gene1', 'gene2', ['value3']),
+                ('gene1', 'gene3', []),
+                ('gene4', 'gene5', ['value1', 'value2']),
+            ]
+            pairs = store.iterate()
+            next(pairs)
+
+        # Using the store after close raises instead of reading unmapped memory
+        for use in (lambda: store.partners_of('gene1'), lambda: store.has_pair('gene1', 'gene2'),
+                    lambda: store.values('gene1', 'gene2'), lambda: len(store), lambda: list(store.iterate()),
+                    lambda: next(pairs)):
+            with pytest.raises(ValueError, match="closed"):
+                use()
+
+        with pytest.raises(ValueError):
+            unique_gene_pairs(input_file, tempdir, output_format='csv')
+
+def test_pair_store_blocks(monkeypatch):
+    pairs = [(f"gene{i * 7 % 13}", f"gene{i * 5 % 11}", [str(i)] * (i % 3)) for i in range(60)]
+    pairs = list({pair[:2]: pair for pair in reversed(pairs)}.values())[::-1]
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        whole_file = os.path.join(tempdir, 'whole.pairs')
+        assert write_pair_store(whole_file, iter(pairs)) == len(pairs)
+
+        # The CSR arrays are built a few pairs at a time on disk, with the same result
+        monkeypatch.setattr(unique_gene_pairs_module, 'PAIR_STORE_BLOCK', 3)
+        blocks_file = os.path.join(tempdir, 'blocks.pairs')
+        write_pair_store(blocks_file, iter(pairs))
+        with open(whole_file, 'rb') as whole, open(blocks_file, 'rb') as blocks:
+            assert whole.read() == blocks.read()
+        with PairStore(blocks_file) as store:
+            assert list(store.iterate()) == sorted(pairs, key=lambda pair: (pair[0], pair[1]))
+
+        empty_file = os.path.join(tempdir, 'empty.pairs')
+        assert write_pair_store(empty_file, iter([])) == 0
+        with PairStore(empty_file) as store:
+            assert len(store) == 0 and list(store.iterate()) == []